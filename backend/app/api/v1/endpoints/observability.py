@@ -25,26 +25,42 @@ def get_alerts(
     """
     return db.query(Alert).order_by(Alert.timestamp.desc()).limit(limit).all()
 
-@router.post("/alerts/")
-async def receive_alert(alert: dict):
-    """
-    Receive an external alert (e.g. from WAF) and broadcast it.
-    """
+def _waf_alert_event(alert: dict) -> dict:
     # Format for WebSocket
-    event = {
+    return {
         "type": "waf_bypass",
         "payload": {
             "source_ip": alert.get("source_ip", "unknown"),
             "payload": alert.get("payload", ""),
             "timestamp": alert.get("timestamp", datetime.utcnow().isoformat()),
             "severity": "HIGH",
-            "confidence": alert.get("confidence", 1.0)
+            "confidence": alert.get("confidence", 1.0),
+            # Honeypot the attacker is attached to and how many of its
+            # triggers the WAF coalesced instead of deploying again
+            "honeypot": alert.get("honeypot"),
+            "suppressed_triggers": alert.get("suppressed_triggers", 0)
         },
         "timestamp": datetime.utcnow().isoformat()
     }
-    await manager.broadcast(event)
+
+@router.post("/alerts/")
+async def receive_alert(alert: dict):
+    """
+    Receive an external alert (e.g. from WAF) and broadcast it.
+    """
+    await manager.broadcast(_waf_alert_event(alert))
     return {"status": "broadcasted"}
 
+@router.post("/alerts/batch")
+async def receive_alert_batch(alerts: List[dict]):
+    """
+    Receive several external alerts in one request (the WAF's dispatch queue
+    flushes them this way) and broadcast each of them.
+    """
+    for alert in alerts:
+        await manager.broadcast(_waf_alert_event(alert))
+    return {"status": "broadcasted", "count": len(alerts)}
+
 @router.post("/events/")
 async def receive_event(event_data: dict):
     """
@@ -1,17 +1,25 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from app.api import deps
 from app.core.websockets import manager
+from app.models.user import User
 
 router = APIRouter()
 
 @router.websocket("/events")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    client = await manager.connect(websocket)
     try:
         while True:
-            # Keep the connection alive. 
-            # In a real app, we might process incoming messages too.
-            data = await websocket.receive_text()
-            # Echo for now or handle ping/pong
-            # await websocket.send_text(f"Message text was: {data}")
+            # Subscription requests; anything else (heartbeat pongs) only shows the client is alive
+            await manager.receive(client, await websocket.receive_text())
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
+
+@router.get("/stats")
+def websocket_stats(current_user: User = Depends(deps.get_current_active_user)):
+    """
+    Fan-out state: queue depth and lag per connected client, drops and closes.
+    """
+    return manager.stats()
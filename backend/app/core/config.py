@@ -17,6 +17,32 @@ class Settings(BaseSettings):
     ENVIRONMENT: Literal["local", "cloud"] = "local"
     ORCHESTRATOR_TYPE: Literal["mock", "k8s"] = "mock"
 
+    # Dashboard WebSocket fan-out (see app.core.websockets.ConnectionManager)
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_SLOW_CONSUMER_POLICY: Literal["drop_oldest", "coalesce", "disconnect"] = "drop_oldest"
+    WS_SEND_TIMEOUT_S: float = 5.0
+    WS_HEARTBEAT_INTERVAL_S: float = 20.0
+    WS_IDLE_TIMEOUT_S: float = 60.0
+    # Clients connecting with ?compress=zlib get frames this large as zlib binary messages
+    WS_COMPRESS_MIN_BYTES: int = 512
+    WS_COMPRESSION_LEVEL: int = 6
+    # Longest flush interval a client may ask for with {"action": "batch"}, and events per batch frame
+    WS_BATCH_MAX_INTERVAL_MS: float = 1000.0
+    WS_BATCH_MAX_EVENTS: int = 200
+    # Recent broadcasts kept, by count and age, for clients resuming with ?stream=...&last_seq=n.
+    # Each worker numbers its own stream: a client resuming on another worker gets resync_required
+    WS_REPLAY_BUFFER_SIZE: int = 1024
+    WS_REPLAY_MAX_AGE_S: float = 300.0
+
+    # Broadcasts shared between workers (see app.services.backplane); "inprocess" keeps them in this process
+    BACKPLANE_TYPE: Literal["inprocess", "unix", "redis"] = "inprocess"
+    # "unix": the first worker to take the lock next to this socket runs the broker for the host
+    BACKPLANE_UNIX_PATH: str = "/tmp/haas-backplane.sock"
+    BACKPLANE_REDIS_URL: str = "redis://localhost:6379/0"
+    BACKPLANE_CHANNEL: str = "haas:events"
+    # Events held for the backplane while it is slow or reconnecting; the oldest go first
+    BACKPLANE_OUTBOX_SIZE: int = 4096
+
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=True)
 
 settings = Settings()
@@ -0,0 +1,114 @@
+from typing import Any, Dict, Optional
+
+# Alert severities and log levels on one scale, so "min_severity": "HIGH" also keeps ERROR logs
+SEVERITY_RANK = {
+    "debug": 0,
+    "info": 1, "low": 1,
+    "warning": 2, "warn": 2, "medium": 2,
+    "error": 3, "high": 3,
+    "critical": 4, "fatal": 4,
+}
+
+# Any event type, for subscriptions that filter on fields only
+ALL_TYPES = "*"
+
+FILTER_FIELDS = ("min_severity", "honeypot_id", "country")
+
+
+class SubscriptionError(ValueError):
+    pass
+
+
+def _field(event: dict, *names: str) -> Any:
+    # Event fields live in "payload" (alerts, logs) or at the top level (forwarded events)
+    payload = event.get("payload")
+    for source in (payload if isinstance(payload, dict) else {}, event):
+        for name in names:
+            value = source.get(name)
+            if value is not None:
+                return value
+    return None
+
+
+def _as_set(value) -> frozenset:
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return frozenset(str(v).lower() for v in values)
+
+
+class Filter:
+    """
+    Field predicates one subscription applies to the events of its types;
+    an event missing a filtered field does not match.
+
+    - min_severity: the event's severity (alerts) or level (logs) ranks at
+      least this high on SEVERITY_RANK
+    - honeypot_id: one id or a list; matched against honeypot_id or honeypot
+    - country: one country or a list
+    """
+
+    __slots__ = ("min_severity", "min_rank", "honeypots", "countries")
+
+    def __init__(self, min_severity: Optional[str] = None, honeypot_id=None, country=None):
+        self.min_severity = min_severity
+        self.min_rank = None
+        if min_severity is not None:
+            if str(min_severity).lower() not in SEVERITY_RANK:
+                raise SubscriptionError(f"Unknown severity {min_severity!r}")
+            self.min_rank = SEVERITY_RANK[str(min_severity).lower()]
+        self.honeypots = _as_set(honeypot_id) if honeypot_id is not None else None
+        self.countries = _as_set(country) if country is not None else None
+
+    @classmethod
+    def parse(cls, spec: Optional[dict]) -> Optional["Filter"]:
+        if not spec:
+            return None
+        if not isinstance(spec, dict):
+            raise SubscriptionError("filter must be an object")
+        unknown = set(spec) - set(FILTER_FIELDS)
+        if unknown:
+            raise SubscriptionError(f"Unknown filter fields {sorted(unknown)}, expected {list(FILTER_FIELDS)}")
+        return cls(**spec)
+
+    def matches(self, event: dict) -> bool:
+        if self.min_rank is not None:
+            severity = _field(event, "severity", "level")
+            if SEVERITY_RANK.get(str(severity).lower(), -1) < self.min_rank:
+                return False
+        if self.honeypots is not None:
+            honeypot = _field(event, "honeypot_id", "honeypot")
+            if honeypot is None or str(honeypot).lower() not in self.honeypots:
+                return False
+        if self.countries is not None:
+            country = _field(event, "country")
+            if country is None or str(country).lower() not in self.countries:
+                return False
+        return True
+
+    def describe(self) -> Dict[str, Any]:
+        spec = {}
+        if self.min_severity is not None:
+            spec["min_severity"] = self.min_severity
+        if self.honeypots is not None:
+            spec["honeypot_id"] = sorted(self.honeypots)
+        if self.countries is not None:
+            spec["country"] = sorted(self.countries)
+        return spec
+
+
+def parse_request(message: Any):
+    """
+    ("subscribe" | "unsubscribe", [event types], Filter or None) from a client
+    message, or None when the message is not a subscription request.
+
+        {"action": "subscribe", "types": ["waf_bypass"], "filter": {"min_severity": "HIGH"}}
+        {"action": "unsubscribe", "types": ["system_log"]}
+    """
+    if not isinstance(message, dict) or message.get("action") not in ("subscribe", "unsubscribe"):
+        return None
+    types = message.get("types", [ALL_TYPES])
+    if isinstance(types, str):
+        types = [types]
+    if not isinstance(types, list) or not types or not all(isinstance(t, str) for t in types):
+        raise SubscriptionError("types must be a non-empty list of event types")
+    event_filter = Filter.parse(message.get("filter")) if message["action"] == "subscribe" else None
+    return message["action"], types, event_filter
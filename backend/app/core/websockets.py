@@ -1,23 +1,655 @@
-from typing import List
+import asyncio
+import itertools
+import time
+import uuid
+import zlib
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import orjson
 from fastapi import WebSocket
 
+from app.core.config import settings
+from app.core.subscriptions import ALL_TYPES, Filter, SubscriptionError, parse_request
+from app.services.backplane.base import EventBackplane
+
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# Close codes: 1001 going away (idle), 1011 server error (send failed), 1013 try again later (too slow)
+CLOSE_IDLE = 1001
+CLOSE_SEND_FAILED = 1011
+CLOSE_SLOW = 1013
+
+# Clients opt into compressed frames with /ws/events?compress=zlib
+COMPRESSION_PARAM = "compress"
+COMPRESSION_ZLIB = "zlib"
+
+# Clients resume with /ws/events?stream=<id>&last_seq=<n>; a new client passes an empty stream
+STREAM_PARAM = "stream"
+LAST_SEQ_PARAM = "last_seq"
+# ...and may subscribe up front with &types=a,b, so the replay only holds those types
+TYPES_PARAM = "types"
+
+# State events where only the latest per honeypot matters within one batch
+COLLAPSIBLE_TYPES = frozenset({"honeypot_status", "honeypot_metrics"})
+
+
+def message_type(message: dict):
+    return message.get("type")
+
+
+def batch_key(message: dict):
+    """
+    Key under which later events replace earlier ones in the same batch, or
+    None for events that must all be delivered. Producers may set an
+    explicit "coalesce_key"; state events of COLLAPSIBLE_TYPES collapse per
+    honeypot.
+    """
+    key = message.get("coalesce_key")
+    if key is not None:
+        return key
+    if message.get("type") in COLLAPSIBLE_TYPES:
+        payload = message.get("payload") or {}
+        return message["type"], payload.get("honeypot_id", message.get("honeypot_id"))
+    return None
+
+
+class Frame:
+    """
+    One event as sent on the wire, encoded once and shared by every client's
+    queue. The text form is built on creation; the zlib form only when the
+    first client that asked for compression gets to it.
+    """
+
+    __slots__ = ("message", "text", "events", "_compressed", "_level")
+
+    def __init__(self, message: dict, compression_level: int = 6):
+        self.message = message
+        self.text = orjson.dumps(message, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+        # The frames a batch frame holds; None for a single event
+        self.events: Optional[List["Frame"]] = None
+        self._compressed = None
+        self._level = compression_level
+
+    @classmethod
+    def batch(cls, frames: List["Frame"], compression_level: int = 6) -> "Frame":
+        """
+        {"type": "batch", "events": [...]} built from the frames' text, without
+        re-encoding them; batch frames among them are flattened into it.
+        """
+        events = [event for f in frames for event in (f.events or [f])]
+        frame = cls.__new__(cls)
+        frame.message = {"type": "batch"}
+        frame.text = '{"type":"batch","events":[' + ",".join(f.text for f in events) + "]}"
+        frame.events = events
+        frame._compressed = None
+        frame._level = compression_level
+        return frame
+
+    @property
+    def compressed(self) -> bytes:
+        if self._compressed is None:
+            self._compressed = zlib.compress(self.text.encode(), self._level)
+        return self._compressed
+
+
+class Client:
+    """One dashboard connection: its bounded send queue, writer task and counters."""
+
+    def __init__(self, client_id: int, websocket: WebSocket, compress: bool = False):
+        self.id = client_id
+        self.websocket = websocket
+        self.compress = compress
+        # None: every event; else event type (or ALL_TYPES) -> Filter or None
+        self.subscriptions: Optional[Dict[str, Optional[Filter]]] = None
+        # Seconds events wait to be sent together; 0 sends each on its own
+        self.batch_interval = 0.0
+        # (enqueued_at, frame), oldest first
+        self.queue: deque = deque()
+        self.wakeup = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.close_code: Optional[int] = None
+        self.close_reason = ""
+
+        now = time.monotonic()
+        self.connected_at = now
+        self.last_seen = now
+        self.last_sent = now
+        self.last_heartbeat = now
+        self.last_lag = 0.0
+
+        self.sent = 0
+        self.batches = 0
+        self.collapsed = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def touch(self):
+        """The client sent something (a pong or any message): it is alive."""
+        self.last_seen = time.monotonic()
+
+    def wants(self, message: dict) -> bool:
+        """Whether the client's subscriptions (or lack of them) take this event."""
+        if self.subscriptions is None:
+            return True
+        for event_type in (message.get("type"), ALL_TYPES):
+            if event_type in self.subscriptions:
+                event_filter = self.subscriptions[event_type]
+                if event_filter is None or event_filter.matches(message):
+                    return True
+        return False
+
+    def describe_subscriptions(self):
+        if self.subscriptions is None:
+            return ALL_TYPES
+        return {event_type: f.describe() if f else {} for event_type, f in self.subscriptions.items()}
+
+    def lag(self, now: float) -> float:
+        """Age of the oldest message still waiting to be sent."""
+        return now - self.queue[0][0] if self.queue else 0.0
+
+    def stats(self, now: float) -> dict:
+        client = self.websocket.client
+        return {
+            "id": self.id,
+            "peer": f"{client.host}:{client.port}" if client else None,
+            "connected_s": round(now - self.connected_at, 1),
+            "compressed": self.compress,
+            "subscriptions": self.describe_subscriptions(),
+            "batch_ms": round(self.batch_interval * 1000, 1),
+            "queue_depth": len(self.queue),
+            "lag_ms": round(self.lag(now) * 1000, 1),
+            "last_send_lag_ms": round(self.last_lag * 1000, 1),
+            "idle_s": round(now - self.last_seen, 1),
+            "sent": self.sent,
+            "batches": self.batches,
+            "collapsed": self.collapsed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """
+    Fans events out to every connected dashboard without letting one client
+    slow down the others.
+
+    `broadcast` never waits on a socket: it appends the message to each
+    client's queue and returns. A writer task per client sends its queue in
+    order, each send bounded by `send_timeout_s`; a client whose send fails
+    or times out is closed and removed. Queues hold at most `queue_size`
+    messages; when a client's queue is full the slow-consumer `policy`
+    decides:
+    - "drop_oldest": the oldest queued message is dropped
+    - "coalesce": a queued message with the same `coalesce_key` (the event
+      type by default) is replaced by the new one, so the client gets the
+      latest of each kind; with none to replace, the oldest is dropped
+    - "disconnect": the client is closed (1013) and can reconnect and
+      start from the current state
+
+    Each broadcast is JSON-encoded once (orjson) into a Frame that all
+    queues share. Clients that connect with ?compress=zlib get every frame
+    of at least `compress_min_bytes` as a binary message holding the zlib
+    stream of the JSON text, compressed once per broadcast whatever the
+    number of such clients; shorter frames, and all frames for other
+    clients, are sent as text.
+
+    A client gets every event until it subscribes (see `receive` and
+    app.core.subscriptions); from then on only events of the types it
+    subscribed to that pass the subscription's filter. Subscribers are
+    indexed by event type, so a broadcast only looks at the clients that
+    want every event and at the subscribers of its type (and of "*").
+
+    A client may ask for batching with {"action": "batch", "interval_ms": n}
+    (0 turns it off). Its writer then holds the first queued event for up to
+    n ms, capped at `batch_max_interval_ms`, or until `batch_max_events` are
+    queued, and sends everything queued as one {"type": "batch", "events":
+    [...]} frame, built from the already-encoded events. Within a batch,
+    events with the same `batch_key` collapse into the latest one.
+
+    A client that has sent nothing for `heartbeat_interval_s` gets a
+    {"type": "heartbeat"} message (at most one per interval, ahead of any
+    queued events, however busy the connection); clients are expected to
+    answer with anything (the dashboard sends {"type": "pong"}). A client
+    that has sent nothing for `idle_timeout_s` is closed (1001). 0 disables
+    either.
+
+    Every broadcast gets the next number of this manager's sequence as
+    "seq", and the latest ones stay in a replay log (at most `replay_size`
+    events, none older than `replay_max_age_s`). A client reconnecting with
+    ?stream=<id>&last_seq=<n> first gets {"type": "stream", "stream": id,
+    "latest_seq": n, "replayed": k} and then, as batch frames, the k events
+    it missed; when the stream is not this manager's (another process, or
+    before a restart) or part of the gap has left the log, it gets
+    {"type": "resync_required", ...} instead and should reload over REST.
+    A new client connects with ?stream= to learn the stream id. Adding
+    &types=a,b subscribes the client to those types before the replay, which
+    then only holds events it subscribed to; without it the client gets
+    every missed event. The sequence is this process's: with several
+    workers, a client that reconnects to a different one gets
+    resync_required, so replay needs sticky sessions.
 
-    async def connect(self, websocket: WebSocket):
+    With a backplane attached (`start`), each broadcast is also published
+    to the backend's other processes, and their broadcasts are delivered
+    to this process's clients as they arrive (see app.services.backplane).
+
+    Used from the event loop only, so it takes no locks.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = settings.WS_SEND_QUEUE_SIZE,
+        policy: str = settings.WS_SLOW_CONSUMER_POLICY,
+        send_timeout_s: float = settings.WS_SEND_TIMEOUT_S,
+        heartbeat_interval_s: float = settings.WS_HEARTBEAT_INTERVAL_S,
+        idle_timeout_s: float = settings.WS_IDLE_TIMEOUT_S,
+        coalesce_key: Callable[[dict], object] = message_type,
+        compress_min_bytes: int = settings.WS_COMPRESS_MIN_BYTES,
+        compression_level: int = settings.WS_COMPRESSION_LEVEL,
+        batch_max_interval_ms: float = settings.WS_BATCH_MAX_INTERVAL_MS,
+        batch_max_events: int = settings.WS_BATCH_MAX_EVENTS,
+        batch_key: Callable[[dict], object] = batch_key,
+        replay_size: int = settings.WS_REPLAY_BUFFER_SIZE,
+        replay_max_age_s: float = settings.WS_REPLAY_MAX_AGE_S,
+    ):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy {policy!r}, expected one of {SLOW_CONSUMER_POLICIES}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout_s
+        self.heartbeat_interval = heartbeat_interval_s
+        self.idle_timeout = idle_timeout_s
+        self.coalesce_key = coalesce_key
+        self.compress_min_bytes = compress_min_bytes
+        self.compression_level = compression_level
+        self.batch_max_interval = batch_max_interval_ms / 1000.0
+        self.batch_max_events = batch_max_events
+        self.batch_key = batch_key
+        self.clients: Dict[WebSocket, Client] = {}
+        # Clients without subscriptions, and event type -> {client: filter}
+        self._everything: Dict[Client, None] = {}
+        self._by_type: Dict[str, Dict[Client, Optional[Filter]]] = {}
+        self._ids = itertools.count(1)
+        # Names this manager's sequence: a client's last_seq only means something here
+        self.stream = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.replay_max_age = replay_max_age_s
+        # [seq, broadcast_at, message, Frame or None until a client needs it], oldest first
+        self._log: deque = deque(maxlen=replay_size)
+        self.backplane: Optional[EventBackplane] = None
+
+        self.broadcasts = 0
+        self.batches = 0
+        self.collapsed = 0
+        self.unmatched = 0
+        self.encoded_bytes = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = {"slow": 0, "idle": 0, "send_failed": 0}
+        self.resumes = 0
+        self.replayed = 0
+        self.resyncs = 0
+
+    async def start(self, backplane: EventBackplane):
+        """Share broadcasts with the other processes through `backplane`."""
+        await self.stop()
+        self.backplane = backplane
+        await backplane.start(self.deliver)
+
+    async def stop(self):
+        backplane, self.backplane = self.backplane, None
+        if backplane is not None:
+            await backplane.stop()
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    async def connect(self, websocket: WebSocket) -> Client:
         await websocket.accept()
-        self.active_connections.append(websocket)
+        compress = websocket.query_params.get(COMPRESSION_PARAM) == COMPRESSION_ZLIB
+        client = Client(next(self._ids), websocket, compress=compress)
+        self.clients[websocket] = client
+        self._everything[client] = None
+        types = [t for t in (websocket.query_params.get(TYPES_PARAM) or "").split(",") if t]
+        if types:
+            self.subscribe(client, types)
+        stream = websocket.query_params.get(STREAM_PARAM)
+        if stream is not None:
+            # Before any new broadcast can reach the queue, so the replay comes first
+            self.resume(client, stream, websocket.query_params.get(LAST_SEQ_PARAM))
+        client.writer = asyncio.get_running_loop().create_task(self._write(client))
+        return client
+
+    def resume(self, client: Client, stream: str, last_seq):
+        """Queue the events since `last_seq` of `stream`, or tell the client to resync."""
+        now = time.monotonic()
+        self._expire(now)
+        try:
+            last_seq = int(last_seq)
+        except (TypeError, ValueError):
+            last_seq = None
+        position = {"stream": self.stream, "latest_seq": self.seq}
+        if not stream or last_seq is None:
+            self.send(client, {"type": "stream", **position, "replayed": 0})
+            return
+
+        oldest = self._log[0][0] if self._log else self.seq + 1
+        if stream != self.stream or last_seq > self.seq:
+            reason = "unknown_stream"
+        elif last_seq + 1 < oldest:
+            reason = "evicted"
+        else:
+            reason = None
+        if reason is not None:
+            self.resyncs += 1
+            self.send(client, {"type": "resync_required", **position, "reason": reason})
+            return
+
+        frames = []
+        # The log holds consecutive numbers, so the gap starts at a known index
+        for entry in itertools.islice(self._log, last_seq + 1 - oldest, None):
+            if not client.wants(entry[2]):
+                continue
+            if entry[3] is None:
+                entry[3] = Frame(entry[2], self.compression_level)
+            frames.append(entry[3])
+        self.resumes += 1
+        self.replayed += len(frames)
+        self.send(client, {"type": "stream", **position, "replayed": len(frames)})
+        for i in range(0, len(frames), self.batch_max_events):
+            chunk = frames[i:i + self.batch_max_events]
+            frame = chunk[0] if len(chunk) == 1 else Frame.batch(chunk, self.compression_level)
+            if client.close_code is None:
+                self._enqueue(client, frame, now)
+
+    def _expire(self, now: float):
+        while self._log and now - self._log[0][1] > self.replay_max_age:
+            self._log.popleft()
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        """Forget a client that went away; safe to call more than once."""
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        self._everything.pop(client, None)
+        if client.subscriptions:
+            self._unindex(client, list(client.subscriptions))
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    async def receive(self, client: Client, text: str):
+        """Handle a message from the client: subscription requests get an ack or an error."""
+        client.touch()
+        if self.clients.get(client.websocket) is not client:
+            return
+        try:
+            message = orjson.loads(text)
+            if isinstance(message, dict) and message.get("action") == "batch":
+                self.set_batching(client, message.get("interval_ms", 0))
+                self.send(client, {"type": "batching", "interval_ms": round(client.batch_interval * 1000, 1)})
+                return
+            request = parse_request(message)
+        except orjson.JSONDecodeError:
+            return
+        except SubscriptionError as e:
+            self.send(client, {"type": "subscription_error", "detail": str(e)})
+            return
+        if request is None:
+            return
+        action, types, event_filter = request
+        if action == "subscribe":
+            self.subscribe(client, types, event_filter)
+        else:
+            self.unsubscribe(client, types)
+        self.send(client, {"type": "subscriptions", "subscriptions": client.describe_subscriptions()})
+
+    def set_batching(self, client: Client, interval_ms):
+        try:
+            interval = float(interval_ms) / 1000.0
+        except (TypeError, ValueError):
+            raise SubscriptionError("interval_ms must be a number")
+        client.batch_interval = min(max(interval, 0.0), self.batch_max_interval)
+        # A writer already holding a batch picks up the new interval
+        client.wakeup.set()
+
+    def subscribe(self, client: Client, types: List[str], event_filter: Optional[Filter] = None):
+        """Deliver events of `types` passing `event_filter`; replaces earlier filters for those types."""
+        if client.subscriptions is None:
+            client.subscriptions = {}
+            self._everything.pop(client, None)
+        for event_type in types:
+            client.subscriptions[event_type] = event_filter
+            self._by_type.setdefault(event_type, {})[client] = event_filter
+
+    def unsubscribe(self, client: Client, types: List[str]):
+        """Drop earlier subscriptions to `types`; "*" drops all of them (and every-event delivery)."""
+        if ALL_TYPES in types:
+            if client.subscriptions is None:
+                client.subscriptions = {}
+                self._everything.pop(client, None)
+            types = list(client.subscriptions)
+        if client.subscriptions is not None:
+            self._unindex(client, types)
+
+    def _unindex(self, client: Client, types: List[str]):
+        for event_type in types:
+            client.subscriptions.pop(event_type, None)
+            subscribers = self._by_type.get(event_type)
+            if subscribers is not None:
+                subscribers.pop(client, None)
+                if not subscribers:
+                    del self._by_type[event_type]
+
+    def _targets(self, message: dict) -> List[Client]:
+        matched: Dict[Client, None] = {}
+        for subscribers in (self._by_type.get(message.get("type")), self._by_type.get(ALL_TYPES)):
+            for client, event_filter in (subscribers or {}).items():
+                if client not in matched and (event_filter is None or event_filter.matches(message)):
+                    matched[client] = None
+        # Subscribers are never in _everything
+        return [*self._everything, *matched]
+
+    def send(self, client: Client, message: dict):
+        """Queue a message for one client only."""
+        if client.close_code is None:
+            self._enqueue(client, Frame(message, self.compression_level), time.monotonic())
 
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
+        """Send an event to the dashboards of every process."""
+        self.deliver(message)
+        if self.backplane is not None:
+            self.backplane.publish(message)
+
+    def deliver(self, message: dict):
+        """Send an event to this process's dashboards."""
+        self.broadcasts += 1
+        self.seq += 1
+        message = {**message, "seq": self.seq}
+        now = time.monotonic()
+        entry = [self.seq, now, message, None]
+        if self._log.maxlen:
+            self._expire(now)
+            self._log.append(entry)
+
+        targets = self._targets(message)
+        if not targets:
+            self.unmatched += 1
+            return
+        frame = entry[3] = Frame(message, self.compression_level)
+        self.encoded_bytes += len(frame.text)
+        for client in targets:
+            if client.close_code is None:
+                self._enqueue(client, frame, now)
+
+    def _enqueue(self, client: Client, frame: Frame, now: float):
+        if len(client.queue) >= self.queue_size:
+            if self.policy == "disconnect":
+                self._close(client, CLOSE_SLOW, "slow")
+                return
+            if self.policy == "coalesce" and self._coalesce(client, frame):
+                return
+            client.queue.popleft()
+            client.dropped += 1
+            self.dropped += 1
+        client.queue.append((now, frame))
+        client.wakeup.set()
+
+    def _coalesce(self, client: Client, frame: Frame) -> bool:
+        key = self.coalesce_key(frame.message)
+        for i, (enqueued_at, queued) in enumerate(client.queue):
+            if self.coalesce_key(queued.message) == key:
+                # Keep the slot's age so lag still reports how long the client has been behind
+                client.queue[i] = (enqueued_at, frame)
+                client.coalesced += 1
+                self.coalesced += 1
+                return True
+        return False
+
+    def _close(self, client: Client, code: int, reason: str):
+        # The writer does the actual close, so broadcast never waits on a socket
+        if client.close_code is None:
+            client.close_code = code
+            client.close_reason = reason
+            client.queue.clear()
+            self.closed[reason] += 1
+            client.wakeup.set()
+
+    async def _write(self, client: Client):
+        websocket = client.websocket
+        try:
+            while client.close_code is None:
+                timeout = self._wait_timeout(client)
+                if not client.queue and (timeout is None or timeout > 0):
+                    client.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(client.wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    if client.close_code is not None:
+                        break
+
+                now = time.monotonic()
+                if self.idle_timeout and now - client.last_seen >= self.idle_timeout:
+                    self._close(client, CLOSE_IDLE, "idle")
+                    break
+                if self.heartbeat_interval and self._heartbeat_due(client, now) == 0:
+                    client.last_heartbeat = now
+                    enqueued_at, frame = now, Frame({"type": "heartbeat", "timestamp": datetime.utcnow().isoformat()})
+                elif client.queue and client.batch_interval:
+                    await self._hold_batch(client)
+                    if client.close_code is not None:
+                        break
+                    enqueued_at, frame = self._take_batch(client)
+                elif client.queue:
+                    enqueued_at, frame = client.queue.popleft()
+                else:
+                    continue
+
+                if client.compress and len(frame.text) >= self.compress_min_bytes:
+                    send = websocket.send_bytes(frame.compressed)
+                else:
+                    send = websocket.send_text(frame.text)
+                try:
+                    await asyncio.wait_for(send, self.send_timeout or None)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self._close(client, CLOSE_SEND_FAILED, "send_failed")
+                    break
+                client.sent += 1
+                client.last_sent = time.monotonic()
+                client.last_lag = client.last_sent - enqueued_at
+        finally:
+            self.disconnect(websocket)
+
+        try:
+            await asyncio.wait_for(websocket.close(code=client.close_code), self.send_timeout or None)
+        except Exception:
+            pass
+
+    def _wait_timeout(self, client: Client) -> Optional[float]:
+        """Seconds the writer may sleep before a heartbeat or idle check is due; None when neither is enabled."""
+        now = time.monotonic()
+        deadlines = []
+        if self.heartbeat_interval:
+            deadlines.append(self._heartbeat_due(client, now))
+        if self.idle_timeout:
+            deadlines.append(max(0.0, client.last_seen + self.idle_timeout - now))
+        return min(deadlines) if deadlines else None
+
+    def _heartbeat_due(self, client: Client, now: Optional[float] = None) -> float:
+        """Seconds until the client's next heartbeat: it has been silent, and none was sent, for an interval."""
+        if not self.heartbeat_interval:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, max(client.last_seen, client.last_heartbeat) + self.heartbeat_interval - now)
+
+    async def _hold_batch(self, client: Client):
+        # Until the oldest queued event has waited the interval, or the batch is full
+        while client.close_code is None and len(client.queue) < self.batch_max_events:
+            remaining = client.queue[0][0] + client.batch_interval - time.monotonic()
+            if remaining <= 0:
+                return
+            client.wakeup.clear()
             try:
-                await connection.send_json(message)
-            except Exception:
-                # Handle disconnected clients gracefully if disconnect wasn't called
-                pass
+                await asyncio.wait_for(client.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    def _take_batch(self, client: Client):
+        enqueued_at = client.queue[0][0]
+        frames: List[Optional[Frame]] = []
+        positions = {}
+        while client.queue and len(frames) < self.batch_max_events:
+            _, frame = client.queue.popleft()
+            key = self.batch_key(frame.message)
+            if key is not None and key in positions:
+                frames[positions[key]] = None
+                client.collapsed += 1
+                self.collapsed += 1
+            if key is not None:
+                positions[key] = len(frames)
+            frames.append(frame)
+        frames = [frame for frame in frames if frame is not None]
+        if len(frames) == 1:
+            return enqueued_at, frames[0]
+        client.batches += 1
+        self.batches += 1
+        return enqueued_at, Frame.batch(frames, self.compression_level)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        clients = [client.stats(now) for client in self.clients.values()]
+        return {
+            "clients": len(clients),
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "queued": sum(c["queue_depth"] for c in clients),
+            "max_queue_depth": max((c["queue_depth"] for c in clients), default=0),
+            "max_lag_ms": max((c["lag_ms"] for c in clients), default=0.0),
+            "broadcasts": self.broadcasts,
+            "unmatched": self.unmatched,
+            "subscribers": {event_type: len(subscribers) for event_type, subscribers in self._by_type.items()},
+            "encoded_bytes": self.encoded_bytes,
+            "batches": self.batches,
+            "collapsed": self.collapsed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "closed": dict(self.closed),
+            "stream": self.stream,
+            "seq": self.seq,
+            "replay": {
+                "buffered": len(self._log),
+                "oldest_seq": self._log[0][0] if self._log else None,
+                "resumes": self.resumes,
+                "replayed": self.replayed,
+                "resyncs": self.resyncs,
+            },
+            "backplane": self.backplane.stats() if self.backplane is not None else None,
+            "per_client": clients,
+        }
+
 
 manager = ConnectionManager()
@@ -29,6 +29,8 @@ app.add_middleware(
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 from app.core.simulation import start_simulation
+from app.core.websockets import manager
+from app.services.backplane.factory import get_backplane
 import asyncio
 
 @app.on_event("startup")
@@ -50,6 +52,14 @@ async def create_initial_data():
         print(f"ENVIRONMENT is {settings.ENVIRONMENT}, starting simulation...")
         asyncio.create_task(start_simulation())
 
+@app.on_event("startup")
+async def start_backplane():
+    await manager.start(get_backplane())
+
+@app.on_event("shutdown")
+async def stop_backplane():
+    await manager.stop()
+
 @app.get("/")
 def root():
     return {"message": "HaaS Dashboard Backend API"}
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+import orjson
+
+from app.core.config import settings
+
+# Publishers remembered for ordering checks; the least recently heard from are forgotten first
+MAX_TRACKED_PUBLISHERS = 256
+
+RECONNECT_MIN_S = 0.1
+RECONNECT_MAX_S = 5.0
+
+
+class BackplaneError(Exception):
+    pass
+
+
+class EventBackplane(ABC):
+    """
+    Carries broadcasts between the backend's processes, so an event raised in
+    one worker reaches the dashboards connected to every worker.
+
+    `publish` wraps the event in an envelope {"origin": ..., "seq": n,
+    "event": {...}}: `origin` names this process, `seq` counts its
+    publications from 1. Every transport keeps one publisher's envelopes in
+    order (a single connection per publisher, relayed in arrival order), and
+    receivers check it: an envelope whose seq skips ahead counts the missing
+    ones as gaps (lost while a connection was down, or dropped from a full
+    outbox), one at or below the last seen is stale and dropped. Delivery is
+    at most once; the publisher's own envelopes are never handed back.
+
+    `handler` is called with each event from the other processes, in order,
+    on the event loop.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handler: Optional[Callable[[dict], None]] = None
+        self._seq = 0
+        # origin -> [last seq, envelopes received], most recently heard from last
+        self._publishers: "OrderedDict[str, list]" = OrderedDict()
+
+        self.published = 0
+        self.received = 0
+        self.delivered = 0
+        self.gaps = 0
+        self.stale = 0
+        self.decode_errors = 0
+
+    async def start(self, handler: Callable[[dict], None]):
+        self.handler = handler
+
+    async def stop(self):
+        self.handler = None
+
+    def publish(self, event: dict):
+        """Hand an event to the other processes; never waits on the transport."""
+        self._seq += 1
+        self.published += 1
+        self._send(orjson.dumps(
+            {"origin": self.origin, "seq": self._seq, "event": event},
+            default=str, option=orjson.OPT_NON_STR_KEYS,
+        ))
+
+    @abstractmethod
+    def _send(self, data: bytes):
+        """Queue one encoded envelope for the other processes."""
+        pass
+
+    def _receive(self, data: bytes):
+        try:
+            envelope = orjson.loads(data)
+            origin, seq, event = envelope["origin"], int(envelope["seq"]), envelope["event"]
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+            self.decode_errors += 1
+            return
+        if origin == self.origin:
+            return
+        self.received += 1
+
+        publisher = self._publishers.pop(origin, None) or [0, 0]
+        self._publishers[origin] = publisher
+        if len(self._publishers) > MAX_TRACKED_PUBLISHERS:
+            self._publishers.popitem(last=False)
+        publisher[1] += 1
+        if seq <= publisher[0]:
+            self.stale += 1
+            return
+        # The first envelope heard from a publisher starts its sequence, wherever it is
+        if publisher[0]:
+            self.gaps += seq - publisher[0] - 1
+        publisher[0] = seq
+
+        if self.handler is not None:
+            self.handler(event)
+            self.delivered += 1
+
+    def stats(self) -> dict:
+        return {
+            "type": self.name,
+            "origin": self.origin,
+            "published": self.published,
+            "received": self.received,
+            "delivered": self.delivered,
+            "gaps": self.gaps,
+            "stale": self.stale,
+            "decode_errors": self.decode_errors,
+            "publishers": {
+                origin: {"last_seq": last_seq, "received": received}
+                for origin, (last_seq, received) in self._publishers.items()
+            },
+        }
+
+
+class StreamBackplane(EventBackplane):
+    """
+    A backplane over asyncio streams. Published envelopes wait in a bounded
+    outbox (`outbox_size`, the oldest dropped when full) that one pump task
+    writes out in order, so `publish` never blocks on the network and a
+    reconnect resumes with whatever is still queued. `_session` runs one
+    connected session and returns or raises when it ends; it is retried with
+    backoff until `stop`.
+    """
+
+    def __init__(
+        self,
+        outbox_size: int = settings.BACKPLANE_OUTBOX_SIZE,
+        reconnect_min_s: float = RECONNECT_MIN_S,
+        reconnect_max_s: float = RECONNECT_MAX_S,
+    ):
+        super().__init__()
+        self.outbox_size = outbox_size
+        self.reconnect_min = reconnect_min_s
+        self.reconnect_max = reconnect_max_s
+        self._outbox: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.connected = False
+
+        self.sent = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.last_error: Optional[str] = None
+
+    async def start(self, handler: Callable[[dict], None]):
+        await super().start(handler)
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.connected = False
+        await super().stop()
+
+    def _send(self, data: bytes):
+        if len(self._outbox) >= self.outbox_size:
+            self._outbox.popleft()
+            self.dropped += 1
+        self._outbox.append(data)
+        self._wakeup.set()
+
+    @abstractmethod
+    async def _session(self):
+        """Connect, then pump the outbox and read until the connection fails."""
+        pass
+
+    async def _run(self):
+        delay = self.reconnect_min
+        while True:
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except (OSError, EOFError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, BackplaneError) as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            if self.connected:
+                delay = self.reconnect_min
+            self.connected = False
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max)
+
+    async def _pump(self, writer: asyncio.StreamWriter, frame: Callable[[bytes], bytes]):
+        while True:
+            while self._outbox:
+                # Taken off the outbox once written: a connection lost before it flushes loses it (a gap)
+                writer.write(frame(self._outbox.popleft()))
+                self.sent += 1
+            await writer.drain()
+            if not self._outbox:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+    @staticmethod
+    async def _until_first_ends(*coros):
+        """Run the coroutines together; when one ends, cancel the rest and re-raise its error."""
+        tasks = [asyncio.ensure_future(coro) for coro in coros]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "connected": self.connected,
+            "outbox": len(self._outbox),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,14 @@
+from functools import lru_cache
+from app.core.config import settings
+from app.services.backplane.base import EventBackplane
+from app.services.backplane.inprocess import InProcessBackplane
+from app.services.backplane.redis import RedisBackplane
+from app.services.backplane.unix import UnixBackplane
+
+@lru_cache()
+def get_backplane() -> EventBackplane:
+    if settings.BACKPLANE_TYPE == "unix":
+        return UnixBackplane(settings.BACKPLANE_UNIX_PATH)
+    if settings.BACKPLANE_TYPE == "redis":
+        return RedisBackplane(settings.BACKPLANE_REDIS_URL, settings.BACKPLANE_CHANNEL)
+    return InProcessBackplane()
@@ -0,0 +1,121 @@
+import asyncio
+from typing import Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from app.core.config import settings
+from app.services.backplane.base import BackplaneError, StreamBackplane
+
+
+class RedisError(BackplaneError):
+    pass
+
+
+def command(*args) -> bytes:
+    """A RESP array of bulk strings, the form every Redis command takes."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """One RESP2 reply: str, int, bytes, None or a list of those; error replies raise RedisError."""
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise RedisError(rest.decode(errors="replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        return None if size < 0 else (await reader.readexactly(size + 2))[:-2]
+    if kind == b"*":
+        size = int(rest)
+        return None if size < 0 else [await read_reply(reader) for _ in range(size)]
+    raise BackplaneError(f"Unexpected RESP reply {line[:32]!r}")
+
+
+class RedisBackplane(StreamBackplane):
+    """
+    Workers on any number of hosts, over Redis pub/sub on `channel`.
+
+    Speaks RESP2 directly over asyncio streams on two connections: one in
+    subscribe mode that receives the channel, one that PUBLISHes the outbox
+    in order (Redis delivers one connection's publications in order). Any
+    server speaking the protocol will do; only AUTH, SUBSCRIBE and PUBLISH
+    are used. redis://[[user]:password@]host[:port][/db]; pub/sub ignores
+    the db.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, channel: str = settings.BACKPLANE_CHANNEL, **kwargs):
+        super().__init__(**kwargs)
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported backplane URL {url!r}, expected redis://host:port")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.channel = channel
+        # Connections the last PUBLISH reached, as Redis reports it (this worker's own included)
+        self.subscribers: Optional[int] = None
+
+    async def _open(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password is not None:
+            try:
+                writer.write(command("AUTH", *([self.username] if self.username else []), self.password))
+                await writer.drain()
+                await read_reply(reader)
+            except BaseException:
+                writer.close()
+                raise
+        return reader, writer
+
+    async def _session(self):
+        sub_reader, sub_writer = await self._open()
+        pub_writer = None
+        try:
+            pub_reader, pub_writer = await self._open()
+            sub_writer.write(command("SUBSCRIBE", self.channel))
+            await sub_writer.drain()
+            reply = await read_reply(sub_reader)
+            if not (isinstance(reply, list) and reply and reply[0] == b"subscribe"):
+                raise BackplaneError(f"Unexpected SUBSCRIBE reply {reply!r}")
+            self.connected = True
+            await self._until_first_ends(
+                self._pump(pub_writer, self._publish_command),
+                self._read_acks(pub_reader),
+                self._read(sub_reader),
+            )
+        finally:
+            sub_writer.close()
+            if pub_writer is not None:
+                pub_writer.close()
+
+    def _publish_command(self, data: bytes) -> bytes:
+        return command("PUBLISH", self.channel, data)
+
+    async def _read_acks(self, reader: asyncio.StreamReader):
+        while True:
+            self.subscribers = await read_reply(reader)
+
+    async def _read(self, reader: asyncio.StreamReader):
+        while True:
+            reply = await read_reply(reader)
+            if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                self._receive(reply[2])
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "server": f"{self.host}:{self.port}",
+            "channel": self.channel,
+            "subscribers": self.subscribers,
+        }
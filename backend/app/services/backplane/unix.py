@@ -0,0 +1,137 @@
+import asyncio
+import fcntl
+import os
+import struct
+from typing import Dict, Optional
+
+from app.services.backplane.base import BackplaneError, StreamBackplane
+
+# Frames are a 4-byte big-endian length, then the envelope
+HEADER = struct.Struct("!I")
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+# A worker that lets this much pile up unread is cut off; it reconnects and sees the loss as gaps
+BROKER_MAX_BUFFER_BYTES = 8 * 1024 * 1024
+
+
+def frame(data: bytes) -> bytes:
+    return HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(HEADER.size)
+    (size,) = HEADER.unpack(header)
+    if size > MAX_FRAME_BYTES:
+        raise BackplaneError(f"Frame of {size} bytes exceeds {MAX_FRAME_BYTES}")
+    return header + await reader.readexactly(size)
+
+
+class UnixBackplane(StreamBackplane):
+    """
+    Workers on one host, over a Unix socket at `path`.
+
+    The worker holding an flock on `<path>.lock` also runs the broker: it
+    listens on `path` and relays each frame one worker sends to every other
+    connected worker, in arrival order, without decoding it. Every worker
+    (the broker's own included) is a client of it. When the broker's process
+    exits the kernel releases the lock, and the first worker to reconnect
+    takes over.
+
+    The broker never waits on a worker: one whose unsent frames pass
+    `max_buffer_bytes` is disconnected.
+    """
+
+    name = "unix"
+
+    def __init__(self, path: str, max_buffer_bytes: int = BROKER_MAX_BUFFER_BYTES, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.max_buffer = max_buffer_bytes
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Dict[asyncio.StreamWriter, None] = {}
+
+        self.relayed = 0
+        self.evicted = 0
+
+    async def _session(self):
+        if self._server is None:
+            await self._elect()
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        self.connected = True
+        try:
+            await self._until_first_ends(self._pump(writer, frame), self._read(reader))
+        finally:
+            writer.close()
+
+    async def _read(self, reader: asyncio.StreamReader):
+        while True:
+            self._receive((await read_frame(reader))[HEADER.size:])
+
+    async def _elect(self):
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return
+        try:
+            # Left behind by a broker that died
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self._server = await asyncio.start_unix_server(self._relay, path=self.path)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._lock_fd = fd
+
+    async def _relay(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers[writer] = None
+        try:
+            while True:
+                data = await read_frame(reader)
+                self.relayed += 1
+                for peer in list(self._peers):
+                    if peer is writer:
+                        continue
+                    if peer.transport.get_write_buffer_size() > self.max_buffer:
+                        self._peers.pop(peer, None)
+                        self.evicted += 1
+                        peer.close()
+                        continue
+                    peer.write(data)
+        except (asyncio.IncompleteReadError, ConnectionError, BackplaneError):
+            pass
+        finally:
+            self._peers.pop(writer, None)
+            writer.close()
+
+    async def stop(self):
+        await super().stop()
+        server, self._server = self._server, None
+        if server is not None:
+            server.close()
+            for peer in list(self._peers):
+                peer.close()
+            self._peers.clear()
+            await server.wait_closed()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        # Only now may another worker take over, so it never binds a socket this one then removes
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "path": self.path,
+            "broker": self._server is not None,
+            "peers": len(self._peers),
+            "relayed": self.relayed,
+            "evicted": self.evicted,
+        }
@@ -52,3 +52,12 @@ def test_deploy_honeypot(client: TestClient):
     r = client.delete(f"{settings.API_V1_STR}/honeypots/{honeypot_id}", headers=headers)
     assert r.status_code == 200
     assert r.json()["message"] == "Honeypot terminated successfully"
+
+def test_receive_alert_batch(client: TestClient):
+    alerts = [
+        {"source_ip": "10.0.0.1", "payload": "<script>", "confidence": 0.9},
+        {"source_ip": "10.0.0.2", "payload": "' OR 1=1 --", "confidence": 0.8},
+    ]
+    r = client.post(f"{settings.API_V1_STR}/observability/alerts/batch", json=alerts)
+    assert r.status_code == 200
+    assert r.json() == {"status": "broadcasted", "count": 2}
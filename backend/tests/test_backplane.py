@@ -0,0 +1,184 @@
+import asyncio
+import time
+
+import orjson
+
+from app.core.websockets import ConnectionManager
+from app.services.backplane.base import EventBackplane
+from app.services.backplane.redis import RedisBackplane, command, read_reply
+from app.services.backplane.unix import UnixBackplane
+from tests.test_websockets import FakeWebSocket, run
+
+
+async def until(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+class Collector(list):
+    def __call__(self, event):
+        self.append(event)
+
+
+class RedisStandIn:
+    """Just enough of a Redis server for pub/sub: SUBSCRIBE, PUBLISH and PING."""
+
+    def __init__(self):
+        self.channels = {}
+        self.server = None
+        self.connections = set()
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return f"redis://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/0"
+
+    async def stop(self):
+        self.server.close()
+        for writer in list(self.connections):
+            writer.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                name, *args = await read_reply(reader)
+                name = name.upper()
+                if name == b"SUBSCRIBE":
+                    for channel in args:
+                        self.channels.setdefault(channel, set()).add(writer)
+                        writer.write(b"*3\r\n$9\r\nsubscribe\r\n$%d\r\n%s\r\n:1\r\n" % (len(channel), channel))
+                elif name == b"PUBLISH":
+                    channel, data = args
+                    subscribers = self.channels.get(channel, set())
+                    for subscriber in subscribers:
+                        subscriber.write(command("message", channel, data))
+                    writer.write(b":%d\r\n" % len(subscribers))
+                else:
+                    writer.write(b"+PONG\r\n")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            for subscribers in self.channels.values():
+                subscribers.discard(writer)
+            writer.close()
+
+
+def test_receivers_check_each_publishers_order():
+    class Loopback(EventBackplane):
+        def _send(self, data):
+            pass
+
+    received = Collector()
+    backplane = Loopback()
+    run(backplane.start(received))
+
+    def envelope(origin, seq):
+        return orjson.dumps({"origin": origin, "seq": seq, "event": {"origin": origin, "n": seq}})
+
+    for origin, seq in [("a", 7), ("a", 8), ("b", 1), ("a", 11), ("a", 9), ("b", 2), ("a", 11)]:
+        backplane._receive(envelope(origin, seq))
+    backplane._receive(envelope(backplane.origin, 1))
+    backplane._receive(b"not json")
+
+    assert [(e["origin"], e["n"]) for e in received] == [("a", 7), ("a", 8), ("b", 1), ("a", 11), ("b", 2)]
+    stats = backplane.stats()
+    # Joining mid-stream is not a gap; 9 and 10 are, and the late 9 and repeated 11 are stale
+    assert (stats["gaps"], stats["stale"], stats["decode_errors"]) == (2, 2, 1)
+    assert stats["publishers"] == {"a": {"last_seq": 11, "received": 5}, "b": {"last_seq": 2, "received": 2}}
+
+
+def test_unix_broker_relays_between_workers_in_order(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "backplane.sock")
+        workers = [UnixBackplane(path, reconnect_min_s=0.01) for _ in range(3)]
+        inboxes = [Collector() for _ in workers]
+        for worker, inbox in zip(workers, inboxes):
+            await worker.start(inbox)
+        await until(lambda: all(w.connected for w in workers) and len(workers[0]._peers) == 3)
+        assert [w.stats()["broker"] for w in workers] == [True, False, False]
+
+        for n in range(100):
+            for i, worker in enumerate(workers):
+                worker.publish({"type": "alert", "worker": i, "n": n})
+        await until(lambda: all(len(inbox) == 200 for inbox in inboxes))
+
+        for i, inbox in enumerate(inboxes):
+            assert all(e["worker"] != i for e in inbox)
+            for other in set(range(3)) - {i}:
+                assert [e["n"] for e in inbox if e["worker"] == other] == list(range(100))
+        assert all(w.stats()["gaps"] == 0 for w in workers)
+
+        # The broker's worker goes away: another takes over and the rest keep talking
+        await workers[0].stop()
+        await until(lambda: workers[1].stats()["broker"] or workers[2].stats()["broker"])
+        await until(lambda: workers[1].connected and workers[2].connected)
+        workers[1].publish({"type": "alert", "worker": 1, "n": 100})
+        await until(lambda: inboxes[2][-1:] == [{"type": "alert", "worker": 1, "n": 100}])
+
+        for worker in workers[1:]:
+            await worker.stop()
+
+    run(scenario())
+
+
+def test_redis_backplane_against_a_stand_in_server():
+    async def scenario():
+        server = RedisStandIn()
+        url = await server.start()
+        first, second = RedisBackplane(url, "events", reconnect_min_s=0.01), RedisBackplane(url, "events")
+        inbox = Collector()
+        await first.start(Collector())
+        await second.start(inbox)
+        await until(lambda: first.connected and second.connected)
+
+        for n in range(50):
+            first.publish({"type": "system_log", "n": n})
+        await until(lambda: len(inbox) == 50)
+        assert [e["n"] for e in inbox] == list(range(50))
+        assert first.subscribers == 2 and first.stats()["outbox"] == 0
+
+        # Published while the server is gone: held in the outbox and sent after the reconnect
+        await server.stop()
+        await until(lambda: not first.connected)
+        first.publish({"type": "system_log", "n": 50})
+        assert first.stats()["outbox"] == 1
+        server.server = await asyncio.start_server(server._serve, "127.0.0.1", first.port)
+        await until(lambda: first.connected and first.stats()["outbox"] == 0)
+        assert first.reconnects >= 1
+
+        await first.stop()
+        await second.stop()
+        await server.stop()
+
+    run(scenario())
+
+
+def test_broadcast_reaches_dashboards_on_every_worker(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "backplane.sock")
+        managers = [ConnectionManager(heartbeat_interval_s=0) for _ in range(2)]
+        sockets = [FakeWebSocket() for _ in managers]
+        for manager, ws in zip(managers, sockets):
+            await manager.connect(ws)
+            await manager.start(UnixBackplane(path, reconnect_min_s=0.01))
+        await until(lambda: all(m.backplane.connected for m in managers))
+        await until(lambda: len(managers[0].backplane._peers) == 2)
+
+        await managers[0].broadcast({"type": "waf_bypass", "n": 1})
+        await managers[1].broadcast({"type": "waf_bypass", "n": 2})
+        await until(lambda: all(len(ws.sent) == 2 for ws in sockets))
+
+        assert sockets[0].sent == [{"type": "waf_bypass", "n": 1}, {"type": "waf_bypass", "n": 2}]
+        assert sockets[1].sent == [{"type": "waf_bypass", "n": 2}, {"type": "waf_bypass", "n": 1}]
+        stats = managers[1].stats()["backplane"]
+        assert (stats["published"], stats["delivered"], stats["gaps"]) == (1, 1, 0)
+
+        for manager in managers:
+            await manager.stop()
+            manager.disconnect(sockets[managers.index(manager)])
+
+    run(scenario())
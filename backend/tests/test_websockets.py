@@ -0,0 +1,405 @@
+import asyncio
+import json
+import time
+import zlib
+
+import orjson
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.websockets import CLOSE_IDLE, CLOSE_SLOW, ConnectionManager
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeWebSocket:
+    def __init__(self, stalled: bool = False, fail: bool = False, compress: bool = False, query_params=None):
+        self.sent = []
+        # Broadcast sequence numbers, taken out of `sent` so events compare equal to what was broadcast
+        self.seqs = []
+        self.frames = []
+        self.closed_with = None
+        self.client = None
+        self.query_params = {"compress": "zlib"} if compress else {}
+        self.query_params.update(query_params or {})
+        self.fail = fail
+        self.stalled = asyncio.Event() if stalled else None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await self._send(text)
+
+    async def send_bytes(self, data):
+        await self._send(data)
+
+    async def _send(self, frame):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        if self.stalled is not None:
+            await self.stalled.wait()
+        self.frames.append(frame)
+        message = json.loads(zlib.decompress(frame) if isinstance(frame, bytes) else frame)
+        for event in message.get("events", [message]):
+            if "seq" in event:
+                self.seqs.append(event.pop("seq"))
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def settle():
+    # Each send goes through a few loop iterations (wait_for wraps it in a task)
+    for _ in range(50):
+        await asyncio.sleep(0)
+
+
+def test_stalled_client_does_not_hold_up_the_others():
+    async def scenario():
+        manager = ConnectionManager(queue_size=4, policy="drop_oldest", heartbeat_interval_s=0)
+        fast, slow = FakeWebSocket(), FakeWebSocket(stalled=True)
+        await manager.connect(fast)
+        await manager.connect(slow)
+
+        # Events arrive from separate requests, with the loop free in between
+        for i in range(10):
+            await manager.broadcast({"type": "alert", "n": i})
+            await settle()
+
+        assert [m["n"] for m in fast.sent] == list(range(10))
+        stats = manager.stats()
+        slow_stats = next(c for c in stats["per_client"] if c["id"] == 2)
+        # One message is stuck in send, the queue keeps the newest four
+        assert slow_stats["queue_depth"] == 4 and slow_stats["dropped"] == 5
+        assert stats["max_queue_depth"] == 4
+
+        slow.stalled.set()
+        await settle()
+        assert [m["n"] for m in slow.sent] == [0, 6, 7, 8, 9]
+
+    run(scenario())
+
+
+def test_coalesce_policy_keeps_the_latest_of_each_type():
+    async def scenario():
+        manager = ConnectionManager(queue_size=2, policy="coalesce", heartbeat_interval_s=0)
+        slow = FakeWebSocket(stalled=True)
+        await manager.connect(slow)
+
+        await manager.broadcast({"type": "metrics", "n": 0})
+        await settle()
+        for n, kind in enumerate(["metrics", "alert", "metrics", "metrics", "alert"], start=1):
+            await manager.broadcast({"type": kind, "n": n})
+
+        slow.stalled.set()
+        await settle()
+        assert [(m["type"], m["n"]) for m in slow.sent] == [("metrics", 0), ("metrics", 4), ("alert", 5)]
+        assert manager.stats()["coalesced"] == 3
+
+    run(scenario())
+
+
+def test_disconnect_policy_closes_the_slow_client():
+    async def scenario():
+        manager = ConnectionManager(queue_size=1, policy="disconnect", heartbeat_interval_s=0)
+        slow, fast = FakeWebSocket(stalled=True), FakeWebSocket()
+        await manager.connect(slow)
+        await manager.connect(fast)
+
+        for i in range(3):
+            await manager.broadcast({"type": "alert", "n": i})
+            await settle()
+        slow.stalled.set()
+        await settle()
+
+        assert slow.closed_with == CLOSE_SLOW
+        assert manager.active_connections == [fast]
+        assert manager.stats()["closed"]["slow"] == 1
+        assert len(fast.sent) == 3
+
+    run(scenario())
+
+
+def test_failed_send_removes_the_client():
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval_s=0)
+        dead = FakeWebSocket(fail=True)
+        await manager.connect(dead)
+        await manager.broadcast({"type": "alert"})
+        await settle()
+        assert manager.active_connections == []
+        assert manager.stats()["closed"]["send_failed"] == 1
+
+    run(scenario())
+
+
+def test_heartbeats_and_idle_eviction():
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval_s=0.01, idle_timeout_s=0.05)
+        answering, silent = FakeWebSocket(), FakeWebSocket()
+        client = await manager.connect(answering)
+        await manager.connect(silent)
+
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+            client.touch()
+
+        assert any(m["type"] == "heartbeat" for m in silent.sent)
+        assert silent.closed_with == CLOSE_IDLE
+        assert manager.active_connections == [answering]
+        assert manager.stats()["closed"]["idle"] == 1
+        manager.disconnect(answering)
+
+    run(scenario())
+
+
+def test_quiet_streams_still_get_heartbeats_and_idle_eviction():
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval_s=0.02, idle_timeout_s=0.1)
+        silent = FakeWebSocket()
+        client = await manager.connect(silent)
+        # Already overdue when the writer first looks: it sends at once rather than waiting for a broadcast
+        client.last_seen = client.last_heartbeat = time.monotonic() - 0.05
+        await asyncio.sleep(0.005)
+        assert [m["type"] for m in silent.sent] == ["heartbeat"]
+
+        await asyncio.sleep(0.15)
+        assert sum(m["type"] == "heartbeat" for m in silent.sent) >= 2
+        assert silent.closed_with == CLOSE_IDLE and manager.active_connections == []
+
+        # Without heartbeats the idle timeout still closes a silent client
+        no_heartbeats = ConnectionManager(heartbeat_interval_s=0, idle_timeout_s=0.03)
+        quiet = FakeWebSocket()
+        await no_heartbeats.connect(quiet)
+        await asyncio.sleep(0.08)
+        assert quiet.sent == [] and quiet.closed_with == CLOSE_IDLE
+
+    run(scenario())
+
+
+def test_busy_clients_still_get_heartbeats_and_stay_connected():
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval_s=0.05, idle_timeout_s=0.15)
+        ws = FakeWebSocket()
+        client = await manager.connect(ws)
+
+        answered = 0
+        for i in range(40):
+            await manager.broadcast({"type": "alert", "n": i})
+            await asyncio.sleep(0.01)
+            heartbeats = sum(m["type"] == "heartbeat" for m in ws.sent)
+            if heartbeats > answered:
+                # The dashboard answers each heartbeat with a pong
+                answered = heartbeats
+                client.touch()
+
+        assert answered >= 3
+        assert ws.closed_with is None and manager.active_connections == [ws]
+        assert [m["n"] for m in ws.sent if m["type"] == "alert"] == list(range(40))
+        manager.disconnect(ws)
+
+    run(scenario())
+
+
+def test_broadcast_is_encoded_and_compressed_once(monkeypatch):
+    encodes = []
+    dumps = orjson.dumps
+    monkeypatch.setattr(orjson, "dumps", lambda *args, **kwargs: encodes.append(1) or dumps(*args, **kwargs))
+
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval_s=0, compress_min_bytes=100)
+        plain = [FakeWebSocket() for _ in range(3)]
+        compressed = [FakeWebSocket(compress=True) for _ in range(3)]
+        for ws in plain + compressed:
+            await manager.connect(ws)
+
+        event = {"type": "system_log", "payload": {"message": "x" * 500, "count": 3}}
+        await manager.broadcast(event)
+        await manager.broadcast({"type": "tiny"})
+        await settle()
+
+        assert len(encodes) == 2
+        for ws in plain:
+            assert all(isinstance(frame, str) for frame in ws.frames)
+        for ws in compressed:
+            big, small = ws.frames
+            # Large frames go out as one shared zlib buffer, small ones stay text
+            assert big is compressed[0].frames[0] and isinstance(small, str)
+        assert all(ws.sent == [event, {"type": "tiny"}] for ws in plain + compressed)
+
+    run(scenario())
+
+
+def test_subscriptions_filter_events_per_client():
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval_s=0)
+        wall, analyst, firehose = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        wall_client = await manager.connect(wall)
+        analyst_client = await manager.connect(analyst)
+        await manager.connect(firehose)
+
+        await manager.receive(wall_client, json.dumps(
+            {"action": "subscribe", "types": ["waf_bypass"], "filter": {"min_severity": "HIGH"}}))
+        await manager.receive(analyst_client, json.dumps(
+            {"action": "subscribe", "types": ["system_log", "session_start"], "filter": {"honeypot_id": "shellm-01"}}))
+        await manager.receive(analyst_client, json.dumps(
+            {"action": "subscribe", "types": ["*"], "filter": {"country": ["DE", "FR"]}}))
+        await settle()
+        assert wall.sent[-1] == {"type": "subscriptions", "subscriptions": {"waf_bypass": {"min_severity": "HIGH"}}}
+
+        events = [
+            {"type": "waf_bypass", "payload": {"severity": "CRITICAL", "country": "US"}},
+            {"type": "waf_bypass", "payload": {"severity": "MEDIUM", "country": "DE"}},
+            {"type": "system_log", "payload": {"level": "INFO", "honeypot_id": "shellm-01"}},
+            {"type": "system_log", "payload": {"level": "ERROR", "honeypot_id": "shellm-02"}},
+            {"type": "session_start", "honeypot_id": "SHELLM-01"},
+        ]
+        for event in events:
+            await manager.broadcast(event)
+        await settle()
+
+        assert [e for e in wall.sent if e["type"] != "subscriptions"] == [events[0]]
+        assert [e for e in analyst.sent if e["type"] != "subscriptions"] == [events[1], events[2], events[4]]
+        assert firehose.sent == events
+        assert manager.stats()["subscribers"] == {"waf_bypass": 1, "system_log": 1, "session_start": 1, "*": 1}
+
+        await manager.receive(analyst_client, json.dumps({"action": "unsubscribe", "types": ["*"]}))
+        await manager.receive(wall_client, json.dumps({"action": "subscribe", "filter": {"min_severity": "LOUD"}}))
+        await manager.broadcast({"type": "system_log", "payload": {"level": "ERROR", "honeypot_id": "shellm-01"}})
+        await settle()
+        assert analyst.sent[-1] == {"type": "subscriptions", "subscriptions": {}}
+        assert wall.sent[-1]["type"] == "subscription_error"
+        assert manager.stats()["subscribers"] == {"waf_bypass": 1}
+        assert manager.stats()["unmatched"] == 0
+
+        manager.disconnect(firehose)
+        manager.disconnect(wall)
+        await manager.broadcast({"type": "system_log", "payload": {}})
+        assert manager.stats()["unmatched"] == 1 and manager.stats()["subscribers"] == {}
+
+    run(scenario())
+
+
+def test_batching_sends_one_frame_per_interval_and_collapses_state_updates():
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval_s=0, batch_max_interval_ms=50, batch_max_events=20)
+        batched, immediate = FakeWebSocket(), FakeWebSocket()
+        client = await manager.connect(batched)
+        await manager.connect(immediate)
+        await manager.receive(client, json.dumps({"action": "batch", "interval_ms": 5000}))
+        # The ack is the first event held for a batch: capped at 50 ms
+        await asyncio.sleep(0.08)
+        assert batched.sent == [{"type": "batching", "interval_ms": 50.0}]
+
+        events = [{"type": "waf_bypass", "n": i} for i in range(5)]
+        events += [{"type": "honeypot_status", "payload": {"honeypot_id": "hp-1", "status": s}}
+                   for s in ("Pending", "Running")]
+        events += [{"type": "session_update", "coalesce_key": "sess-1", "n": i} for i in range(3)]
+        for event in events:
+            await manager.broadcast(event)
+            await settle()
+        assert len(batched.frames) == 1
+        await asyncio.sleep(0.08)
+
+        assert len(immediate.frames) == len(events)
+        assert len(batched.frames) == 2
+        batch = batched.sent[1]
+        assert batch["type"] == "batch"
+        assert batch["events"] == events[:5] + [events[6], events[9]]
+        stats = manager.stats()
+        assert (stats["batches"], stats["collapsed"]) == (1, 3)
+
+        # A full batch goes out without waiting for the interval
+        for i in range(20):
+            await manager.broadcast({"type": "system_log", "n": i})
+        await settle()
+        assert len(batched.sent[2]["events"]) == 20
+
+        await manager.receive(client, json.dumps({"action": "batch", "interval_ms": 0}))
+        await manager.broadcast({"type": "system_log", "n": 99})
+        await settle()
+        assert batched.sent[-1] == {"type": "system_log", "n": 99}
+
+    run(scenario())
+
+
+def test_reconnecting_client_is_replayed_the_events_it_missed():
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval_s=0, replay_size=5, batch_max_events=3)
+        first = FakeWebSocket(query_params={"stream": ""})
+        await manager.connect(first)
+        for n in range(1, 4):
+            await manager.broadcast({"type": "alert", "n": n})
+        await settle()
+        assert first.sent[0] == {"type": "stream", "stream": manager.stream, "latest_seq": 0, "replayed": 0}
+        assert first.seqs == [1, 2, 3]
+        manager.disconnect(first)
+
+        # Broadcast while nobody is connected: only the log keeps them
+        for n in range(4, 7):
+            await manager.broadcast({"type": "alert", "n": n})
+        back = FakeWebSocket(query_params={"stream": manager.stream, "last_seq": "3"})
+        await manager.connect(back)
+        await manager.broadcast({"type": "alert", "n": 7})
+        await settle()
+        assert back.sent[0] == {"type": "stream", "stream": manager.stream, "latest_seq": 6, "replayed": 3}
+        assert back.sent[1] == {"type": "batch", "events": [{"type": "alert", "n": n} for n in (4, 5, 6)]}
+        assert back.sent[2] == {"type": "alert", "n": 7}
+        assert back.seqs == [4, 5, 6, 7]
+
+        # Seq 2 has left the five-event log; another process's stream means nothing here
+        for query in ({"stream": manager.stream, "last_seq": "1"}, {"stream": "elsewhere", "last_seq": "6"}):
+            ws = FakeWebSocket(query_params=query)
+            await manager.connect(ws)
+            await settle()
+            assert ws.sent[0]["type"] == "resync_required" and ws.sent[0]["latest_seq"] == 7
+        assert [ws.sent[0]["reason"] for ws in list(manager.clients)[1:]] == ["evicted", "unknown_stream"]
+
+        stats = manager.stats()
+        assert stats["replay"] == {"buffered": 5, "oldest_seq": 3, "resumes": 1, "replayed": 3, "resyncs": 2}
+
+        aged = ConnectionManager(heartbeat_interval_s=0, replay_max_age_s=0.01)
+        await aged.broadcast({"type": "alert"})
+        await asyncio.sleep(0.02)
+        late = FakeWebSocket(query_params={"stream": aged.stream, "last_seq": "0"})
+        await aged.connect(late)
+        await settle()
+        assert late.sent[0]["reason"] == "evicted"
+
+    run(scenario())
+
+
+def test_replay_only_holds_the_types_the_client_subscribes_to():
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval_s=0)
+        for n, event_type in enumerate(["alert", "system_log", "waf_bypass", "system_log", "alert"], 1):
+            await manager.broadcast({"type": event_type, "n": n})
+
+        back = FakeWebSocket(query_params={"stream": manager.stream, "last_seq": "0", "types": "alert,waf_bypass"})
+        await manager.connect(back)
+        await manager.broadcast({"type": "system_log", "n": 6})
+        await settle()
+        assert back.sent[0] == {"type": "stream", "stream": manager.stream, "latest_seq": 5, "replayed": 3}
+        assert [e["n"] for e in back.sent[1]["events"]] == [1, 3, 5]
+        assert len(back.sent) == 2 and back.seqs == [1, 3, 5]
+
+        # Without types the client has not subscribed yet and gets everything it missed
+        everything = FakeWebSocket(query_params={"stream": manager.stream, "last_seq": "4"})
+        await manager.connect(everything)
+        await settle()
+        assert everything.sent[0]["replayed"] == 2 and everything.seqs == [5, 6]
+
+    run(scenario())
+
+
+def test_alerts_reach_connected_dashboards(client: TestClient):
+    with client.websocket_connect(f"{settings.API_V1_STR}/ws/events") as ws:
+        r = client.post(f"{settings.API_V1_STR}/observability/alerts/", json={"source_ip": "10.0.0.1"})
+        assert r.status_code == 200
+        event = ws.receive_json()
+        assert event["type"] == "waf_bypass"
+        assert event["payload"]["source_ip"] == "10.0.0.1"
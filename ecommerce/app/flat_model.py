@@ -0,0 +1,445 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from app.waf_timing import StageClock
+
+
+FLAT_MODEL_FILE = 'waf_model_flat.npz'
+# Same arrays, one .npy file each, so workers can memory-map them (see save_mapped)
+MAPPED_MODEL_DIR = 'waf_model_mapped'
+MAPPED_META_FILE = 'meta.json'
+FORMAT_VERSION = 1
+
+
+class UnsupportedModelError(TypeError):
+    """Raised when a fitted model has no flat representation."""
+
+
+class FlatForest:
+    """
+    The trees of one fitted forest concatenated into flat node arrays.
+
+    Node i of the forest splits on `feature[i]` at `threshold[i]` and continues
+    at `left[i]` or `right[i]`; the children of a leaf point back to the leaf
+    itself, so every row can be walked `max_depth` steps without branching.
+    `roots[t]` is the first node of tree t and `value[i]` whatever the owning
+    model reads at a leaf (class probabilities, path-length contributions).
+    """
+
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_trees(cls, trees, values, feature_maps=None):
+        """Flatten sklearn `tree_` objects; `values[t]` holds per-node leaf values."""
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for t, tree in enumerate(trees):
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(n_nodes)
+
+            tree_feature = np.where(is_leaf, 0, tree.feature).astype(np.int64)
+            if feature_maps is not None:
+                tree_feature = np.asarray(feature_maps[t], dtype=np.int64)[tree_feature]
+
+            feature.append(tree_feature)
+            threshold.append(np.where(is_leaf, 0.0, tree.threshold).astype(np.float64))
+            left.append(np.where(is_leaf, own, tree.children_left) + offset)
+            right.append(np.where(is_leaf, own, tree.children_right) + offset)
+            value.append(np.asarray(values[t], dtype=np.float64))
+            roots.append(offset)
+            max_depth = max(max_depth, int(tree.max_depth))
+            offset += n_nodes
+
+        return cls(
+            np.concatenate(feature).astype(np.int32),
+            np.concatenate(threshold),
+            np.concatenate(left).astype(np.int32),
+            np.concatenate(right).astype(np.int32),
+            np.concatenate(value),
+            np.asarray(roots, dtype=np.int32),
+            max_depth,
+        )
+
+    def apply(self, X32: np.ndarray) -> np.ndarray:
+        """Leaf reached by every row in every tree, shape (n_rows, n_trees).
+
+        X must already be float32: sklearn trees compare float32 features
+        against float64 thresholds, and so must we to land in the same leaves.
+        """
+        nodes = np.broadcast_to(self.roots, (X32.shape[0], self.n_trees)).copy()
+        rows = np.arange(X32.shape[0])[:, np.newaxis]
+        for _ in range(self.max_depth):
+            go_left = X32[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def split_counts(self, n_features: int) -> np.ndarray:
+        """How many split nodes test each feature; leaves (their own children) are skipped."""
+        internal = self.left != np.arange(len(self.left))
+        return np.bincount(self.feature[internal], minlength=n_features)
+
+    def to_arrays(self, prefix: str) -> dict:
+        return {f'{prefix}.{name}': getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str, max_depth: int) -> 'FlatForest':
+        return cls(*(arrays[f'{prefix}.{name}'] for name in cls.ARRAYS), max_depth=max_depth)
+
+
+class FlatDetector:
+    """
+    Pure-NumPy replacement for a fitted WAFBypassDetector.
+
+    Holds the scaler, the IsolationForest and the tree ensemble as flat arrays
+    (see `export_detector`) and reproduces `WAFBypassDetector.predict` with the
+    same floating-point operations in the same order, so predictions and
+    probabilities match bit for bit. Serving from it needs neither sklearn nor
+    pandas nor unpickling. Forest sums follow sklearn's sequential (n_jobs=1)
+    accumulation order.
+    """
+
+    STAGES = ('scale', 'anomaly', 'ensemble')
+
+    def __init__(self, meta: dict, arrays: dict):
+        self.meta = meta
+        self.columns = meta['columns']
+        self.is_trained = True
+
+        self._scaler_ops = [(op, arrays[f'scaler.{i}']) for i, op in enumerate(meta['scaler']['ops'])]
+        self._scaler_clip = meta['scaler'].get('clip')
+
+        anomaly = meta['anomaly']
+        self._anomaly = FlatForest.from_arrays(arrays, 'anomaly', anomaly['max_depth'])
+        self._anomaly_offset = arrays['anomaly.offset']
+        self._anomaly_denominator = arrays['anomaly.denominator']
+
+        ensemble = meta['ensemble']
+        self._members = [
+            (FlatForest.from_arrays(arrays, f'ensemble.{i}', member['max_depth']), member['average'])
+            for i, member in enumerate(ensemble['members'])
+        ]
+        self._voting = ensemble['kind'] == 'voting'
+        self._weights = ensemble.get('weights')
+        self.classes = arrays['ensemble.classes']
+
+    # -- stages -----------------------------------------------------------
+
+    def scale(self, X) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        for op, operand in self._scaler_ops:
+            if op == 'sub':
+                X -= operand
+            elif op == 'div':
+                X /= operand
+            elif op == 'mul':
+                X *= operand
+            elif op == 'add':
+                X += operand
+        if self._scaler_clip is not None:
+            np.clip(X, self._scaler_clip[0], self._scaler_clip[1], out=X)
+        return X
+
+    def anomaly_predict(self, X_scaled) -> np.ndarray:
+        """IsolationForest.predict: -1 for outliers, 1 for inliers."""
+        nodes = self._anomaly.apply(X_scaled.astype(np.float32))
+        depths = np.zeros(X_scaled.shape[0], order='f')
+        for t in range(self._anomaly.n_trees):
+            depths += self._anomaly.value[nodes[:, t]]
+        denominator = self._anomaly_denominator
+        scores = 2 ** (-np.divide(depths, denominator, out=np.ones_like(depths), where=denominator != 0))
+        decision = -scores - self._anomaly_offset
+        is_inlier = np.ones_like(decision, dtype=int)
+        is_inlier[decision < 0] = -1
+        return is_inlier
+
+    def ensemble_predict_proba(self, X_scaled) -> np.ndarray:
+        X32 = X_scaled.astype(np.float32)
+        probas = []
+        for forest, average in self._members:
+            nodes = forest.apply(X32)
+            proba = np.zeros((X32.shape[0], forest.value.shape[1]), dtype=np.float64)
+            for t in range(forest.n_trees):
+                proba += forest.value[nodes[:, t]]
+            if average:
+                proba /= forest.n_trees
+            probas.append(proba)
+        if not self._voting:
+            return probas[0]
+        return np.average(np.asarray(probas), axis=0, weights=self._weights)
+
+    def predict(self, X, timings=None):
+        clock = StageClock(timings)
+        X_scaled = self.scale(X)
+        clock.lap('scale')
+        anomaly_flags = (self.anomaly_predict(X_scaled) == -1).astype(int)
+        clock.lap('anomaly')
+        ensemble_proba = self.ensemble_predict_proba(X_scaled)
+        ensemble_pred = self.classes.take(np.argmax(ensemble_proba, axis=1), axis=0)
+        clock.lap('ensemble')
+        final_pred = np.maximum(anomaly_flags, ensemble_pred)
+        return final_pred, ensemble_proba[:, 1]
+
+    # -- introspection ----------------------------------------------------
+
+    def feature_usage(self) -> dict:
+        """Split nodes per column, for the anomaly forest and summed over the ensemble members."""
+        n_features = len(self.columns)
+        ensemble = np.zeros(n_features, dtype=np.int64)
+        for forest, _ in self._members:
+            ensemble += forest.split_counts(n_features)
+        return {'anomaly': self._anomaly.split_counts(n_features), 'ensemble': ensemble}
+
+    def scaler_center(self) -> np.ndarray:
+        """The unscaled value of every column that the scaler maps to 0."""
+        X = np.zeros(len(self.columns), dtype=np.float64)
+        inverse = {'sub': np.add, 'add': np.subtract, 'div': np.multiply, 'mul': np.divide}
+        for op, operand in reversed(self._scaler_ops):
+            X = inverse[op](X, operand)
+        return X
+
+    def fingerprint(self) -> str:
+        """sha256 of what the predictions depend on: the arrays and the meta describing them."""
+        digest = hashlib.sha256()
+        meta = {k: v for k, v in self.meta.items() if k not in ('sklearn_version', 'arrays')}
+        digest.update(json.dumps(meta, sort_keys=True).encode())
+        for name, array in sorted(self.arrays().items()):
+            array = np.ascontiguousarray(array)
+            digest.update(f'{name}:{array.dtype.str}:{array.shape}'.encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    # -- storage ----------------------------------------------------------
+
+    def arrays(self) -> dict:
+        arrays = {f'scaler.{i}': operand for i, (_, operand) in enumerate(self._scaler_ops)}
+        arrays.update(self._anomaly.to_arrays('anomaly'))
+        arrays['anomaly.offset'] = self._anomaly_offset
+        arrays['anomaly.denominator'] = self._anomaly_denominator
+        for i, (forest, _) in enumerate(self._members):
+            arrays.update(forest.to_arrays(f'ensemble.{i}'))
+        arrays['ensemble.classes'] = self.classes
+        return arrays
+
+    def save(self, path: str):
+        np.savez(path, __meta__=np.array(json.dumps(self.meta)), **self.arrays())
+
+    @classmethod
+    def load(cls, path: str) -> 'FlatDetector':
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        meta = json.loads(str(arrays.pop('__meta__')))
+        cls._check_version(meta)
+        return cls(meta, arrays)
+
+    def save_mapped(self, directory: str):
+        """Write every array as its own uncompressed .npy plus a JSON meta file."""
+        os.makedirs(directory, exist_ok=True)
+        arrays = self.arrays()
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+        meta = dict(self.meta, arrays=sorted(arrays))
+        # Meta goes last: a directory without it is an incomplete export
+        with open(os.path.join(directory, MAPPED_META_FILE), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load_mapped(cls, directory: str) -> 'FlatDetector':
+        """
+        Memory-map a `save_mapped` export read-only.
+
+        Nothing is deserialized or copied: the arrays are views of the page
+        cache, so every worker process on the host that maps the same files
+        shares one physical copy of the trees, and startup only touches the
+        pages the first predictions need.
+        """
+        with open(os.path.join(directory, MAPPED_META_FILE)) as f:
+            meta = json.load(f)
+        cls._check_version(meta)
+        arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+            for name in meta.pop('arrays')
+        }
+        return cls(meta, arrays)
+
+    @staticmethod
+    def _check_version(meta):
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise UnsupportedModelError(f"Unsupported flat model format {meta.get('format_version')!r}")
+
+    def make_extractor(self):
+        """Feature extractor configured like the one the models were trained with."""
+        from app.waf_detector import WAFBypassFeatureExtractor
+
+        extractor = WAFBypassFeatureExtractor()
+        config = self.meta['extractor']
+        extractor.encoding_patterns = dict(config['encoding_patterns'])
+        extractor.obfuscation_patterns = dict(config['obfuscation_patterns'])
+        extractor.attack_keywords = {k: list(v) for k, v in config['attack_keywords'].items()}
+        return extractor
+
+
+# -- export (needs the fitted sklearn objects, not sklearn at serve time) ----
+
+def _sklearn_version():
+    import sklearn
+
+    return tuple(int(part) for part in sklearn.__version__.split('.')[:2])
+
+
+def _export_scaler(scaler, meta, arrays):
+    kind = type(scaler).__name__
+    ops = []
+    clip = None
+    if kind == 'StandardScaler':
+        if scaler.with_mean:
+            ops.append(('sub', scaler.mean_))
+        if scaler.with_std:
+            ops.append(('div', scaler.scale_))
+    elif kind == 'RobustScaler':
+        if scaler.with_centering:
+            ops.append(('sub', scaler.center_))
+        if scaler.with_scaling:
+            ops.append(('div', scaler.scale_))
+    elif kind == 'MinMaxScaler':
+        ops = [('mul', scaler.scale_), ('add', scaler.min_)]
+        if getattr(scaler, 'clip', False):
+            clip = [float(v) for v in scaler.feature_range]
+    else:
+        raise UnsupportedModelError(f"Scaler {kind} has no flat representation")
+
+    meta['scaler'] = {'kind': kind, 'ops': [op for op, _ in ops], 'clip': clip}
+    for i, (_, operand) in enumerate(ops):
+        arrays[f'scaler.{i}'] = np.asarray(operand, dtype=np.float64)
+
+
+def _export_isolation_forest(model, meta, arrays):
+    kind = type(model).__name__
+    if kind != 'IsolationForest':
+        raise UnsupportedModelError(f"Anomaly detector {kind} has no flat representation")
+    from sklearn.ensemble._iforest import _average_path_length
+
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    if hasattr(model, '_decision_path_lengths'):
+        path_lengths = model._decision_path_lengths
+        average_path_lengths = model._average_path_length_per_tree
+    else:
+        path_lengths = [_node_depths(tree) + 1 for tree in trees]
+        average_path_lengths = [_average_path_length(tree.n_node_samples) for tree in trees]
+    # Same elementwise expression sklearn adds per tree when scoring a leaf
+    values = [path_lengths[t] + average_path_lengths[t] - 1.0 for t in range(len(trees))]
+
+    feature_maps = None
+    if model._max_features != model.n_features_in_:
+        feature_maps = model.estimators_features_
+
+    forest = FlatForest.from_trees(trees, values, feature_maps)
+    arrays.update(forest.to_arrays('anomaly'))
+    arrays['anomaly.offset'] = np.asarray(model.offset_, dtype=np.float64)
+    arrays['anomaly.denominator'] = np.asarray(
+        len(model.estimators_) * _average_path_length([model._max_samples]), dtype=np.float64)
+    meta['anomaly'] = {'kind': kind, 'max_depth': forest.max_depth, 'n_trees': forest.n_trees}
+
+
+def _classifier_leaf_values(estimator):
+    tree = estimator.tree_
+    if tree.n_outputs != 1:
+        raise UnsupportedModelError("Multi-output trees have no flat representation")
+    value = np.array(tree.value[:, 0, :estimator.n_classes_], dtype=np.float64)
+    if _sklearn_version() < (1, 4):
+        # Before 1.4 leaves store weighted class counts that predict_proba normalizes
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value /= normalizer
+    return value
+
+
+def _export_classifier(model):
+    """Return (forest, average) for a tree or a forest of trees."""
+    kind = type(model).__name__
+    if kind in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+        estimators = model.estimators_
+        average = True
+    elif kind in ('DecisionTreeClassifier', 'ExtraTreeClassifier'):
+        estimators = [model]
+        average = False
+    else:
+        raise UnsupportedModelError(f"Classifier {kind} has no flat representation")
+    forest = FlatForest.from_trees(
+        [estimator.tree_ for estimator in estimators],
+        [_classifier_leaf_values(estimator) for estimator in estimators],
+    )
+    return forest, average
+
+
+def _export_ensemble(model, meta, arrays):
+    kind = type(model).__name__
+    if kind == 'VotingClassifier':
+        if model.voting != 'soft':
+            raise UnsupportedModelError("Only soft-voting VotingClassifier has predict_proba")
+        members = [_export_classifier(estimator) for estimator in model.estimators_]
+        weights = model._weights_not_none
+        meta['ensemble'] = {
+            'kind': 'voting',
+            'weights': None if weights is None else [float(w) for w in weights],
+        }
+        classes = model.le_.classes_
+    else:
+        members = [_export_classifier(model)]
+        meta['ensemble'] = {'kind': 'single'}
+        classes = model.classes_
+
+    meta['ensemble']['members'] = []
+    for i, (forest, average) in enumerate(members):
+        arrays.update(forest.to_arrays(f'ensemble.{i}'))
+        meta['ensemble']['members'].append({
+            'average': average, 'max_depth': forest.max_depth, 'n_trees': forest.n_trees,
+        })
+    arrays['ensemble.classes'] = np.asarray(classes)
+
+
+def _node_depths(tree) -> np.ndarray:
+    depths = np.zeros(tree.node_count, dtype=np.int64)
+    for node in range(tree.node_count):
+        for child in (tree.children_left[node], tree.children_right[node]):
+            if child != -1:
+                depths[child] = depths[node] + 1
+    return depths
+
+
+def export_detector(detector, feature_extractor, columns) -> FlatDetector:
+    """Convert a fitted WAFBypassDetector and its extractor into a FlatDetector."""
+    import sklearn
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'sklearn_version': sklearn.__version__,
+        'columns': list(columns),
+        'extractor': {
+            'encoding_patterns': dict(feature_extractor.encoding_patterns),
+            'obfuscation_patterns': dict(feature_extractor.obfuscation_patterns),
+            'attack_keywords': {k: list(v) for k, v in feature_extractor.attack_keywords.items()},
+        },
+    }
+    arrays = {}
+    _export_scaler(detector.scaler, meta, arrays)
+    _export_isolation_forest(detector.anomaly_detector, meta, arrays)
+    _export_ensemble(detector.ensemble, meta, arrays)
+    return FlatDetector(meta, arrays)
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend that keeps failing.
+
+    After `threshold` consecutive failures the breaker opens and `allow()`
+    refuses calls for `reset_seconds`; then a single trial call is let through
+    (half-open). Its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, threshold: int = 5, reset_seconds: float = 30.0):
+        self.threshold = threshold
+        self.reset = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        return self.state != 'open'
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+
+
+class HaaSDispatcher:
+    """
+    Delivers WAF alerts and honeypot deployments to the HaaS backend in the
+    background, so a blocked request never waits for the backend.
+
+    `submit_alert` / `submit_honeypot` only put the item on a bounded queue
+    (a full queue drops it and counts the drop). One worker task drains the
+    queue over a long-lived pooled `httpx.AsyncClient`: alerts collected
+    during `flush_interval_ms` (up to `max_batch`) go out as a single
+    POST /observability/alerts/batch, honeypot deployments one POST each.
+    Failed deliveries are retried with exponential backoff and jitter; when
+    they keep failing the circuit breaker opens and items go to a local JSON
+    Lines spool instead of the network. Spooled alerts are replayed once the
+    backend answers again. Honeypot deployments that could not be made go to
+    `<spool_path>.honeypots` for the record only, since deploying them late
+    would be of no use.
+    """
+
+    def __init__(self, base_url: str, max_queue: int = 10000, flush_interval_ms: float = 250.0,
+                 max_batch: int = 200, max_retries: int = 3, backoff_ms: float = 100.0,
+                 max_backoff_ms: float = 5000.0, breaker_threshold: int = 5, breaker_reset_s: float = 30.0,
+                 spool_path: str = None, timeout_s: float = 5.0, client: httpx.AsyncClient = None):
+        self.base_url = base_url.rstrip('/')
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff = backoff_ms / 1000.0
+        self.max_backoff = max_backoff_ms / 1000.0
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_s)
+        self.spool_path = spool_path
+        self.timeout = timeout_s
+        self.client = client
+
+        self._queue = None
+        self._task = None
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.batches = 0
+        self.delivered_alerts = 0
+        self.delivered_honeypots = 0
+        self.rejected = 0
+        self.retries = 0
+        self.failures = 0
+        self.spooled = 0
+        self.replayed = 0
+
+    def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout_s: float = 5.0):
+        """Deliver what is queued (spooling what cannot go out in time) and close the client."""
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout_s)
+            except asyncio.TimeoutError:
+                pass
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            leftover = []
+            while not self._queue.empty():
+                leftover.append(self._queue.get_nowait())
+            for kind, item in leftover:
+                self._spool(kind, [item])
+        if self.client is not None:
+            await self.client.aclose()
+
+    def submit_alert(self, alert: dict) -> bool:
+        return self._submit('alert', alert)
+
+    def submit_honeypot(self, spec: dict) -> bool:
+        return self._submit('honeypot', spec)
+
+    def _submit(self, kind, item) -> bool:
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait((kind, item))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._deliver(batch)
+            except Exception as e:
+                print(f"[HaaS] Dispatch error: {e}", flush=True)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _deliver(self, batch):
+        alerts = [item for kind, item in batch if kind == 'alert']
+        honeypots = [item for kind, item in batch if kind == 'honeypot']
+        self.batches += 1
+
+        if alerts:
+            if await self._post('/observability/alerts/batch', alerts):
+                self.delivered_alerts += len(alerts)
+                await self._replay_spool()
+            else:
+                self._spool('alert', alerts)
+        for spec in honeypots:
+            if await self._post('/honeypots/', spec):
+                self.delivered_honeypots += 1
+            else:
+                self._spool('honeypot', [spec])
+
+    async def _post(self, path, body) -> bool:
+        """POST with retries; False when the item could not be delivered."""
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                return False
+            try:
+                response = await self.client.post(f"{self.base_url}{path}", json=body)
+                if response.status_code < 500 and response.status_code != 429:
+                    self.breaker.record_success()
+                    if response.status_code >= 400:
+                        # The backend is up but refuses this item; retrying won't help
+                        self.rejected += 1
+                        print(f"[HaaS] {path} rejected with {response.status_code}", flush=True)
+                    return True
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+
+            self.breaker.record_failure()
+            if attempt < self.max_retries:
+                self.retries += 1
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        self.failures += 1
+        print(f"[HaaS] Delivery to {path} failed: {error}", flush=True)
+        return False
+
+    def _spool(self, kind, items, count=True):
+        if not self.spool_path:
+            self.dropped += len(items)
+            return
+        path = self.spool_path if kind == 'alert' else f"{self.spool_path}.{kind}s"
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                for item in items:
+                    f.write(json.dumps({'kind': kind, 'item': item, 'spooled_at': time.time()}) + '\n')
+            if count:
+                self.spooled += len(items)
+        except OSError as e:
+            self.dropped += len(items)
+            print(f"[HaaS] Spooling failed: {e}", flush=True)
+
+    async def _replay_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        replay_path = f"{self.spool_path}.replay"
+        os.replace(self.spool_path, replay_path)
+        with open(replay_path, encoding='utf-8') as f:
+            alerts = [json.loads(line)['item'] for line in f if line.strip()]
+        os.remove(replay_path)
+
+        for start in range(0, len(alerts), self.max_batch):
+            chunk = alerts[start:start + self.max_batch]
+            if await self._post('/observability/alerts/batch', chunk):
+                self.replayed += len(chunk)
+            else:
+                # Backend went away again: keep the rest for the next replay
+                self._spool('alert', alerts[start:], count=False)
+                break
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_queue': self.max_queue,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'delivered_alerts': self.delivered_alerts,
+            'delivered_honeypots': self.delivered_honeypots,
+            'rejected': self.rejected,
+            'retries': self.retries,
+            'failures': self.failures,
+            'spooled': self.spooled,
+            'replayed': self.replayed,
+            'breaker': self.breaker.state,
+            'breaker_trips': self.breaker.trips,
+        }
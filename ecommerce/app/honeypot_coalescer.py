@@ -0,0 +1,101 @@
+import ipaddress
+import os
+import time
+from collections import OrderedDict
+
+
+class HoneypotCoalescer:
+    """
+    Decides, per blocked request, whether the attacker gets a new honeypot.
+
+    Attackers are keyed by source address truncated to `ipv4_prefix` /
+    `ipv6_prefix` bits (32 and 128 key single hosts, 24 or 64 a whole
+    subnet). The first trigger from a key deploys a honeypot; further
+    triggers within `cooldown_seconds` attach to that honeypot and are only
+    counted as suppressed. At most `max_active` honeypots may be live (deployed
+    within the last cooldown window) at once; triggers beyond that deploy
+    nothing and are counted as capped. Only the `max_tracked` most recently
+    deployed keys are remembered.
+
+    Used from the event loop only, so it takes no locks.
+    """
+
+    def __init__(self, cooldown_seconds: float = 300.0, max_active: int = 20, ipv4_prefix: int = 32,
+                 ipv6_prefix: int = 64, max_tracked: int = 10000):
+        self.cooldown = cooldown_seconds
+        self.max_active = max_active
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+        self.max_tracked = max_tracked
+        # key -> {'name', 'deployed_at', 'triggers', 'suppressed'}, oldest deployment first
+        self._attackers = OrderedDict()
+
+        self.deployed = 0
+        self.suppressed = 0
+        self.capped = 0
+
+    def key(self, source_ip) -> str:
+        try:
+            address = ipaddress.ip_address(source_ip)
+        except ValueError:
+            return str(source_ip)
+        prefix = self.ipv4_prefix if address.version == 4 else self.ipv6_prefix
+        return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+    def trigger(self, source_ip) -> dict:
+        """
+        Record a trigger and return the decision: `deploy` is True when the
+        caller should deploy honeypot `name`; otherwise `name` is the
+        attacker's existing honeypot (None when capped) and `suppressed` how
+        many of its triggers have been coalesced so far.
+        """
+        key = self.key(source_ip)
+        now = time.monotonic()
+        attacker = self._attackers.get(key)
+
+        if attacker is not None and now - attacker['deployed_at'] < self.cooldown:
+            attacker['triggers'] += 1
+            attacker['suppressed'] += 1
+            self.suppressed += 1
+            return {'key': key, 'name': attacker['name'], 'deploy': False, 'suppressed': attacker['suppressed']}
+
+        if self._active(now) >= self.max_active:
+            self.capped += 1
+            return {'key': key, 'name': None, 'deploy': False, 'suppressed': 0}
+
+        name = f"honeypot-triggered-{os.urandom(4).hex()}"
+        self._attackers.pop(key, None)
+        self._attackers[key] = {'name': name, 'deployed_at': now, 'triggers': 1, 'suppressed': 0}
+        while len(self._attackers) > self.max_tracked:
+            self._attackers.popitem(last=False)
+        self.deployed += 1
+        return {'key': key, 'name': name, 'deploy': True, 'suppressed': 0}
+
+    def release(self, key):
+        """Forget a deployment that never reached the orchestrator."""
+        if self._attackers.pop(key, None) is not None:
+            self.deployed -= 1
+
+    def _active(self, now) -> int:
+        active = 0
+        # Newest deployments are at the end; stop at the first expired one
+        for attacker in reversed(self._attackers.values()):
+            if now - attacker['deployed_at'] >= self.cooldown:
+                break
+            active += 1
+        return active
+
+    def stats(self, top: int = 10) -> dict:
+        now = time.monotonic()
+        noisiest = sorted(self._attackers.items(), key=lambda item: item[1]['suppressed'], reverse=True)[:top]
+        return {
+            'tracked': len(self._attackers),
+            'active': self._active(now),
+            'deployed': self.deployed,
+            'suppressed': self.suppressed,
+            'capped': self.capped,
+            'top_attackers': [
+                {'key': key, 'honeypot': a['name'], 'triggers': a['triggers'], 'suppressed': a['suppressed']}
+                for key, a in noisiest if a['suppressed']
+            ],
+        }
@@ -0,0 +1,111 @@
+import re
+from functools import lru_cache
+
+
+# Characters that re.IGNORECASE treats as equal to an ASCII letter besides its
+# own upper/lower case (dotted/dotless i, long s, Kelvin sign). The legacy
+# `s.*e.*l.*e.*c.*t` searches matched them, so the automaton must as well.
+IGNORECASE_EXTRAS = 'İıſK'
+
+# Stand-in for characters no keyword position cares about except wildcards
+FILLER = '\x00'
+
+
+class KeywordMatcher:
+    """
+    Linear-time matcher for the WAF attack keywords.
+
+    For every keyword it reports whether it occurs as a substring (`kw_*`) and
+    whether it matches the legacy obfuscation regex (`kw_obf_*`): the keyword's
+    characters in order on a single line, with re.IGNORECASE. The legacy regex
+    was built by joining the escaped keyword with `.*`, which split escapes
+    such as `\\.` apart, so a '.' in a keyword ended up as a wildcard for any
+    character except newline; that behaviour is kept.
+
+    All obfuscated keywords are checked together by one bit-parallel
+    subsequence automaton: each keyword position is a bit, a character sets
+    the bits whose predecessor is already set, and a newline clears the state
+    because `.` never matched it. The scan never backtracks, so its cost is
+    linear in the payload length whatever the payload looks like.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = tuple(keywords)
+
+        self._start_mask = 0
+        self._wildcard_mask = 0
+        self._final_bits = []
+        self._char_masks = {}
+        offset = 0
+        for keyword in self.keywords:
+            self._start_mask |= 1 << offset
+            for i, char in enumerate(keyword):
+                bit = 1 << (offset + i)
+                if char == '.':
+                    self._wildcard_mask |= bit
+                    continue
+                for equivalent in self._equivalents(char):
+                    self._char_masks[equivalent] = self._char_masks.get(equivalent, 0) | bit
+            offset += len(keyword)
+            self._final_bits.append(offset - 1)
+        self._final_mask = sum(1 << bit for bit in self._final_bits)
+
+        # Characters outside every keyword can only feed wildcard positions, so
+        # a run of them collapses to FILLER (or disappears without wildcards).
+        # Likewise a run of one character longer than the longest chain of
+        # positions it can match moves the automaton no further than that.
+        if self._wildcard_mask:
+            for char in self._char_masks:
+                self._char_masks[char] |= self._wildcard_mask
+            self._char_masks[FILLER] = self._wildcard_mask
+        relevant = ''.join(sorted(self._char_masks))
+        self._irrelevant = re.compile('[^' + re.escape(relevant) + '\n]+')
+        wildcard_chain = self._longest_chain(self._wildcard_mask)
+        if wildcard_chain:
+            self._filler = lambda m: FILLER * min(len(m.group(0)), wildcard_chain)
+        else:
+            self._filler = ''
+        run = max([self._longest_chain(mask) for mask in self._char_masks.values()] + [1])
+        self._runs = re.compile(r'(.)\1{%d,}' % run, re.DOTALL)
+        self._run_repl = '\\1' * run
+
+    @staticmethod
+    def _equivalents(char: str):
+        pattern = re.compile(re.escape(char), re.IGNORECASE)
+        candidates = {char, char.lower(), char.upper()} | set(IGNORECASE_EXTRAS)
+        return sorted(c for c in candidates if len(c) == 1 and pattern.fullmatch(c))
+
+    @staticmethod
+    def _longest_chain(mask: int) -> int:
+        return max((len(chain) for chain in bin(mask)[2:].split('0')), default=0) if mask else 0
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def for_keywords(cls, keywords: tuple) -> 'KeywordMatcher':
+        """Shared matcher per keyword tuple, so callers never rebuild the tables."""
+        return cls(keywords)
+
+    def reduce(self, payload_lower: str) -> str:
+        """Drop characters and repeats that cannot change the automaton state."""
+        reduced = self._irrelevant.sub(self._filler, payload_lower)
+        return self._runs.sub(self._run_repl, reduced)
+
+    def match_obfuscated(self, payload_lower: str) -> list:
+        """One flag per keyword: are its characters a subsequence of some line?"""
+        masks = self._char_masks
+        start = self._start_mask
+        final = self._final_mask
+        found = 0
+        for line in self.reduce(payload_lower).split('\n'):
+            state = 0
+            for char in line:
+                state |= ((state << 1) | start) & masks[char]
+            found |= state
+            if found & final == final:
+                break
+        return [(found >> bit) & 1 for bit in self._final_bits]
+
+    def match(self, payload_lower: str):
+        """Return (plain, obfuscated) flag lists aligned with `keywords`."""
+        plain = [int(keyword in payload_lower) for keyword in self.keywords]
+        return plain, self.match_obfuscated(payload_lower)
@@ -1,7 +1,8 @@
 import os
-import httpx
+import asyncio
+import signal
 from fastapi import FastAPI, Request, Form, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
@@ -12,78 +13,297 @@ from datetime import datetime
 # We need to make sure the current directory is in sys.path for pickle to find classes if needed
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from app.waf_detector import WAFEngine
+from app.waf_config import (WAF_BATCH_MAX_SIZE, WAF_EXECUTION_MODE, WAF_QUEUE_SIZE, WAF_RELOAD_INTERVAL_S,
+                            WAF_TIMEOUT_MS, WAF_WORKERS, admin_allowed, build_batcher, build_cache, build_engine,
+                            reload_models)
+from app.waf_executor import WAFExecutor
+from app.model_registry import ModelWatcher
+from app.haas_dispatcher import HaaSDispatcher
+from app.honeypot_coalescer import HoneypotCoalescer
+from app.waf_middleware import WAFMiddleware
+from app.waf_metrics import WAFMetrics
+from app.waf_logging import PayloadLog
+from app.waf_overload import OverloadController, RoutePolicy, parse_route_policy
+from app.waf_prefilter import SignatureScreen
+from app.waf_client import WAFClient
+from app.waf_reputation import ReputationTable
 
 # Configuration
 HAAS_BACKEND_URL = os.getenv("HAAS_BACKEND_URL", "http://backend:8000/api/v1")
-MODEL_DIR = os.getenv("MODEL_DIR", "/app/models")
+# Score payloads on the standalone WAF service (app/waf_service.py) instead of
+# loading the models in this process: unix:///run/waf/waf.sock or http://waf:8090
+WAF_SERVICE_URL = os.getenv("WAF_SERVICE_URL", "")
+WAF_SERVICE_CONNECTIONS = int(os.getenv("WAF_SERVICE_CONNECTIONS", "4"))
+# Model, executor, cache, reload and admin settings: see app.waf_config
+# Request bodies are inspected up to this many bytes, one verdict per field
+WAF_MAX_BODY_BYTES = int(os.getenv("WAF_MAX_BODY_BYTES", str(64 * 1024)))
+WAF_MAX_FIELDS = int(os.getenv("WAF_MAX_FIELDS", "64"))
+# Inspected payloads are logged off the request path: every blocked one, this share of the passed ones
+WAF_LOG_SAMPLE_RATE = float(os.getenv("WAF_LOG_SAMPLE_RATE", "0.01"))
+WAF_LOG_BLOCKED_RATE = float(os.getenv("WAF_LOG_BLOCKED_RATE", "1"))
+WAF_LOG_MAX_CHARS = int(os.getenv("WAF_LOG_MAX_CHARS", "256"))
+# Load shedding: over budget the WAF degrades to a signature screen, then to
+# the per-route shed policy ("open" skips inspection, "closed" answers 503).
+# A latency budget of 0 disables it. The route policy also decides, at any
+# level, requests the WAF could not score (timed out, queue full).
+WAF_LATENCY_BUDGET_MS = float(os.getenv("WAF_LATENCY_BUDGET_MS", "0"))
+WAF_QUEUE_BUDGET_MS = float(os.getenv("WAF_QUEUE_BUDGET_MS", "50"))
+WAF_OVERLOAD_RECOVER_S = float(os.getenv("WAF_OVERLOAD_RECOVER_S", "10"))
+WAF_OVERLOAD_PROBE_RATE = float(os.getenv("WAF_OVERLOAD_PROBE_RATE", "0.05"))
+WAF_SHED_DEFAULT = os.getenv("WAF_SHED_DEFAULT", "open")
+WAF_SHED_POLICY = os.getenv("WAF_SHED_POLICY", "/login=closed")
+# Sources with this many blocked requests within the window are refused
+# uninspected until they go quiet; 0 disables. With a shared memory name all
+# workers on the host share the table.
+WAF_REPUTATION_THRESHOLD = int(os.getenv("WAF_REPUTATION_THRESHOLD", "20"))
+WAF_REPUTATION_WINDOW_S = float(os.getenv("WAF_REPUTATION_WINDOW_S", "60"))
+WAF_REPUTATION_QUIET_S = float(os.getenv("WAF_REPUTATION_QUIET_S", "300"))
+WAF_REPUTATION_SIZE = int(os.getenv("WAF_REPUTATION_SIZE", "65536"))
+WAF_REPUTATION_SHM = os.getenv("WAF_REPUTATION_SHM", "")
+
+# Background delivery of alerts and honeypot deployments to the HaaS backend
+HAAS_QUEUE_SIZE = int(os.getenv("HAAS_QUEUE_SIZE", "10000"))
+HAAS_FLUSH_MS = float(os.getenv("HAAS_FLUSH_MS", "250"))
+HAAS_MAX_BATCH = int(os.getenv("HAAS_MAX_BATCH", "200"))
+HAAS_MAX_RETRIES = int(os.getenv("HAAS_MAX_RETRIES", "3"))
+HAAS_BREAKER_THRESHOLD = int(os.getenv("HAAS_BREAKER_THRESHOLD", "5"))
+HAAS_BREAKER_RESET_S = float(os.getenv("HAAS_BREAKER_RESET_S", "30"))
+HAAS_SPOOL_PATH = os.getenv("HAAS_SPOOL_PATH", "/tmp/haas-spool.jsonl")
+
+# One honeypot per attacker (source address, or subnet with shorter prefixes) per cooldown
+HONEYPOT_COOLDOWN_S = float(os.getenv("HONEYPOT_COOLDOWN_S", "300"))
+HONEYPOT_MAX_ACTIVE = int(os.getenv("HONEYPOT_MAX_ACTIVE", "20"))
+HONEYPOT_IPV4_PREFIX = int(os.getenv("HONEYPOT_IPV4_PREFIX", "32"))
+HONEYPOT_IPV6_PREFIX = int(os.getenv("HONEYPOT_IPV6_PREFIX", "64"))
 
 # Initialize Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ecommerce")
 
 # Initialize WAF
-waf = WAFEngine(model_dir=MODEL_DIR)
+waf_metrics = WAFMetrics()
+waf_payload_log = PayloadLog(
+    sample_rate=WAF_LOG_SAMPLE_RATE,
+    blocked_rate=WAF_LOG_BLOCKED_RATE,
+    max_chars=WAF_LOG_MAX_CHARS,
+)
+waf_cache = build_cache() if not WAF_SERVICE_URL else None
+waf = None
+waf_client = None
+if WAF_SERVICE_URL:
+    waf_client = WAFClient(WAF_SERVICE_URL, timeout_ms=WAF_TIMEOUT_MS, connections=WAF_SERVICE_CONNECTIONS,
+                           max_batch=WAF_BATCH_MAX_SIZE)
+else:
+    waf = build_engine(cache=waf_cache, stage_observer=waf_metrics.observe_stages)
+    waf_metrics.set_model(waf.model_info())
+def waf_overload_changed(event):
+    logger.warning(f"WAF overload level {event['from']} -> {event['to']} "
+                   f"(latency {event['latency_ms']} ms, queue wait {event['queue_wait_ms']} ms)")
+    waf_metrics.observe_overload_change(event, waf_overload.level)
+
+waf_shed_policy = RoutePolicy(parse_route_policy(WAF_SHED_POLICY), WAF_SHED_DEFAULT)
+waf_overload = None
+if WAF_LATENCY_BUDGET_MS > 0:
+    waf_overload = OverloadController(
+        latency_budget_ms=WAF_LATENCY_BUDGET_MS,
+        queue_budget_ms=WAF_QUEUE_BUDGET_MS,
+        recover_s=WAF_OVERLOAD_RECOVER_S,
+        probe_rate=WAF_OVERLOAD_PROBE_RATE,
+        route_policy=parse_route_policy(WAF_SHED_POLICY),
+        default_policy=WAF_SHED_DEFAULT,
+        on_change=waf_overload_changed,
+    )
+waf_screen = SignatureScreen()
+
+def waf_source_banned(event):
+    logger.warning(f"WAF banned {event['source']} for {event['quiet_s']:g}s of quiet "
+                   f"after {event['blocks']} blocked requests")
+    waf_metrics.reputation_bans.inc()
+
+waf_reputation = None
+if WAF_REPUTATION_THRESHOLD > 0:
+    waf_reputation = ReputationTable(
+        threshold=WAF_REPUTATION_THRESHOLD,
+        window_seconds=WAF_REPUTATION_WINDOW_S,
+        quiet_seconds=WAF_REPUTATION_QUIET_S,
+        capacity=WAF_REPUTATION_SIZE,
+        shared_name=WAF_REPUTATION_SHM or None,
+        on_ban=waf_source_banned,
+    )
+
+waf_executor = None
+if waf:
+    waf_executor = WAFExecutor(
+        waf,
+        mode=WAF_EXECUTION_MODE,
+        workers=WAF_WORKERS,
+        max_queue=WAF_QUEUE_SIZE,
+        timeout_ms=WAF_TIMEOUT_MS,
+        queue_observer=waf_overload.observe_queue if waf_overload else None,
+    )
+# Where batches of payloads get their verdicts: the local executor or the WAF service
+waf_score_many = waf_executor.analyze_many if waf_executor else waf_client.analyze_many
+
+waf_batcher = build_batcher(waf_score_many)
+
+def reload_waf_models(version=None):
+    if waf is None:
+        return {"status": "failed", "error": f"Models are served by the WAF service at {WAF_SERVICE_URL}"}
+    return reload_models(waf, waf_executor, waf_metrics, version)
+
+haas_dispatcher = HaaSDispatcher(
+    HAAS_BACKEND_URL,
+    max_queue=HAAS_QUEUE_SIZE,
+    flush_interval_ms=HAAS_FLUSH_MS,
+    max_batch=HAAS_MAX_BATCH,
+    max_retries=HAAS_MAX_RETRIES,
+    breaker_threshold=HAAS_BREAKER_THRESHOLD,
+    breaker_reset_s=HAAS_BREAKER_RESET_S,
+    spool_path=HAAS_SPOOL_PATH or None,
+)
+
+honeypot_coalescer = HoneypotCoalescer(
+    cooldown_seconds=HONEYPOT_COOLDOWN_S,
+    max_active=HONEYPOT_MAX_ACTIVE,
+    ipv4_prefix=HONEYPOT_IPV4_PREFIX,
+    ipv6_prefix=HONEYPOT_IPV6_PREFIX,
+)
+
+waf_watcher = None
+if waf and waf.registry and WAF_RELOAD_INTERVAL_S > 0:
+    waf_watcher = ModelWatcher(waf, interval_seconds=WAF_RELOAD_INTERVAL_S, reload=reload_waf_models)
 
 app = FastAPI(title="Vulnerable E-Commerce App")
+reload_tasks = set()
+
+@app.on_event("startup")
+async def start_waf_executor():
+    waf_payload_log.start()
+    if waf_executor:
+        waf_executor.start()
+    if waf_client:
+        await waf_client.start()
+    haas_dispatcher.start()
+    if waf_watcher:
+        waf_watcher.start()
+
+    # SIGHUP reloads the registry's current model version
+    loop = asyncio.get_running_loop()
+    def on_sighup():
+        task = loop.create_task(asyncio.to_thread(reload_waf_models))
+        reload_tasks.add(task)
+        task.add_done_callback(reload_tasks.discard)
+    try:
+        loop.add_signal_handler(signal.SIGHUP, on_sighup)
+    except (NotImplementedError, AttributeError, RuntimeError):
+        pass
+
+@app.on_event("shutdown")
+async def stop_waf():
+    if waf_watcher:
+        waf_watcher.stop()
+    if waf_batcher:
+        await waf_batcher.drain()
+    if waf_executor:
+        waf_executor.shutdown()
+    if waf_client:
+        await waf_client.close()
+    await haas_dispatcher.stop()
+    waf_payload_log.stop()
+    if waf_reputation:
+        waf_reputation.close()
 
 # Templates
 BASE_DIR = Path(__file__).resolve().parent
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
 # Middleware for WAF
-@app.middleware("http")
-async def waf_middleware(request: Request, call_next):
-    # Skip static files or internal routes if any
-    if request.url.path.startswith("/static"):
-        return await call_next(request)
-
-    # Extract payload from Query Params
-    query_params = str(request.query_params)
-    
-    # Extract payload from Body (if form data)
-    body_payload = ""
-    if request.method == "POST":
-        try:
-            form = await request.form()
-            body_payload = str(dict(form))
-        except:
-            pass # Not a form
-
-    # Combine for analysis
-    full_payload = f"{query_params} {body_payload}".strip()
-    
-    if full_payload:
-        logger.info(f"Inspecting payload: {full_payload}")
-        result = waf.analyze(full_payload)
-        
-        if result.get('is_attack'):
-            logger.warning(f"WAF BLOCKED ATTACK! Confidence: {result.get('confidence')}")
-            
-            # Trigger HaaS Backend
-            try:
-                async with httpx.AsyncClient() as client:
-                    # 1. Report the attack to the Dashboard
-                    await client.post(f"{HAAS_BACKEND_URL}/observability/alerts/", json={
-                        "source_ip": request.client.host,
-                        "payload": full_payload,
-                        "confidence": result.get('confidence'),
-                        "timestamp": datetime.utcnow().isoformat()
-                    })
-
-                    # 2. Deploy Honeypot
-                    await client.post(f"{HAAS_BACKEND_URL}/honeypots/", json={
-                        "name": f"honeypot-triggered-{os.urandom(4).hex()}",
-                        "image": "shellm-honeypot:latest"
-                    })
-            except Exception as e:
-                logger.error(f"Failed to notify HaaS backend: {e}")
-
-            # Return a generic 403 or a fake error page
-            return JSONResponse(status_code=403, content={"detail": "Access Denied: Malicious Activity Detected"})
-
-    response = await call_next(request)
-    return response
+async def waf_analyze(payload):
+    if waf_batcher:
+        return await waf_batcher.analyze(payload)
+    return (await waf_score_many([payload]))[0]
+
+def waf_inspected(scope, fields, verdicts, seconds):
+    waf_metrics.observe_request(fields, verdicts, seconds)
+    client_ip = scope["client"][0] if scope.get("client") else "unknown"
+    waf_payload_log.log_request(client_ip, scope["path"], fields, verdicts)
+
+def waf_rejected(scope):
+    waf_metrics.reputation_rejections.inc()
+
+async def waf_screen_verdict(payload):
+    # Degraded mode: cache or prefilter answers when there are any, else signatures
+    return (waf.screen(payload) if waf else None) or waf_screen.verdict(payload)
+
+async def waf_blocked(scope, payload, result):
+    client_ip = scope["client"][0] if scope.get("client") else "unknown"
+    logger.warning(f"WAF BLOCKED ATTACK! Confidence: {result.get('confidence')}")
+
+    # Trigger HaaS Backend in the background; the 403 goes out right away
+    # Repeat offenders attach to the honeypot they already have
+    honeypot = honeypot_coalescer.trigger(client_ip)
+
+    # 1. Report the attack to the Dashboard
+    haas_dispatcher.submit_alert({
+        "source_ip": client_ip,
+        "payload": payload,
+        "confidence": result.get('confidence'),
+        "timestamp": datetime.utcnow().isoformat(),
+        "honeypot": honeypot["name"],
+        "suppressed_triggers": honeypot["suppressed"]
+    })
+
+    # 2. Deploy Honeypot (not on signature verdicts made while shedding load)
+    if honeypot["deploy"] and result.get("source") == "screen":
+        honeypot_coalescer.release(honeypot["key"])
+    elif honeypot["deploy"] and not haas_dispatcher.submit_honeypot({
+        "name": honeypot["name"],
+        "image": "shellm-honeypot:latest"
+    }):
+        honeypot_coalescer.release(honeypot["key"])
+
+app.add_middleware(
+    WAFMiddleware,
+    analyze=waf_analyze,
+    on_block=waf_blocked,
+    on_inspect=waf_inspected,
+    overload=waf_overload,
+    screen=waf_screen_verdict,
+    reputation=waf_reputation,
+    on_reject=waf_rejected,
+    shed_policy=waf_shed_policy,
+    max_body_bytes=WAF_MAX_BODY_BYTES,
+    max_fields=WAF_MAX_FIELDS,
+)
+
+@app.post("/waf/reload")
+async def waf_reload(request: Request, version: str = None):
+    if not admin_allowed(request):
+        return JSONResponse(status_code=403, content={"detail": "Forbidden"})
+    report = await asyncio.to_thread(reload_waf_models, version)
+    return JSONResponse(status_code=200 if report["status"] in ("swapped", "unchanged") else 409, content=report)
+
+@app.get("/waf/stats")
+async def waf_stats():
+    return {
+        "model": waf.model_info() if waf else None,
+        "cache": waf_cache.stats() if waf_cache else None,
+        "prefilter": waf.prefilter.stats() if waf and waf.prefilter else None,
+        "executor": waf_executor.stats() if waf_executor else None,
+        "service": waf_client.stats() if waf_client else None,
+        "batcher": waf_batcher.stats() if waf_batcher else None,
+        "haas_dispatch": haas_dispatcher.stats(),
+        "honeypots": honeypot_coalescer.stats(),
+        "payload_log": waf_payload_log.stats(),
+        "overload": waf_overload.stats() if waf_overload else None,
+        "screen": waf_screen.stats(),
+        "reputation": waf_reputation.stats() if waf_reputation else None,
+    }
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = waf_metrics.render()
+    return Response(content=body, headers={"Content-Type": content_type})
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
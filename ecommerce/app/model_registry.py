@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from tools.corpus import load_corpus
+
+
+VERSIONS_DIR = 'versions'
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+CANARY_FILE = 'canary.jsonl'
+
+
+def _sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _atomic_write(path, text):
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """
+    Directory of immutable, versioned WAF model artifacts.
+
+        MODEL_DIR/
+            CURRENT                 name of the version to serve
+            canary.jsonl            default canary corpus (optional)
+            versions/<version>/
+                manifest.json       version, creation time, sha256 of every file
+                canary.jsonl        canary corpus for this version (optional)
+                ...                 pickles and/or flat/mapped exports
+
+    A version directory is never modified once published; rolling out or
+    back is a matter of rewriting CURRENT, which is replaced atomically.
+    Canary corpora are JSON Lines with a "payload" and an optional "label".
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    @staticmethod
+    def is_registry(root) -> bool:
+        return os.path.isdir(os.path.join(root, VERSIONS_DIR))
+
+    def path(self, version) -> str:
+        if not version or version.startswith('.') or os.sep in version or '/' in version:
+            raise ValueError(f"Invalid model version {version!r}")
+        return os.path.join(self.root, VERSIONS_DIR, version)
+
+    def versions(self) -> list:
+        versions_dir = os.path.join(self.root, VERSIONS_DIR)
+        return sorted(
+            name for name in os.listdir(versions_dir)
+            if not name.startswith('.') and os.path.exists(os.path.join(versions_dir, name, MANIFEST_FILE))
+        )
+
+    def current_version(self) -> str:
+        """Version named by CURRENT, or the latest published one without it."""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE)) as f:
+                version = f.read().strip()
+            if version:
+                return version
+        except FileNotFoundError:
+            pass
+        versions = self.versions()
+        if not versions:
+            raise FileNotFoundError(f"No model versions published in {self.root}")
+        return versions[-1]
+
+    def manifest(self, version) -> dict:
+        with open(os.path.join(self.path(version), MANIFEST_FILE)) as f:
+            return json.load(f)
+
+    def verify(self, version) -> str:
+        """Check every file of a version against its manifest and return its directory."""
+        directory = self.path(version)
+        manifest = self.manifest(version)
+        for name, checksum in manifest['files'].items():
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                raise ValueError(f"Model version {version}: {name} is missing")
+            if _sha256(path) != checksum:
+                raise ValueError(f"Model version {version}: checksum mismatch for {name}")
+        return directory
+
+    def canary(self, version):
+        """Return the (payload, label) pairs of a version's canary corpus, or None."""
+        for path in (os.path.join(self.path(version), CANARY_FILE), os.path.join(self.root, CANARY_FILE)):
+            if os.path.exists(path):
+                return load_corpus(path)
+        return None
+
+    def publish(self, source_dir, version, canary=None, activate=True) -> dict:
+        """Copy model files into a new version directory with a manifest."""
+        target = self.path(version)
+        if os.path.exists(target):
+            raise FileExistsError(f"Model version {version} already exists")
+
+        staging = os.path.join(self.root, VERSIONS_DIR, f'.staging-{version}')
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.copytree(source_dir, staging)
+        if canary is not None:
+            shutil.copyfile(canary, os.path.join(staging, CANARY_FILE))
+
+        files = {}
+        for dirpath, _, filenames in os.walk(staging):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, staging).replace(os.sep, '/')
+                if name != MANIFEST_FILE:
+                    files[name] = _sha256(path)
+        manifest = {'version': version, 'created': time.time(), 'files': dict(sorted(files.items()))}
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        # Readers only ever see complete version directories
+        os.replace(staging, target)
+        if activate:
+            self.activate(version)
+        return manifest
+
+    def activate(self, version):
+        if not os.path.exists(os.path.join(self.path(version), MANIFEST_FILE)):
+            raise FileNotFoundError(f"Model version {version} is not published")
+        _atomic_write(os.path.join(self.root, CURRENT_FILE), version + '\n')
+
+
+class ModelWatcher:
+    """
+    Background thread that reloads the engine when the registry's CURRENT
+    version changes.
+
+    `reload` is called with the new version and does the actual work (by
+    default `engine.reload`). A version that fails to load or validate is
+    not retried until CURRENT changes again.
+    """
+
+    def __init__(self, engine, interval_seconds: float = 30.0, reload=None):
+        self.engine = engine
+        self.interval = interval_seconds
+        self.reload = reload or engine.reload
+        self._stop = threading.Event()
+        self._thread = None
+        self._rejected = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='waf-model-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+
+    def check(self):
+        """Reload if CURRENT names a version other than the serving one."""
+        try:
+            version = self.engine.registry.current_version()
+        except Exception as e:
+            print(f"[WAF] Model registry unreadable: {e}", flush=True)
+            return None
+        if version == self.engine.version or version == self._rejected:
+            return None
+        report = self.reload(version)
+        self._rejected = version if report['status'] != 'swapped' else None
+        return report
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
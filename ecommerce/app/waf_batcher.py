@@ -0,0 +1,91 @@
+import asyncio
+
+
+# Not a verdict on the payload: the middleware applies the route's shed policy instead
+TIMEOUT_RESULT = {'is_attack': False, 'confidence': 0.0, 'error': 'WAF verdict timed out', 'unscored': True}
+
+
+class WAFBatcher:
+    """
+    Coalesces concurrent WAF requests into batched model calls.
+
+    The first payload to arrive opens a window of `window_ms`; everything that
+    arrives before it closes, up to `max_batch` payloads, is scored by a single
+    `score_batch` call and each caller resumes with its own verdict. A full
+    batch is flushed immediately. `max_wait_ms` bounds how long any caller
+    waits in total (window plus scoring); past it, or when `score_batch`
+    fails, the caller gets an error verdict marked 'unscored'.
+
+    `score_batch` is a coroutine function taking a list of payloads and
+    returning one result dict per payload, in order.
+    """
+
+    def __init__(self, score_batch, window_ms: float = 2.0, max_batch: int = 64, max_wait_ms: float = 100.0):
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self.score_batch = score_batch
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+        self.batches = 0
+        self.payloads = 0
+        self.timeouts = 0
+
+    async def analyze(self, payload: str) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((payload, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return dict(TIMEOUT_RESULT)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.payloads += len(batch)
+        try:
+            results = await self.score_batch([payload for payload, _ in batch])
+        except Exception as e:
+            results = [{**TIMEOUT_RESULT, 'error': str(e)} for _ in batch]
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def drain(self):
+        """Flush whatever is pending and wait for in-flight batches (shutdown)."""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'payloads': self.payloads,
+            'avg_batch_size': self.payloads / self.batches if self.batches else 0.0,
+            'timeouts': self.timeouts,
+            'pending': len(self._pending),
+        }
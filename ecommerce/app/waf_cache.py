@@ -0,0 +1,105 @@
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+# Rough per-entry bookkeeping cost: OrderedDict node, key bytes, entry tuple
+ENTRY_OVERHEAD = 200
+
+
+class VerdictCache:
+    """
+    Bounded LRU cache of WAF verdicts keyed by a hash of the payload.
+
+    Entries expire after `ttl_seconds`; the least recently used ones are
+    evicted once either `max_entries` or `max_bytes` is exceeded. The key is a
+    128-bit BLAKE2b digest of the payload as the extractor sees it (str(),
+    None -> ""). No further normalization is applied: every character feeds a
+    feature, so two payloads that differ in any way may score differently.
+
+    Safe to share between threads. `clear()` must be called whenever the
+    models change, since cached verdicts belong to the models that made them.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(payload) -> bytes:
+        if payload is None or (isinstance(payload, float) and payload != payload):
+            payload = ""
+        return hashlib.blake2b(str(payload).encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    @staticmethod
+    def _entry_size(verdict: dict) -> int:
+        return ENTRY_OVERHEAD + sys.getsizeof(verdict) + sum(sys.getsizeof(v) for v in verdict.values())
+
+    def get(self, payload):
+        """Return a copy of the cached verdict, or None."""
+        key = self.key(payload)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, verdict = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return dict(verdict)
+
+    def put(self, payload, verdict: dict):
+        # Error verdicts are transient and never cached
+        if 'error' in verdict:
+            return
+        key = self.key(payload)
+        verdict = {k: v for k, v in verdict.items() if k not in ('source', 'features')}
+        size = self._entry_size(verdict)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, verdict)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import json
+
+import httpx
+
+
+UNIX_SCHEME = 'unix://'
+
+
+def error_result(error: str) -> dict:
+    # Not a verdict on the payload: the middleware applies the route's shed policy instead
+    return {'is_attack': False, 'confidence': 0.0, 'error': error, 'unscored': True}
+
+
+class SocketConnection:
+    """
+    One persistent connection to the WAF service's Unix socket.
+
+    Requests are newline-delimited JSON objects carrying an `id`; any number
+    may be in flight at once (pipelining) and the reader task matches each
+    response line back to its request by id, in whatever order the service
+    answers. When the connection drops, every pending request fails.
+    """
+
+    def __init__(self, path: str, max_line_bytes: int):
+        self.path = path
+        self.max_line_bytes = max_line_bytes
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = {}
+        self._ids = itertools.count()
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    async def request(self, message: dict) -> dict:
+        if not self.connected:
+            async with self._connect_lock:
+                if not self.connected:
+                    await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(json.dumps({**message, 'id': request_id}).encode() + b'\n')
+            await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path, limit=self.max_line_bytes)
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_responses(self._reader))
+
+    async def _read_responses(self, reader):
+        error = ConnectionResetError("WAF service closed the connection")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.get(response.get('id'))
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (OSError, ValueError, asyncio.LimitOverrunError) as e:
+            error = e
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+
+class WAFClient:
+    """
+    Thin client for the standalone WAF service (app/waf_service.py), with
+    the same `analyze` / `analyze_many` coroutines as WAFExecutor so the
+    middleware can use either.
+
+    `url` is either `unix:///path/to/waf.sock`, spoken over `connections`
+    persistent pipelined socket connections (each call goes to the least
+    busy one), or an `http://` base URL, spoken over a keep-alive
+    httpx.AsyncClient. A single payload is sent on its own, so the service
+    coalesces it with other callers' (WAFBatcher); larger lists go as
+    batches of at most `max_batch`, the service's WAF_BATCH_MAX_SIZE. A
+    call that fails or takes longer than `timeout_ms` gets error verdicts
+    marked 'unscored', like the in-process executor's timeouts, so a
+    service that is down or restarting does not pass requests uninspected.
+    """
+
+    def __init__(self, url: str, timeout_ms: float = 1000.0, connections: int = 4,
+                 max_line_bytes: int = 16 * 1024 * 1024, max_batch: int = 64,
+                 client: httpx.AsyncClient = None):
+        self.url = url.rstrip('/')
+        self.timeout = timeout_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.socket_path = self.url[len(UNIX_SCHEME):] if self.url.startswith(UNIX_SCHEME) else None
+        self._connections = [SocketConnection(self.socket_path, max_line_bytes) for _ in range(connections)] \
+            if self.socket_path else []
+        self.client = client
+
+        self.requests = 0
+        self.payloads = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    async def start(self):
+        if self.socket_path is None and self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            )
+
+    async def close(self):
+        for connection in self._connections:
+            await connection.close()
+        if self.client is not None:
+            await self.client.aclose()
+
+    async def analyze(self, payload: str) -> dict:
+        return (await self.analyze_many([payload]))[0]
+
+    async def analyze_many(self, payloads) -> list:
+        payloads = list(payloads)
+        self.requests += 1
+        self.payloads += len(payloads)
+        try:
+            verdicts = await asyncio.wait_for(self._request(payloads), self.timeout)
+            if len(verdicts) != len(payloads):
+                raise ValueError(f"expected {len(payloads)} verdicts, got {len(verdicts)}")
+            return verdicts
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return [error_result('WAF service timed out') for _ in payloads]
+        except Exception as e:
+            self.errors += 1
+            print(f"[WAF] Service request failed: {e}", flush=True)
+            return [error_result(f'WAF service unavailable: {e}') for _ in payloads]
+
+    async def _request(self, payloads) -> list:
+        if len(payloads) > self.max_batch:
+            chunks = [payloads[i:i + self.max_batch] for i in range(0, len(payloads), self.max_batch)]
+            return [v for verdicts in await asyncio.gather(*map(self._request, chunks)) for v in verdicts]
+        message = {'payload': payloads[0]} if len(payloads) == 1 else {'payloads': payloads}
+        if self.socket_path is not None:
+            connection = min(self._connections, key=lambda c: (c.in_flight, not c.connected))
+            response = await connection.request(message)
+        elif 'payload' in message:
+            reply = await self.client.post('/v1/analyze', json=message)
+            reply.raise_for_status()
+            return [reply.json()]
+        else:
+            reply = await self.client.post('/v1/analyze/batch', json=message)
+            reply.raise_for_status()
+            response = reply.json()
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['verdicts']
+
+    def stats(self) -> dict:
+        return {
+            'url': self.url,
+            'connections': sum(c.connected for c in self._connections) if self.socket_path else None,
+            'in_flight': sum(c.in_flight for c in self._connections),
+            'requests': self.requests,
+            'payloads': self.payloads,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,97 @@
+"""
+WAF settings read from the environment, shared by the two entry points
+that serve the models: the shop (app.main) and the standalone WAF service
+(app.waf_service). Both build their engine, cache and batcher, reload
+models and guard their admin endpoints with the helpers here, so the two
+cannot drift apart.
+"""
+import hmac
+import os
+
+from app.waf_batcher import WAFBatcher
+from app.waf_cache import VerdictCache
+from app.waf_detector import WAFEngine
+
+MODEL_DIR = os.getenv("MODEL_DIR", "/app/models")
+WAF_FEATURE_MODE = os.getenv("WAF_FEATURE_MODE", "vector")
+# "auto" serves the memory-mapped or flat NumPy export (tools/export_flat_model.py) when present
+WAF_MODEL_FORMAT = os.getenv("WAF_MODEL_FORMAT", "auto")
+# Extract only the features the models split on when a feature_plan.json sits next to them
+WAF_FEATURE_PLAN = os.getenv("WAF_FEATURE_PLAN", "1") == "1"
+# Micro-batching: requests arriving within the window share one model call.
+# A window of 0 scores every request inline.
+WAF_BATCH_WINDOW_MS = float(os.getenv("WAF_BATCH_WINDOW_MS", "2"))
+WAF_BATCH_MAX_SIZE = int(os.getenv("WAF_BATCH_MAX_SIZE", "64"))
+WAF_MAX_WAIT_MS = float(os.getenv("WAF_MAX_WAIT_MS", "100"))
+# Where inference runs: inline (event loop), thread or process pool. The
+# defaults differ on purpose: the shop keeps the original inline scoring,
+# the service defaults to a thread pool so its loop keeps reading socket
+# requests from every app while a batch is scored.
+WAF_EXECUTION_MODE = os.getenv("WAF_EXECUTION_MODE", "inline")
+WAF_SERVICE_EXECUTION_MODE = os.getenv("WAF_EXECUTION_MODE", "thread")
+WAF_WORKERS = int(os.getenv("WAF_WORKERS", "0")) or None
+WAF_QUEUE_SIZE = int(os.getenv("WAF_QUEUE_SIZE", "256"))
+WAF_TIMEOUT_MS = float(os.getenv("WAF_TIMEOUT_MS", "1000"))
+# Verdict cache for repeated payloads; a size of 0 disables it
+WAF_CACHE_SIZE = int(os.getenv("WAF_CACHE_SIZE", "10000"))
+WAF_CACHE_TTL_S = float(os.getenv("WAF_CACHE_TTL_S", "300"))
+WAF_CACHE_MAX_MB = float(os.getenv("WAF_CACHE_MAX_MB", "16"))
+# Benign prefilter: short plain query strings skip the models entirely
+WAF_PREFILTER = os.getenv("WAF_PREFILTER", "0") == "1"
+WAF_PREFILTER_MAX_LENGTH = int(os.getenv("WAF_PREFILTER_MAX_LENGTH", "64"))
+# When MODEL_DIR is a model registry (has versions/), poll its CURRENT file this often; 0 disables
+WAF_RELOAD_INTERVAL_S = float(os.getenv("WAF_RELOAD_INTERVAL_S", "30"))
+WAF_CANARY_MIN_ACCURACY = float(os.getenv("WAF_CANARY_MIN_ACCURACY", "0.9"))
+# Reload endpoints need "Authorization: Bearer <token>"; unset, they only answer loopback callers
+WAF_ADMIN_TOKEN = os.getenv("WAF_ADMIN_TOKEN", "")
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+
+def admin_allowed(request) -> bool:
+    # With WAF_ADMIN_TOKEN set, callers must present it; without, only local callers are let in
+    if WAF_ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {WAF_ADMIN_TOKEN}")
+    return request.client is not None and request.client.host in LOOPBACK_HOSTS
+
+
+def build_cache():
+    if WAF_CACHE_SIZE <= 0:
+        return None
+    return VerdictCache(
+        max_entries=WAF_CACHE_SIZE,
+        ttl_seconds=WAF_CACHE_TTL_S,
+        max_bytes=int(WAF_CACHE_MAX_MB * 1024 * 1024),
+    )
+
+
+def build_engine(cache=None, stage_observer=None) -> WAFEngine:
+    return WAFEngine(
+        model_dir=MODEL_DIR,
+        feature_mode=WAF_FEATURE_MODE,
+        model_format=WAF_MODEL_FORMAT,
+        cache=cache,
+        prefilter_options={"max_length": WAF_PREFILTER_MAX_LENGTH} if WAF_PREFILTER else None,
+        canary_min_accuracy=WAF_CANARY_MIN_ACCURACY,
+        stage_observer=stage_observer,
+        use_feature_plan=WAF_FEATURE_PLAN,
+    )
+
+
+def build_batcher(score_many):
+    if WAF_BATCH_WINDOW_MS <= 0:
+        return None
+    return WAFBatcher(
+        score_many,
+        window_ms=WAF_BATCH_WINDOW_MS,
+        max_batch=WAF_BATCH_MAX_SIZE,
+        max_wait_ms=WAF_MAX_WAIT_MS,
+    )
+
+
+def reload_models(engine, executor, metrics, version=None) -> dict:
+    # Blocking: loads and validates the new version, then restarts process workers on it
+    report = engine.reload(version)
+    if report["status"] == "swapped":
+        executor.models_changed()
+        metrics.set_model(engine.model_info())
+    return report
@@ -1,22 +1,24 @@
-import joblib
-import pandas as pd
 import numpy as np
 import re
 import os
 from collections import Counter
+from contextlib import contextmanager
+import threading
+import time
 import warnings
 
 import sys
 
+from app.flat_model import FLAT_MODEL_FILE, MAPPED_META_FILE, MAPPED_MODEL_DIR, FlatDetector, export_detector
+from app.keyword_matcher import KeywordMatcher
+from app.model_registry import ModelRegistry
+from app.waf_prefilter import BenignPrefilter
+from app.waf_timing import StageClock
+from app.waf_vectorizer import FEATURE_PLAN_FILE, FeaturePlan, WAFFeatureVectorizer
+
 # Suppress warnings
 warnings.filterwarnings('ignore')
 
-# Fix for pickle deserialization:
-# The models were pickled in a script where the classes were defined in '__main__'.
-# We need to alias the current module to '__main__' so pickle can find the classes.
-# However, we must be careful not to break the actual __main__ if this is imported.
-# A safer way is to inject the classes into sys.modules['__main__'] if they are missing.
-
 
 class WAFBypassFeatureExtractor:
     """Extract features specifically for WAF bypass detection"""
@@ -102,14 +104,16 @@ class WAFBypassFeatureExtractor:
         features = {}
         payload_lower = payload.lower()
 
-        for attack_type, keywords in self.attack_keywords.items():
-            for keyword in keywords:
-                features[f'kw_{attack_type}_{keyword}'] = int(keyword in payload_lower)
-                escaped_keyword = ''.join(['\\' + c if not c.isalnum() else c for c in keyword])
-                obfusc_pattern = '.*'.join(list(escaped_keyword))
-                features[f'kw_obf_{attack_type}_{keyword}'] = int(
-                    bool(re.search(obfusc_pattern, payload_lower, re.IGNORECASE))
-                )
+        # Obfuscated keywords are matched by a linear-time automaton instead of
+        # `k.*e.*y` regexes, which backtrack quadratically on crafted payloads
+        names = [(attack_type, keyword)
+                 for attack_type, keywords in self.attack_keywords.items()
+                 for keyword in keywords]
+        matcher = KeywordMatcher.for_keywords(tuple(keyword for _, keyword in names))
+        plain, obfuscated = matcher.match(payload_lower)
+        for (attack_type, keyword), is_plain, is_obfuscated in zip(names, plain, obfuscated):
+            features[f'kw_{attack_type}_{keyword}'] = is_plain
+            features[f'kw_obf_{attack_type}_{keyword}'] = is_obfuscated
 
         features['path_dotdot_present'] = int(bool(re.search(r'\\.\\./[\\/\\\\]', payload)))
         features['path_encoded_present'] = int(bool(re.search(r'%2e%2e', payload, re.IGNORECASE)))
@@ -130,7 +134,8 @@ class WAFBypassFeatureExtractor:
 
     def extract_all_features(self, payload: str) -> dict:
         features = {}
-        if pd.isna(payload):
+        # Same cases as pd.isna() for a scalar, without importing pandas
+        if payload is None or (isinstance(payload, float) and payload != payload):
             payload = ""
         payload = str(payload)
 
@@ -142,109 +147,407 @@ class WAFBypassFeatureExtractor:
 
 class WAFBypassDetector:
     """Multi-stage detector for WAF bypasses"""
+    STAGES = ('scale', 'anomaly', 'ensemble')
+
     def __init__(self):
         self.scaler = None
         self.anomaly_detector = None
         self.ensemble = None
         self.is_trained = False
 
-    def predict(self, X):
+    def predict(self, X, timings=None):
         if not self.is_trained:
             pass 
 
+        clock = StageClock(timings)
         X_scaled = self.scaler.transform(X)
+        clock.lap('scale')
         anomaly_pred = self.anomaly_detector.predict(X_scaled)
         anomaly_flags = (anomaly_pred == -1).astype(int)
+        clock.lap('anomaly')
         ensemble_pred = self.ensemble.predict(X_scaled)
         ensemble_proba = self.ensemble.predict_proba(X_scaled)[:, 1]
+        clock.lap('ensemble')
         final_pred = np.maximum(anomaly_flags, ensemble_pred)
         return final_pred, ensemble_proba
 
+# Feature columns the shipped models were trained on, in order
+TRAIN_COLUMNS = [
+        'enc_url_encoding_count', 'enc_url_encoding_present', 'enc_unicode_count',
+        'enc_unicode_present', 'enc_hex_encoding_count', 'enc_hex_encoding_present',
+        'enc_hex_escape_count', 'enc_hex_escape_present', 'enc_octal_encoding_count',
+        'enc_octal_encoding_present', 'enc_html_entity_count',
+        'enc_html_entity_present', 'enc_double_encoding_count',
+        'enc_double_encoding_present', 'enc_layers', 'enc_multi_layer',
+        'obf_comment_injection_count', 'obf_comment_hash_count',
+        'obf_whitespace_abuse_count', 'obf_null_bytes_count',
+        'obf_null_bytes_hex_count', 'obf_concatenation_count',
+        'obf_concat_keyword_count', 'payload_entropy', 'charset_mixed',
+        'case_variation', 'kw_sqli_union', 'kw_obf_sqli_union', 'kw_sqli_select',
+        'kw_obf_sqli_select', 'kw_sqli_insert', 'kw_obf_sqli_insert',
+        'kw_sqli_delete', 'kw_obf_sqli_delete', 'kw_sqli_drop', 'kw_obf_sqli_drop',
+        'kw_sqli_update', 'kw_obf_sqli_update', 'kw_sqli_exec', 'kw_obf_sqli_exec',
+        'kw_sqli_execute', 'kw_obf_sqli_execute', 'kw_sqli_from', 'kw_obf_sqli_from',
+        'kw_sqli_where', 'kw_obf_sqli_where', 'kw_xss_script', 'kw_obf_xss_script',
+        'kw_xss_alert', 'kw_obf_xss_alert', 'kw_xss_onerror', 'kw_obf_xss_onerror',
+        'kw_xss_onload', 'kw_obf_xss_onload', 'kw_xss_eval', 'kw_obf_xss_eval',
+        'kw_xss_iframe', 'kw_obf_xss_iframe', 'kw_xss_svg', 'kw_obf_xss_svg',
+        'kw_xss_img', 'kw_obf_xss_img', 'kw_xss_onclick', 'kw_obf_xss_onclick',
+        'kw_xss_onmouseover', 'kw_obf_xss_onmouseover', 'kw_path_traversal_etc/passwd',
+        'kw_obf_path_traversal_etc/passwd', 'kw_path_traversal_win.ini',
+        'kw_obf_path_traversal_win.ini', 'kw_path_traversal_dotdot',
+        'kw_obf_path_traversal_dotdot', 'kw_command_injection_cat',
+        'kw_obf_command_injection_cat', 'kw_command_injection_ls',
+        'kw_obf_command_injection_ls', 'kw_command_injection_wget',
+        'kw_obf_command_injection_wget', 'kw_command_injection_curl',
+        'kw_obf_command_injection_curl', 'kw_command_injection_bash',
+        'kw_obf_command_injection_bash', 'path_dotdot_present', 'path_encoded_present',
+        'length', 'word_count', 'special_char_ratio', 'digit_ratio', 'alpha_ratio',
+        'char_60', 'char_62', 'char_34', 'char_39', 'char_59', 'char_47', 'char_92',
+        'char_40', 'char_41', 'char_123', 'char_125', 'char_91', 'char_93'
+]
+
+NOT_LOADED_RESULT = {'is_attack': False, 'confidence': 0.0, 'error': 'Models not loaded'}
+
+
+@contextmanager
+def _pickled_main_aliases():
+    # The models were pickled from a training script, so pickle looks their
+    # classes up in __main__. Expose them there only while unpickling and
+    # leave the real __main__ as it was afterwards.
+    main = sys.modules['__main__']
+    added = [name for name in ('WAFBypassDetector', 'WAFBypassFeatureExtractor') if not hasattr(main, name)]
+    for name in added:
+        setattr(main, name, globals()[name])
+    try:
+        yield
+    finally:
+        for name in added:
+            delattr(main, name)
+
+
+class ModelBundle:
+    """
+    One loaded model version: the detector, its feature extractor and
+    everything derived from them.
+
+    Never modified after construction. The engine replaces whole bundles, and
+    every request reads the bundle once, so a reload can never hand a request
+    a detector from one version and a vectorizer from another.
+    """
+
+    def __init__(self, detector, feature_extractor, columns, version=None, prefilter=None, load_seconds=0.0,
+                 model_format=None, feature_plan=None):
+        self.detector = detector
+        self.feature_extractor = feature_extractor
+        self.columns = list(columns)
+        self.feature_plan = feature_plan
+        self.vectorizer = WAFFeatureVectorizer(feature_extractor, self.columns, plan=feature_plan)
+        self.prefilter = prefilter
+        self.version = version
+        self.model_format = model_format
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    def info(self) -> dict:
+        return {
+            'version': self.version,
+            'detector': type(self.detector).__name__,
+            'format': self.model_format,
+            'computed_features': self.vectorizer.n_computed,
+            'features': self.vectorizer.n_features,
+            'load_seconds': self.load_seconds,
+            'loaded_at': self.loaded_at,
+        }
+
+
 class WAFEngine:
-    def __init__(self, model_dir='.'):
+    # feature_mode: 'vector' fills a NumPy row with WAFFeatureVectorizer,
+    # 'dict' keeps the original extract_all_features + DataFrame path.
+    FEATURE_MODES = ('vector', 'dict')
+    # model_format: 'pickle' unpickles the sklearn models, 'flat' loads the
+    # NumPy export written by tools/export_flat_model.py (no sklearn, pandas
+    # or joblib needed), 'mapped' memory-maps the per-array export so worker
+    # processes share one copy of the trees, 'auto' picks the first of
+    # mapped, flat, pickle that the model dir has.
+    MODEL_FORMATS = ('auto', 'pickle', 'flat', 'mapped')
+    # A feature_plan.json next to the models (tools/feature_plan.py) limits
+    # extraction to the columns they split on, unless use_feature_plan is off.
+
+    def __init__(self, model_dir='.', feature_mode='vector', cache=None, prefilter_options=None,
+                 model_format='auto', version=None, canary_min_accuracy=0.9, stage_observer=None,
+                 use_feature_plan=True):
+        if feature_mode not in self.FEATURE_MODES:
+            raise ValueError(f"Unknown feature_mode {feature_mode!r}, expected one of {self.FEATURE_MODES}")
+        if model_format not in self.MODEL_FORMATS:
+            raise ValueError(f"Unknown model_format {model_format!r}, expected one of {self.MODEL_FORMATS}")
         self.model_dir = model_dir
-        self.detector = None
-        self.feature_extractor = None
-        self.X_train_columns = [
-            'enc_url_encoding_count', 'enc_url_encoding_present', 'enc_unicode_count',
-            'enc_unicode_present', 'enc_hex_encoding_count', 'enc_hex_encoding_present',
-            'enc_hex_escape_count', 'enc_hex_escape_present', 'enc_octal_encoding_count',
-            'enc_octal_encoding_present', 'enc_html_entity_count',
-            'enc_html_entity_present', 'enc_double_encoding_count',
-            'enc_double_encoding_present', 'enc_layers', 'enc_multi_layer',
-            'obf_comment_injection_count', 'obf_comment_hash_count',
-            'obf_whitespace_abuse_count', 'obf_null_bytes_count',
-            'obf_null_bytes_hex_count', 'obf_concatenation_count',
-            'obf_concat_keyword_count', 'payload_entropy', 'charset_mixed',
-            'case_variation', 'kw_sqli_union', 'kw_obf_sqli_union', 'kw_sqli_select',
-            'kw_obf_sqli_select', 'kw_sqli_insert', 'kw_obf_sqli_insert',
-            'kw_sqli_delete', 'kw_obf_sqli_delete', 'kw_sqli_drop', 'kw_obf_sqli_drop',
-            'kw_sqli_update', 'kw_obf_sqli_update', 'kw_sqli_exec', 'kw_obf_sqli_exec',
-            'kw_sqli_execute', 'kw_obf_sqli_execute', 'kw_sqli_from', 'kw_obf_sqli_from',
-            'kw_sqli_where', 'kw_obf_sqli_where', 'kw_xss_script', 'kw_obf_xss_script',
-            'kw_xss_alert', 'kw_obf_xss_alert', 'kw_xss_onerror', 'kw_obf_xss_onerror',
-            'kw_xss_onload', 'kw_obf_xss_onload', 'kw_xss_eval', 'kw_obf_xss_eval',
-            'kw_xss_iframe', 'kw_obf_xss_iframe', 'kw_xss_svg', 'kw_obf_xss_svg',
-            'kw_xss_img', 'kw_obf_xss_img', 'kw_xss_onclick', 'kw_obf_xss_onclick',
-            'kw_xss_onmouseover', 'kw_obf_xss_onmouseover', 'kw_path_traversal_etc/passwd',
-            'kw_obf_path_traversal_etc/passwd', 'kw_path_traversal_win.ini',
-            'kw_obf_path_traversal_win.ini', 'kw_path_traversal_dotdot',
-            'kw_obf_path_traversal_dotdot', 'kw_command_injection_cat',
-            'kw_obf_command_injection_cat', 'kw_command_injection_ls',
-            'kw_obf_command_injection_ls', 'kw_command_injection_wget',
-            'kw_obf_command_injection_wget', 'kw_command_injection_curl',
-            'kw_obf_command_injection_curl', 'kw_command_injection_bash',
-            'kw_obf_command_injection_bash', 'path_dotdot_present', 'path_encoded_present',
-            'length', 'word_count', 'special_char_ratio', 'digit_ratio', 'alpha_ratio',
-            'char_60', 'char_62', 'char_34', 'char_39', 'char_59', 'char_47', 'char_92',
-            'char_40', 'char_41', 'char_123', 'char_125', 'char_91', 'char_93'
-        ]
-        self.load_models()
-
-    def load_models(self):
+        self.feature_mode = feature_mode
+        self.model_format = model_format
+        self.use_feature_plan = use_feature_plan
+        # Optional VerdictCache; cleared whenever models are (re)loaded
+        self.cache = cache
+        # BenignPrefilter options; when set, a prefilter built from the loaded
+        # extractor's keywords clears obviously benign payloads without the models
+        self.prefilter_options = prefilter_options
+        # A model_dir with a versions/ directory is a ModelRegistry; otherwise
+        # the model files sit directly in model_dir and there is one version
+        self.registry = ModelRegistry(model_dir) if ModelRegistry.is_registry(model_dir) else None
+        # Labeled canary payloads a new version must classify at least this well
+        self.canary_min_accuracy = canary_min_accuracy
+        # Called as stage_observer(timings, rows) after every batch that
+        # reached the models, with the seconds spent per stage (see analyze_many)
+        self.stage_observer = stage_observer
+        self.bundle = None
+        self._reload_lock = threading.Lock()
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_reload = None
+        self.load_models(version)
+
+    # The serving bundle's parts, for callers that only read them
+    @property
+    def detector(self):
+        return self.bundle.detector if self.bundle else None
+
+    @property
+    def feature_extractor(self):
+        return self.bundle.feature_extractor if self.bundle else None
+
+    @property
+    def vectorizer(self):
+        return self.bundle.vectorizer if self.bundle else None
+
+    @property
+    def prefilter(self):
+        return self.bundle.prefilter if self.bundle else None
+
+    @property
+    def version(self):
+        return self.bundle.version if self.bundle else None
+
+    @property
+    def X_train_columns(self):
+        return self.bundle.columns if self.bundle else TRAIN_COLUMNS
+
+    def load_models(self, version=None):
+        """Load the models at startup; if that fails the engine runs without them."""
         try:
-            det_path = os.path.join(self.model_dir, 'waf_bypass_detector_complete.pkl')
-            feat_path = os.path.join(self.model_dir, 'waf_feature_extractor.pkl')
-
-            # Explicit import so pickle resolves correctly
-            # We need to inject these into __main__ because the model was pickled that way
-            import sys
-            import app.waf_detector as current_module
-            
-            if not hasattr(sys.modules['__main__'], 'WAFBypassDetector'):
-                sys.modules['__main__'].WAFBypassDetector = current_module.WAFBypassDetector
-            if not hasattr(sys.modules['__main__'], 'WAFBypassFeatureExtractor'):
-                sys.modules['__main__'].WAFBypassFeatureExtractor = current_module.WAFBypassFeatureExtractor
-
-            self.detector = joblib.load(det_path)
-            self.feature_extractor = joblib.load(feat_path)
-
-            if not isinstance(self.detector, WAFBypassDetector):
-                raise TypeError("Loaded detector is not WAFBypassDetector")
-
-            self.detector.is_trained = True
-            print(f"[WAF] Models loaded successfully from {self.model_dir}", flush=True)
-
+            bundle = self._load_bundle(version)
+            print(f"[WAF] Models loaded successfully from {self.model_dir} "
+                  f"({type(bundle.detector).__name__}, version {bundle.version})", flush=True)
         except Exception as e:
             print(f"[WAF] Model loading failed: {e}", flush=True)
-            self.detector = None
-            self.feature_extractor = None
+            bundle = None
+        self.install(bundle)
+
+    def install(self, bundle):
+        """Swap in a bundle (None unloads) and drop verdicts made by the old one."""
+        self.bundle = bundle
+        if self.cache is not None:
+            self.cache.clear()
+
+    def reload(self, version=None) -> dict:
+        """
+        Load a model version next to the serving one and swap it in.
+
+        The new version (default: the registry's current one) is loaded and
+        checked against its checksums and canary corpus while the old one keeps
+        serving; only then is it installed, in a single assignment. On any
+        failure the serving models stay as they are. Returns a report of what
+        happened, also kept in `last_reload`. Asking a registry for the
+        version already serving does nothing and reports 'unchanged'.
+        """
+        with self._reload_lock:
+            previous = self.version
+            if self.registry is not None and previous is not None:
+                try:
+                    requested = version or self.registry.current_version()
+                except (OSError, ValueError):
+                    requested = version
+                if requested == previous:
+                    return {'status': 'unchanged', 'version': previous, 'at': time.time()}
+            try:
+                bundle = self._load_bundle(version)
+                canary = self._validate(bundle)
+            except Exception as e:
+                self.failed_reloads += 1
+                report = {'status': 'failed', 'version': version, 'serving_version': previous, 'error': str(e)}
+                print(f"[WAF] Model reload failed, still serving version {previous}: {e}", flush=True)
+            else:
+                self.install(bundle)
+                self.reloads += 1
+                report = {
+                    'status': 'swapped',
+                    'version': bundle.version,
+                    'previous_version': previous,
+                    'load_seconds': bundle.load_seconds,
+                    'canary': canary,
+                }
+                print(f"[WAF] Model version {bundle.version} live (was {previous}), "
+                      f"loaded in {bundle.load_seconds:.3f}s", flush=True)
+            report['at'] = time.time()
+            self.last_reload = report
+            return report
+
+    def model_info(self) -> dict:
+        return {
+            **(self.bundle.info() if self.bundle else {'version': None, 'detector': None}),
+            'registry': self.registry.root if self.registry else None,
+            'reloads': self.reloads,
+            'failed_reloads': self.failed_reloads,
+            'last_reload': self.last_reload,
+        }
 
-    def analyze(self, payload: str):
-        if not self.detector or not self.feature_extractor:
-            return {'is_attack': False, 'confidence': 0.0, 'error': 'Models not loaded'}
+    def _load_bundle(self, version=None) -> ModelBundle:
+        start = time.perf_counter()
+        if self.registry is not None:
+            version = version or self.registry.current_version()
+            directory = self.registry.verify(version)
+        elif version is not None:
+            raise ValueError(f"{self.model_dir} is not a model registry, cannot load version {version!r}")
+        else:
+            directory = self.model_dir
 
+        model_format = self._resolve_model_format(directory)
+        if model_format == 'mapped':
+            detector = FlatDetector.load_mapped(os.path.join(directory, MAPPED_MODEL_DIR))
+        elif model_format == 'flat':
+            detector = FlatDetector.load(os.path.join(directory, FLAT_MODEL_FILE))
+        else:
+            detector, feature_extractor = self._load_pickled_models(directory)
+        if isinstance(detector, FlatDetector):
+            feature_extractor = detector.make_extractor()
+            columns = detector.columns
+        else:
+            columns = TRAIN_COLUMNS
+
+        feature_plan = None
+        plan_path = os.path.join(directory, FEATURE_PLAN_FILE)
+        if self.use_feature_plan and os.path.exists(plan_path):
+            feature_plan = FeaturePlan.load(plan_path)
+            if feature_plan.columns != list(columns):
+                print(f"[WAF] Ignoring {plan_path}: its columns do not match the model's", flush=True)
+                feature_plan = None
+            elif feature_plan.meta.get('model_fingerprint') != self._fingerprint(detector, feature_extractor, columns):
+                # Left behind by a retrain or re-export: the new trees may split on columns it skips
+                print(f"[WAF] Ignoring {plan_path}: it was not derived from these models", flush=True)
+                feature_plan = None
+
+        prefilter = None
+        if self.prefilter_options is not None:
+            prefilter = BenignPrefilter.for_extractor(feature_extractor, **self.prefilter_options)
+        return ModelBundle(detector, feature_extractor, columns, version=version, prefilter=prefilter,
+                           load_seconds=time.perf_counter() - start, model_format=model_format,
+                           feature_plan=feature_plan)
+
+    @staticmethod
+    def _fingerprint(detector, feature_extractor, columns):
+        if isinstance(detector, FlatDetector):
+            return detector.fingerprint()
+        try:
+            return export_detector(detector, feature_extractor, columns).fingerprint()
+        except Exception:
+            return None
+
+    def _resolve_model_format(self, directory):
+        if self.model_format != 'auto':
+            return self.model_format
+        if os.path.exists(os.path.join(directory, MAPPED_MODEL_DIR, MAPPED_META_FILE)):
+            return 'mapped'
+        if os.path.exists(os.path.join(directory, FLAT_MODEL_FILE)):
+            return 'flat'
+        return 'pickle'
+
+    @staticmethod
+    def _load_pickled_models(directory):
+        import joblib
+
+        det_path = os.path.join(directory, 'waf_bypass_detector_complete.pkl')
+        feat_path = os.path.join(directory, 'waf_feature_extractor.pkl')
+
+        with _pickled_main_aliases():
+            detector = joblib.load(det_path)
+            feature_extractor = joblib.load(feat_path)
+
+        if not isinstance(detector, WAFBypassDetector):
+            raise TypeError("Loaded detector is not WAFBypassDetector")
+
+        detector.is_trained = True
+        return detector, feature_extractor
+
+    def _validate(self, bundle):
+        """Score the version's canary corpus with the new bundle; raise if it falls short."""
+        corpus = self.registry.canary(bundle.version) if self.registry else None
+        if not corpus:
+            return None
+        results = self._score_many(bundle, [payload for payload, _ in corpus])
+        errors = sum('error' in result for result in results)
+        if errors:
+            raise ValueError(f"{errors} of {len(corpus)} canary payloads failed to score")
+
+        labeled = [(result['is_attack'], label) for result, (_, label) in zip(results, corpus) if label is not None]
+        accuracy = sum(int(is_attack) == label for is_attack, label in labeled) / len(labeled) if labeled else None
+        if accuracy is not None and accuracy < self.canary_min_accuracy:
+            raise ValueError(f"canary accuracy {accuracy:.3f} below {self.canary_min_accuracy}")
+        return {'payloads': len(corpus), 'labeled': len(labeled), 'accuracy': accuracy}
+
+    def analyze(self, payload: str, include_features: bool = False):
+        bundle = self.bundle
+        if bundle is None:
+            return dict(NOT_LOADED_RESULT)
+
+        if not include_features:
+            screened = self._screen(bundle, payload)
+            if screened is not None:
+                return screened
+
+        if self.feature_mode == 'vector':
+            result = self._analyze_vector(bundle, payload, include_features)
+        else:
+            result = self._analyze_dict(bundle, payload)
+
+        if not include_features:
+            self._remember(bundle, payload, result)
+        return result
+
+    def screen(self, payload):
+        """Verdict available without running the models (prefilter or cache), or None."""
+        return self._screen(self.bundle, payload)
+
+    def _screen(self, bundle, payload):
+        if bundle is not None and bundle.prefilter is not None and bundle.prefilter.is_benign(payload):
+            return {'is_attack': False, 'confidence': 0.0, 'source': 'prefilter'}
+        if self.cache is not None:
+            cached = self.cache.get(payload)
+            if cached is not None:
+                cached['source'] = 'cache'
+                return cached
+        return None
+
+    def remember(self, payload, result, bundle=None):
+        """Cache a verdict; one made by `bundle` is dropped if that bundle is no longer serving."""
+        if self.cache is not None and (bundle is None or bundle is self.bundle):
+            self.cache.put(payload, result)
+
+    def _remember(self, bundle, payload, result):
+        # A verdict from a bundle that was swapped out meanwhile is not cached
+        self.remember(payload, result, bundle)
+
+    def _analyze_dict(self, bundle, payload: str):
         try:
-            features = self.feature_extractor.extract_all_features(payload)
+            import pandas as pd
+
+            features = bundle.feature_extractor.extract_all_features(payload)
             features_df = pd.DataFrame([features])
 
-            missing_cols = set(self.X_train_columns) - set(features_df.columns)
+            missing_cols = set(bundle.columns) - set(features_df.columns)
             for col in missing_cols:
                 features_df[col] = 0
 
-            features_df = features_df[self.X_train_columns]
+            features_df = features_df[bundle.columns]
             
-            prediction, probability_array = self.detector.predict(features_df)
+            prediction, probability_array = bundle.detector.predict(features_df)
             
             is_attack = bool(prediction[0] == 1)
             confidence = float(probability_array[0])
@@ -252,8 +555,114 @@ class WAFEngine:
             return {
                 'is_attack': is_attack,
                 'confidence': confidence,
+                'source': 'model',
                 'features': features
             }
         except Exception as e:
             print(f"WAF Analysis Error: {e}")
             return {'is_attack': False, 'confidence': 0.0, 'error': str(e)}
+
+    def _analyze_vector(self, bundle, payload: str, include_features: bool):
+        try:
+            row = bundle.vectorizer.transform(payload)
+            result = self._predict_row(bundle, row, raise_errors=True)
+            if include_features:
+                result['features'] = dict(zip(bundle.columns, row.tolist()))
+            return result
+        except Exception as e:
+            print(f"WAF Analysis Error: {e}")
+            return {'is_attack': False, 'confidence': 0.0, 'error': str(e)}
+
+    def analyze_many(self, payloads, timings=None):
+        """
+        Score a batch of payloads with one call into each detector stage.
+
+        Features for all payloads go into a single matrix, so the scaler, the
+        anomaly detector and the ensemble each run once per batch instead of
+        once per row. Results come back in input order with the same shape as
+        `analyze`. A payload whose features cannot be extracted gets its own
+        error result; if the batched prediction itself fails, the rows are
+        rescored one by one so a single bad row cannot fail the whole batch.
+        Payloads cleared by the prefilter or found in the cache are answered
+        without touching the models.
+
+        When `timings` is a dict, the seconds spent in each model stage
+        ('extract', then the detector's `STAGES`, or 'predict' for a detector
+        without them) are added to it; otherwise they go to `stage_observer`,
+        if one is set.
+        """
+        payloads = list(payloads)
+        bundle = self.bundle
+        if bundle is None:
+            return [dict(NOT_LOADED_RESULT) for _ in payloads]
+
+        results = [self._screen(bundle, payload) for payload in payloads]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        observed = timings is None and self.stage_observer is not None
+        if observed:
+            timings = {}
+        scored = self._score_many(bundle, [payloads[i] for i in pending], timings)
+        if observed and timings:
+            self.stage_observer(timings, len(pending))
+        for i, result in zip(pending, scored):
+            results[i] = result
+            self._remember(bundle, payloads[i], result)
+        return results
+
+    def _score_many(self, bundle, payloads, timings=None):
+        """Model verdicts for every payload, no prefilter or cache involved."""
+        if self.feature_mode != 'vector':
+            return [self._analyze_dict(bundle, payload) for payload in payloads]
+
+        clock = StageClock(timings)
+        results = [None] * len(payloads)
+        X = np.zeros((len(payloads), bundle.vectorizer.n_features), dtype=np.float64)
+        valid = []
+        for i, payload in enumerate(payloads):
+            try:
+                bundle.vectorizer.transform_into(payload, X[i])
+                valid.append(i)
+            except Exception as e:
+                print(f"WAF Analysis Error: {e}")
+                results[i] = {'is_attack': False, 'confidence': 0.0, 'error': str(e)}
+
+        if not valid:
+            return results
+        if len(valid) < len(payloads):
+            X = X[valid]
+        clock.lap('extract')
+
+        try:
+            if timings is not None and getattr(bundle.detector, 'STAGES', None):
+                prediction, probability_array = bundle.detector.predict(X, timings=timings)
+            else:
+                prediction, probability_array = bundle.detector.predict(X)
+                clock.lap('predict')
+            for j, i in enumerate(valid):
+                results[i] = {
+                    'is_attack': bool(prediction[j] == 1),
+                    'confidence': float(probability_array[j]),
+                    'source': 'model'
+                }
+        except Exception as e:
+            print(f"WAF Batch Analysis Error: {e}, rescoring rows individually")
+            for row, i in zip(X, valid):
+                results[i] = self._predict_row(bundle, row)
+        return results
+
+    def _predict_row(self, bundle, row, raise_errors=False):
+        try:
+            prediction, probability_array = bundle.detector.predict(row.reshape(1, -1))
+            return {
+                'is_attack': bool(prediction[0] == 1),
+                'confidence': float(probability_array[0]),
+                'source': 'model'
+            }
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"WAF Analysis Error: {e}")
+            return {'is_attack': False, 'confidence': 0.0, 'error': str(e)}
@@ -0,0 +1,204 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.waf_detector import WAFEngine
+
+
+# Not verdicts on the payload: the middleware applies the route's shed policy instead
+QUEUE_FULL_RESULT = {'is_attack': False, 'confidence': 0.0, 'error': 'WAF queue full', 'unscored': True}
+TIMEOUT_RESULT = {'is_attack': False, 'confidence': 0.0, 'error': 'WAF verdict timed out', 'unscored': True}
+
+# Engine owned by each process-pool worker, loaded once by the pool initializer
+_worker_engine = None
+
+
+def _init_worker(model_dir, feature_mode, model_format, version, use_feature_plan):
+    global _worker_engine
+    _worker_engine = WAFEngine(model_dir=model_dir, feature_mode=feature_mode, model_format=model_format,
+                               version=version, use_feature_plan=use_feature_plan)
+
+
+def _worker_analyze_many(payloads, submitted_at):
+    # Stage timings and queue wait travel back with the verdicts to the parent
+    queue_wait = time.monotonic() - submitted_at
+    timings = {}
+    return _worker_engine.analyze_many(payloads, timings=timings), timings, queue_wait
+
+
+def _thread_analyze_many(engine, payloads, submitted_at):
+    queue_wait = time.monotonic() - submitted_at
+    return engine.analyze_many(payloads), queue_wait
+
+
+def _worker_ready():
+    return _worker_engine is not None and _worker_engine.detector is not None
+
+
+class WAFExecutor:
+    """
+    Runs WAF inference inline, on a thread pool or on a process pool.
+
+    'inline' scores on the calling event loop (the original behaviour).
+    'thread' hands batches to a thread pool sharing the in-process engine, so
+    the loop keeps serving other requests while regex and sklearn work runs.
+    'process' uses worker processes that each load the models once at pool
+    start, which also takes the work out from under the GIL.
+
+    At most `max_queue` submissions may be outstanding in the pool. Waiting
+    for a slot and scoring share one `timeout_ms` budget; a caller that runs
+    out of it gets an error verdict marked 'unscored' instead of waiting
+    without bound (a timed out batch still finishes in its worker, its result
+    is just discarded).
+
+    `queue_observer(seconds)`, when set, is called on the event loop with how
+    long each pooled batch waited for a slot and a worker (the whole budget
+    for batches that were rejected or timed out).
+    """
+
+    MODES = ('inline', 'thread', 'process')
+
+    def __init__(self, engine: WAFEngine, mode: str = 'inline', workers: int = None,
+                 max_queue: int = 256, timeout_ms: float = 1000.0, queue_observer=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown WAF execution mode {mode!r}, expected one of {self.MODES}")
+        self.engine = engine
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout_ms / 1000.0
+        self.queue_observer = queue_observer
+        self._pool = None
+        # The engine bundle the process pool's workers loaded
+        self._pool_bundle = None
+        self._slots = None
+
+        self.in_flight = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def start(self):
+        if self.mode == 'thread':
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='waf')
+        elif self.mode == 'process':
+            self._pool = self._start_process_pool()
+        print(f"[WAF] Execution mode: {self.mode} ({self.workers} workers)" if self._pool
+              else f"[WAF] Execution mode: {self.mode}", flush=True)
+
+    def _start_process_pool(self):
+        self._pool_bundle = self.engine.bundle
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.engine.model_dir, self.engine.feature_mode, self.engine.model_format,
+                      self.engine.version, self.engine.use_feature_plan),
+        )
+        # Bring every worker up now so the first requests don't pay for model loading
+        for future in [pool.submit(_worker_ready) for _ in range(self.workers)]:
+            if not future.result():
+                print("[WAF] Process worker started without models", flush=True)
+        return pool
+
+    def models_changed(self):
+        """
+        Follow a model reload of the engine.
+
+        Thread workers share the engine and need nothing. Process workers hold
+        their own copy of the models, so a new pool is started on the engine's
+        new version and fully warmed before it replaces the old one; batches
+        already running in the old pool finish there. Blocks while the new
+        workers load, so call it off the event loop.
+        """
+        if self.mode != 'process' or self._pool is None:
+            return
+        old_pool, self._pool = self._pool, self._start_process_pool()
+        old_pool.shutdown(wait=False)
+        print(f"[WAF] Process workers restarted on model version {self.engine.version}", flush=True)
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def analyze(self, payload: str) -> dict:
+        return (await self.analyze_many([payload]))[0]
+
+    async def analyze_many(self, payloads) -> list:
+        payloads = list(payloads)
+        if self._pool is None:
+            return self.engine.analyze_many(payloads)
+        if self.mode == 'process':
+            return await self._analyze_screened(payloads)
+        return await self._submit(payloads)
+
+    async def _analyze_screened(self, payloads):
+        # Process workers have no view of the parent's prefilter and verdict
+        # cache, so those answers are given here and only the rest cross the
+        # process boundary
+        results = [self.engine.screen(payload) for payload in payloads]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            # After a reload installs new models the old pool serves until the new one is warm;
+            # its verdicts come from the old models and must not outlive them in the cache
+            bundle = self._pool_bundle
+            scored = await self._submit([payloads[i] for i in misses])
+            for i, result in zip(misses, scored):
+                results[i] = result
+                if 'error' not in result:
+                    self.engine.remember(payloads[i], result, bundle)
+        return results
+
+    async def _submit(self, payloads):
+
+        # The semaphore is created lazily so it binds to the serving loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        submitted_at = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            self._observe_queue(self.timeout)
+            return [dict(QUEUE_FULL_RESULT) for _ in payloads]
+
+        self.in_flight += 1
+        try:
+            if self.mode == 'process':
+                future = loop.run_in_executor(self._pool, _worker_analyze_many, payloads, submitted_at)
+            else:
+                future = loop.run_in_executor(self._pool, _thread_analyze_many, self.engine, payloads, submitted_at)
+            # Time spent waiting for a slot counts against the same budget
+            if self.mode == 'process':
+                results, timings, queue_wait = await asyncio.wait_for(future, max(deadline - loop.time(), 0))
+                if timings and self.engine.stage_observer is not None:
+                    self.engine.stage_observer(timings, len(payloads))
+            else:
+                results, queue_wait = await asyncio.wait_for(future, max(deadline - loop.time(), 0))
+            self._observe_queue(queue_wait)
+            return results
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._observe_queue(self.timeout)
+            return [dict(TIMEOUT_RESULT) for _ in payloads]
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def _observe_queue(self, seconds):
+        if self.queue_observer is not None:
+            self.queue_observer(seconds)
+
+    def stats(self) -> dict:
+        return {
+            'mode': self.mode,
+            'workers': self.workers if self._pool else 0,
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,79 @@
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+from app.waf_metrics import verdict_outcome
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking the request."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class PayloadLog:
+    """
+    Sampled, asynchronous logging of inspected payloads.
+
+    Blocked and errored fields are logged with probability `blocked_rate`,
+    passed ones with `sample_rate` (0.01 logs one in a hundred). Payloads
+    are cut to `max_chars` and repr()'d so control characters cannot forge
+    log lines. Records go through a bounded queue to a listener thread that
+    writes them with the handlers of the "ecommerce" logger, so a request
+    never waits on log I/O; when the queue is full the record is dropped.
+    """
+
+    def __init__(self, sample_rate: float = 0.01, blocked_rate: float = 1.0, max_chars: int = 256,
+                 max_queue: int = 10000, logger_name: str = 'ecommerce.waf.payloads'):
+        self.sample_rate = sample_rate
+        self.blocked_rate = blocked_rate
+        self.max_chars = max_chars
+        self._handler = _DroppingQueueHandler(queue.Queue(maxsize=max_queue))
+        self.logger = logging.getLogger(logger_name)
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self._listener = None
+        self.logged = 0
+
+    def start(self, handlers=None):
+        """Start the writer thread; `handlers` default to those of the "ecommerce" logger or the root logger."""
+        if handlers is None:
+            handlers = logging.getLogger('ecommerce').handlers or logging.getLogger().handlers
+        self._listener = QueueListener(self._handler.queue, *handlers, respect_handler_level=True)
+        self._listener.start()
+        self.logger.addHandler(self._handler)
+
+    def stop(self):
+        self.logger.removeHandler(self._handler)
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def log_request(self, client_ip, path, fields, verdicts):
+        for field, verdict in zip(fields, verdicts):
+            outcome = verdict_outcome(verdict)
+            rate = self.sample_rate if outcome == 'passed' else self.blocked_rate
+            if rate <= 0 or (rate < 1 and random.random() >= rate):
+                continue
+            payload = field if len(field) <= self.max_chars else field[:self.max_chars] + '...'
+            self.logged += 1
+            self.logger.info(
+                "WAF %s %s %s source=%s confidence=%.3f payload=%r",
+                outcome, client_ip, path, verdict.get('source') or 'none', verdict.get('confidence') or 0.0, payload)
+
+    def stats(self) -> dict:
+        return {
+            'sample_rate': self.sample_rate,
+            'logged': self.logged,
+            'dropped': self._handler.dropped,
+            'queue_depth': self._handler.queue.qsize(),
+        }
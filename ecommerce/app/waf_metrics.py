@@ -0,0 +1,96 @@
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+
+# Stage calls run from tens of microseconds (scaling one row) to a second (a full batch under load)
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+INSPECTION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+PAYLOAD_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def verdict_outcome(verdict: dict) -> str:
+    if verdict.get('error'):
+        return 'errored'
+    return 'blocked' if verdict.get('is_attack') else 'passed'
+
+
+class WAFMetrics:
+    """
+    Prometheus metrics for the WAF, in a registry of their own.
+
+    - waf_stage_duration_seconds{stage}: time per model call spent in
+      feature extraction and in each detector stage (fed by the engine's
+      stage_observer, so one observation covers a whole batch)
+    - waf_batch_rows: rows per model call
+    - waf_inspection_duration_seconds: time a request waited for the
+      verdicts on all its fields, batching and queueing included
+    - waf_verdicts_total{outcome, source}: one per inspected field, outcome
+      blocked/passed/errored, source model/cache/prefilter/screen (none for
+      errors)
+    - waf_requests_total{outcome}: one per inspected request; blocked when
+      any field was, errored when a field errored and none was blocked
+    - waf_payload_bytes: size of every inspected field
+    - waf_model_info{version, format, detector}: 1 for the serving model
+    - waf_overload_level: 0 full, 1 screen, 2 shed (see OverloadController)
+    - waf_overload_transitions_total{from, to}: level changes
+    - waf_reputation_rejections_total: requests refused because their source
+      is banned (not counted as inspected)
+    - waf_reputation_bans_total: sources banned
+    """
+
+    def __init__(self, registry: CollectorRegistry = None):
+        self.registry = registry or CollectorRegistry()
+        self.stage_seconds = Histogram(
+            'waf_stage_duration_seconds', 'WAF time per model call and stage', ['stage'],
+            buckets=STAGE_BUCKETS, registry=self.registry)
+        self.batch_rows = Histogram(
+            'waf_batch_rows', 'Payloads scored per model call', buckets=BATCH_BUCKETS, registry=self.registry)
+        self.inspection_seconds = Histogram(
+            'waf_inspection_duration_seconds', 'WAF time per inspected request',
+            buckets=INSPECTION_BUCKETS, registry=self.registry)
+        self.verdicts = Counter(
+            'waf_verdicts', 'WAF verdicts per inspected field', ['outcome', 'source'], registry=self.registry)
+        self.requests = Counter(
+            'waf_requests', 'Requests inspected by the WAF', ['outcome'], registry=self.registry)
+        self.payload_bytes = Histogram(
+            'waf_payload_bytes', 'Size of inspected fields', buckets=PAYLOAD_BUCKETS, registry=self.registry)
+        self.model_info = Gauge(
+            'waf_model_info', 'Serving WAF model', ['version', 'format', 'detector'], registry=self.registry)
+        self.overload_level = Gauge(
+            'waf_overload_level', 'WAF degradation level: 0 full, 1 screen, 2 shed', registry=self.registry)
+        self.overload_transitions = Counter(
+            'waf_overload_transitions', 'WAF degradation level changes', ['from', 'to'], registry=self.registry)
+        self.reputation_rejections = Counter(
+            'waf_reputation_rejections', 'Requests refused from banned sources', registry=self.registry)
+        self.reputation_bans = Counter(
+            'waf_reputation_bans', 'Sources banned for repeated attacks', registry=self.registry)
+
+    def observe_stages(self, timings: dict, rows: int):
+        for stage, seconds in timings.items():
+            self.stage_seconds.labels(stage).observe(seconds)
+        self.batch_rows.observe(rows)
+
+    def observe_request(self, fields, verdicts, seconds: float):
+        outcomes = set()
+        for field, verdict in zip(fields, verdicts):
+            outcome = verdict_outcome(verdict)
+            outcomes.add(outcome)
+            self.verdicts.labels(outcome, verdict.get('source') or 'none').inc()
+            self.payload_bytes.observe(len(field.encode('utf-8', 'replace')))
+        self.inspection_seconds.observe(seconds)
+        for outcome in ('blocked', 'errored', 'passed'):
+            if outcome in outcomes:
+                self.requests.labels(outcome).inc()
+                break
+
+    def set_model(self, info: dict):
+        self.model_info.clear()
+        self.model_info.labels(str(info.get('version')), str(info.get('format')), str(info.get('detector'))).set(1)
+
+    def observe_overload_change(self, event: dict, level: int):
+        self.overload_level.set(level)
+        self.overload_transitions.labels(event['from'], event['to']).inc()
+
+    def render(self):
+        """(body, content type) of the exposition for GET /metrics."""
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
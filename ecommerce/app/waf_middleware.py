@@ -0,0 +1,271 @@
+import asyncio
+import json
+import time
+from collections import deque
+from urllib.parse import parse_qsl
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+
+BODY_METHODS = frozenset({"POST", "PUT", "PATCH"})
+BLOCKED_BODY = json.dumps({"detail": "Access Denied: Malicious Activity Detected"}).encode()
+SHED_BODY = json.dumps({"detail": "Service temporarily unavailable, please retry"}).encode()
+
+
+def _multipart_fields(chunks, boundary):
+    """Field values (and upload filenames) of a multipart body, parsed chunk by chunk."""
+    fields = []
+    part = {}
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, header_field=b"", header_value=b"", data=[], open=True)
+
+    def on_header_field(data, start, end):
+        part["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["header_value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["header_field"].lower()] = part["header_value"]
+        part["header_field"] = part["header_value"] = b""
+
+    def on_part_data(data, start, end):
+        part["data"].append(data[start:end])
+
+    def on_part_end():
+        part["open"] = False
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if filename is not None:
+            # Upload contents are not inspected, only the name the client gave them
+            fields.append(filename.decode("utf-8", "replace"))
+        else:
+            fields.append(b"".join(part["data"]).decode("utf-8", "replace"))
+
+    parser = MultipartParser(boundary, callbacks={
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    for chunk in chunks:
+        parser.write(chunk)
+    if part.get("open"):
+        # Body cut at the inspection cap: inspect what arrived of the last part
+        on_part_end()
+    return fields
+
+
+def _json_fields(value, fields, depth=0):
+    # Every string and number leaf of a JSON document, keys that look like data included
+    if depth > 32:
+        fields.append(json.dumps(value))
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if not key.isidentifier():
+                fields.append(key)
+            _json_fields(item, fields, depth + 1)
+    elif isinstance(value, list):
+        for item in value:
+            _json_fields(item, fields, depth + 1)
+    elif isinstance(value, str):
+        fields.append(value)
+    elif value is not None and not isinstance(value, bool):
+        fields.append(str(value))
+
+
+def body_fields(content_type: bytes, chunks, complete: bool):
+    """
+    Split a request body into the payloads to inspect.
+
+    `chunks` is the body as received (possibly cut at the inspection cap,
+    in which case `complete` is False). Form, JSON and multipart bodies
+    yield one payload per field; other text yields the body itself; binary
+    bodies yield nothing. A body that does not parse as its declared type
+    (malformed multipart, JSON nested too deeply to decode) is inspected as
+    one text payload instead.
+    """
+    media_type, options = parse_options_header(content_type or b"")
+    media_type = media_type.lower()
+
+    if media_type == b"multipart/form-data" and options.get(b"boundary"):
+        try:
+            return _multipart_fields(chunks, options[b"boundary"])
+        except MultipartParseError:
+            pass
+
+    body = b"".join(chunks)
+    if not body:
+        return []
+    text = body.decode("utf-8", "replace")
+    if media_type == b"application/x-www-form-urlencoded":
+        return [value for pair in parse_qsl(text, keep_blank_values=True) for value in pair if value]
+    if media_type == b"application/json" or media_type.endswith(b"+json"):
+        if complete:
+            try:
+                fields = []
+                _json_fields(json.loads(text), fields)
+                return fields
+            except (ValueError, RecursionError):
+                pass
+        return [text]
+    if (media_type.startswith(b"text/") or media_type in (b"", b"application/xml")
+            or media_type == b"multipart/form-data"):
+        return [text]
+    return []
+
+
+class WAFMiddleware:
+    """
+    Pure ASGI middleware running the WAF in front of the app.
+
+    Query parameters and, for POST/PUT/PATCH, up to `max_body_bytes` of the
+    body are split into fields (see `body_fields`) and each field is scored
+    by `analyze`, a coroutine taking one payload and returning a verdict
+    dict. If any field is an attack, `on_block(scope, payload, verdict)` is
+    awaited and a 403 is sent without calling the app. Otherwise the app
+    runs with the body messages already read replayed from memory, followed
+    by the rest of the body streamed from the client. Only the inspected
+    prefix of a body is ever held, never the whole upload.
+
+    At most `max_fields` fields are scored separately; the remainder is
+    joined into one last payload so a request cannot fan out without bound.
+
+    `on_inspect(scope, fields, verdicts, seconds)`, when given, is called for
+    every inspected request with the time its verdicts took (metrics and
+    payload logging); it must not block.
+
+    With an `overload` controller (see waf_overload.OverloadController),
+    each request with fields is first admitted by it: 'full' requests are
+    scored by `analyze` and their WAF time is fed back to the controller,
+    'screen' requests are scored by the cheaper `screen` coroutine instead,
+    'open' requests go to the app uninspected and 'closed' ones get a 503.
+
+    A verdict marked 'unscored' (the WAF timed out, its queue was full or
+    its service was unreachable) says nothing about the payload. A request
+    with one and no attack among its other verdicts is handled by
+    `shed_policy(path)`, the overload controller's route policy by default:
+    'closed' routes get a 503, 'open' ones go to the app.
+
+    With a `reputation` table (see waf_reputation.ReputationTable), every
+    block except those of the signature screen is recorded against the
+    client address, and requests from
+    addresses it has banned get a 403 before their query or body is even
+    read; `on_reject(scope)` is called for each of them.
+    """
+
+    def __init__(self, app, analyze, on_block=None, max_body_bytes: int = 64 * 1024, max_fields: int = 64,
+                 skip_prefixes=("/static",), on_inspect=None, overload=None, screen=None, reputation=None,
+                 on_reject=None, shed_policy=None):
+        self.app = app
+        self.analyze = analyze
+        self.on_block = on_block
+        self.on_inspect = on_inspect
+        self.overload = overload
+        self.screen = screen
+        self.reputation = reputation
+        self.on_reject = on_reject
+        self.shed_policy = shed_policy
+        self.max_body_bytes = max_body_bytes
+        self.max_fields = max_fields
+        self.skip_prefixes = tuple(skip_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        client_ip = scope["client"][0] if scope.get("client") else None
+        if self.reputation is not None and client_ip and self.reputation.check(client_ip):
+            if self.on_reject is not None:
+                self.on_reject(scope)
+            await self._send(send, 403, BLOCKED_BODY)
+            return
+
+        fields = [value for pair in parse_qsl(scope.get("query_string", b"").decode("latin-1"),
+                                              keep_blank_values=True)
+                  for value in pair if value]
+
+        buffered = deque()
+        if scope["method"] in BODY_METHODS:
+            chunks, complete = await self._read_body(receive, buffered)
+            headers = dict(scope.get("headers") or [])
+            fields.extend(body_fields(headers.get(b"content-type"), chunks, complete))
+
+        mode = 'full'
+        if fields and self.overload is not None:
+            mode = self.overload.admit(scope["path"])
+            if mode == 'closed':
+                await self._send(send, 503, SHED_BODY, [(b"retry-after", b"1")])
+                return
+
+        if fields and mode != 'open':
+            if len(fields) > self.max_fields:
+                fields = fields[:self.max_fields - 1] + [" ".join(fields[self.max_fields - 1:])]
+            analyze = self.screen if mode == 'screen' and self.screen is not None else self.analyze
+            start = time.perf_counter()
+            verdicts = await asyncio.gather(*(analyze(field) for field in fields))
+            seconds = time.perf_counter() - start
+            if mode == 'full' and self.overload is not None:
+                self.overload.observe(seconds)
+            if self.on_inspect is not None:
+                self.on_inspect(scope, fields, verdicts, seconds)
+            for field, verdict in zip(fields, verdicts):
+                if verdict.get("is_attack"):
+                    # Signature screen verdicts (load shedding) are too coarse to ban anyone on
+                    if self.reputation is not None and client_ip and verdict.get("source") != "screen":
+                        self.reputation.record_block(client_ip)
+                    if self.on_block is not None:
+                        await self.on_block(scope, field, verdict)
+                    await self._send(send, 403, BLOCKED_BODY)
+                    return
+            if any(verdict.get("unscored") for verdict in verdicts) and self._shed_policy(scope["path"]) == 'closed':
+                await self._send(send, 503, SHED_BODY, [(b"retry-after", b"1")])
+                return
+
+        async def replay():
+            if buffered:
+                return buffered.popleft()
+            return await receive()
+
+        await self.app(scope, replay if buffered else receive, send)
+
+    def _shed_policy(self, path):
+        if self.shed_policy is not None:
+            return self.shed_policy(path)
+        if self.overload is not None:
+            return self.overload.policy(path)
+        return 'open'
+
+    async def _read_body(self, receive, buffered):
+        """Read body messages until the cap; they are kept in `buffered` for replay."""
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body and size < self.max_body_bytes:
+            message = await receive()
+            buffered.append(message)
+            if message["type"] != "http.request":
+                # Client went away; the app will see the disconnect on replay
+                return chunks, False
+            body = message.get("body", b"")
+            if body:
+                chunks.append(body[:self.max_body_bytes - size])
+                size += len(body)
+            more_body = message.get("more_body", False)
+        return chunks, not more_body and size <= self.max_body_bytes
+
+    @staticmethod
+    async def _send(send, status, body, headers=()):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                        *headers],
+        })
+        await send({"type": "http.response.body", "body": body})
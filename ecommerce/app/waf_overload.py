@@ -0,0 +1,182 @@
+import random
+import time
+from collections import deque
+
+
+SHED_POLICIES = ('open', 'closed')
+
+
+def parse_route_policy(spec: str) -> dict:
+    """
+    Parse "/login=closed,/checkout=closed" into {path prefix: policy}.
+
+    'closed' routes answer 503 while the WAF sheds load, 'open' routes are
+    let through uninspected.
+    """
+    policy = {}
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        prefix, _, value = item.partition('=')
+        value = value.strip().lower()
+        if value not in SHED_POLICIES:
+            raise ValueError(f"Unknown shed policy {value!r} for {prefix!r}, expected one of {SHED_POLICIES}")
+        policy[prefix.strip()] = value
+    return policy
+
+
+class RoutePolicy:
+    """
+    The shed policy of a path: that of the longest prefix in `route_policy`
+    (as parsed by `parse_route_policy`) it starts with, else `default_policy`.
+    """
+
+    def __init__(self, route_policy: dict = None, default_policy: str = 'open'):
+        if default_policy not in SHED_POLICIES:
+            raise ValueError(f"Unknown shed policy {default_policy!r}, expected one of {SHED_POLICIES}")
+        # Longest prefixes first so /checkout/pay wins over /checkout
+        self.routes = sorted((route_policy or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.default_policy = default_policy
+
+    def __call__(self, path: str) -> str:
+        for prefix, policy in self.routes:
+            if path.startswith(prefix):
+                return policy
+        return self.default_policy
+
+
+class OverloadController:
+    """
+    Steps the WAF down through degradation levels when it falls behind.
+
+    Levels, from best to cheapest:
+    - 'full': every payload is scored by the models
+    - 'screen': payloads get a cheap verdict (cache, prefilter, signatures)
+    - 'shed': nothing is inspected; each route fails open or closed by its
+      policy (longest matching path prefix in `route_policy`, else
+      `default_policy`)
+
+    The controller keeps exponentially weighted averages (weight `alpha`) of
+    the WAF time per inspected request and of the time batches wait for an
+    executor slot and worker. When either average is over its budget it
+    steps down one level, at most once every `step_down_s`. Once both are
+    under `recover_ratio` of their budgets, or no sample has come in for
+    `recover_s`, it steps back up one level, at most once every
+    `recover_s`. While degraded, `probe_rate` of the requests still take the
+    full path, so the averages keep measuring what full inspection costs.
+
+    Every level change is passed to `on_change(event)` and kept in `events`.
+    Used from the event loop only, so it takes no locks.
+    """
+
+    LEVELS = ('full', 'screen', 'shed')
+
+    def __init__(self, latency_budget_ms: float = 100.0, queue_budget_ms: float = 50.0, alpha: float = 0.2,
+                 recover_ratio: float = 0.5, step_down_s: float = 1.0, recover_s: float = 10.0,
+                 probe_rate: float = 0.05, route_policy: dict = None, default_policy: str = 'open',
+                 on_change=None, max_events: int = 50):
+        self.policy = RoutePolicy(route_policy, default_policy)
+        self.latency_budget = latency_budget_ms / 1000.0
+        self.queue_budget = queue_budget_ms / 1000.0
+        self.alpha = alpha
+        self.recover_ratio = recover_ratio
+        self.step_down_s = step_down_s
+        self.recover_s = recover_s
+        self.probe_rate = probe_rate
+        self.on_change = on_change
+        self.events = deque(maxlen=max_events)
+
+        self.level = 0
+        self.latency = 0.0
+        self.queue_wait = 0.0
+        now = time.monotonic()
+        self.changed_at = now
+        self.last_sample = now
+
+        self.admitted = {'full': 0, 'probe': 0, 'screen': 0, 'open': 0, 'closed': 0}
+
+    @property
+    def level_name(self) -> str:
+        return self.LEVELS[self.level]
+
+    def admit(self, path: str) -> str:
+        """How to handle a request: 'full', 'screen', or the shed policy 'open' / 'closed'."""
+        self._evaluate(time.monotonic())
+        if self.level == 0:
+            mode = 'full'
+        elif self.probe_rate > 0 and random.random() < self.probe_rate:
+            self.admitted['probe'] += 1
+            return 'full'
+        elif self.level == 1:
+            mode = 'screen'
+        else:
+            mode = self.policy(path)
+        self.admitted[mode] += 1
+        return mode
+
+    def observe(self, seconds: float):
+        """WAF time of one request that took the full path."""
+        self.latency += self.alpha * (seconds - self.latency)
+        self._sampled()
+
+    def observe_queue(self, seconds: float):
+        """Time one batch waited before a worker picked it up."""
+        self.queue_wait += self.alpha * (seconds - self.queue_wait)
+        self._sampled()
+
+    def _sampled(self):
+        now = time.monotonic()
+        self.last_sample = now
+        self._evaluate(now)
+
+    def pressure(self, now: float = None) -> float:
+        """Largest ratio of an average to its budget; 0 when nothing was measured for `recover_s`."""
+        now = time.monotonic() if now is None else now
+        if now - self.last_sample >= self.recover_s:
+            return 0.0
+        ratios = [0.0]
+        if self.latency_budget > 0:
+            ratios.append(self.latency / self.latency_budget)
+        if self.queue_budget > 0:
+            ratios.append(self.queue_wait / self.queue_budget)
+        return max(ratios)
+
+    def _evaluate(self, now):
+        pressure = self.pressure(now)
+        since = now - self.changed_at
+        if pressure > 1.0 and self.level < len(self.LEVELS) - 1 and since >= self.step_down_s:
+            self._change(self.level + 1, pressure, now)
+        elif pressure < self.recover_ratio and self.level > 0 and since >= self.recover_s:
+            if pressure == 0.0:
+                # Idle: start the next level from a clean slate
+                self.latency = self.queue_wait = 0.0
+            self._change(self.level - 1, pressure, now)
+
+    def _change(self, level, pressure, now):
+        event = {
+            'from': self.LEVELS[self.level],
+            'to': self.LEVELS[level],
+            'pressure': round(pressure, 3),
+            'latency_ms': round(self.latency * 1000, 3),
+            'queue_wait_ms': round(self.queue_wait * 1000, 3),
+            'at': time.time(),
+        }
+        self.level = level
+        self.changed_at = now
+        self.events.append(event)
+        if self.on_change is not None:
+            try:
+                self.on_change(event)
+            except Exception as e:
+                print(f"[WAF] Overload event handler failed: {e}", flush=True)
+
+    def stats(self) -> dict:
+        return {
+            'level': self.level_name,
+            'pressure': round(self.pressure(), 3),
+            'latency_ms': round(self.latency * 1000, 3),
+            'queue_wait_ms': round(self.queue_wait * 1000, 3),
+            'admitted': dict(self.admitted),
+            'events': list(self.events),
+        }
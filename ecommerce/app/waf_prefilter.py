@@ -0,0 +1,133 @@
+import re
+from urllib.parse import unquote_plus
+
+from app.keyword_matcher import KeywordMatcher
+
+
+# Letters, digits and the separators of an ordinary query string. None of
+# them feeds an encoding, comment, quote, bracket or path-traversal feature.
+DEFAULT_ALLOWED_CHARS = frozenset(
+    'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 =&-_.,'
+)
+
+# Substrings of allowed characters that still trigger an attack feature:
+# SQL comments ('--') and hex literals ('0x').
+DEFAULT_FORBIDDEN_SUBSTRINGS = ('--', '0x')
+
+
+class BenignPrefilter:
+    """
+    First-stage screen that clears obviously benign payloads without the models.
+
+    A payload passes only if it is short, made of letters, digits and plain
+    query-string separators, contains none of the forbidden substrings and
+    hits no attack keyword, neither as a substring nor (with
+    `check_obfuscated`) in the scattered form the `kw_obf_*` features look
+    for. Such a payload has every encoding, SQL comment, keyword, path and
+    special-character feature at zero, leaving the models little beyond its
+    length and character statistics to go on. `tools/prefilter_report.py`
+    measures how often the full model disagrees on a real corpus.
+    """
+
+    def __init__(self, keywords, max_length: int = 64, allowed_chars=DEFAULT_ALLOWED_CHARS,
+                 forbidden_substrings=DEFAULT_FORBIDDEN_SUBSTRINGS, check_obfuscated: bool = True):
+        self.max_length = max_length
+        self.allowed_chars = frozenset(allowed_chars)
+        self.forbidden_substrings = tuple(s.lower() for s in forbidden_substrings)
+        self.check_obfuscated = check_obfuscated
+        self.matcher = KeywordMatcher.for_keywords(tuple(keywords))
+
+        self.checked = 0
+        self.passed = 0
+
+    @classmethod
+    def for_extractor(cls, extractor, **kwargs) -> 'BenignPrefilter':
+        keywords = [kw for kws in extractor.attack_keywords.values() for kw in kws]
+        return cls(keywords, **kwargs)
+
+    def is_benign(self, payload) -> bool:
+        self.checked += 1
+        if not isinstance(payload, str) or len(payload) > self.max_length:
+            return False
+        if not self.allowed_chars.issuperset(payload):
+            return False
+
+        payload_lower = payload.lower()
+        if any(s in payload_lower for s in self.forbidden_substrings):
+            return False
+        if any(keyword in payload_lower for keyword in self.matcher.keywords):
+            return False
+        if self.check_obfuscated and any(self.matcher.match_obfuscated(payload_lower)):
+            return False
+
+        self.passed += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'checked': self.checked,
+            'passed': self.passed,
+            'skip_rate': self.passed / self.checked if self.checked else 0.0,
+        }
+
+
+# Patterns (case-insensitive regexes) for combinations that mark an attack.
+# A lone quote, semicolon, bracket or pipe is ordinary text (O'Brien, "5' 11",
+# reviews, addresses), so each pattern needs what comes with it in an attack.
+# Every repeat is bounded: the screen runs on the event loop under overload,
+# so no input may make a pattern backtrack over the whole payload.
+DEFAULT_SCREEN_SIGNATURES = (
+    # Breaking out of a quoted SQL string
+    r"""['"`]\s{0,16}(?:or|and|xor|\|\|)\s{1,16}['"`\d(][^=]{0,32}=""",
+    r"""['"`]\s{0,16}(?:--|/\*|#\s{0,16}$|\)\s{0,16}(?:or|and|union|;|--)\b|union\b)""",
+    r";\s{0,16}(?:drop|select|insert|update|delete|truncate|alter|exec|shutdown)\s",
+    r"\b(?:or|and)\s{1,16}\d{1,16}\s{0,16}=\s{0,16}\d{1,16}\s{0,16}(?:--|#|/\*|$)",
+    r"\bunion\b(?:\s|/\*[^*]{0,64}\*/){1,16}(?:all\s{1,16}|distinct\s{1,16})?select\b",
+    r"\bselect\s{1,16}\*\s{1,16}from\b|\binformation_schema\b|\binsert\s{1,16}into\s{1,16}\w{1,64}\s{0,16}(?:\(|values\b)",
+    r"\b(?:sleep|benchmark|pg_sleep)\s{0,16}\(\s{0,16}\d|\bwaitfor\s{1,16}delay\b",
+    # Markup and script
+    r"<\s{0,16}/?\s{0,16}(?:script|iframe|svg|img|object|embed|body|style|link|meta|base|form|input)\b",
+    r"\bon(?:load|error|click|dblclick|mouse\w{0,16}|key\w{0,16}|focus|blur|submit|change|toggle|animation\w{0,16}|pointer\w{0,16})\s{0,16}=",
+    r"\b(?:javascript|vbscript)\s{0,16}:|\bdata\s{0,16}:\s{0,16}text/html",
+    # Path traversal and file inclusion
+    r"\.\.[/\\]|/etc/(?:passwd|shadow|hosts)\b|\bwin\.ini\b|\b(?:file|php|phar|expect)://",
+    # A shell command chained onto the value; common words only with an option, path or nothing after them
+    r"(?:;|\|\|?|&&|`|\$\()\s{0,16}(?:whoami|uname|wget|curl|nc|bash|sh|chmod|python|perl|rm\s{1,16}-)\b",
+    r"(?:;|\|\|?|&&|`|\$\()\s{0,16}(?:cat|ls|id|echo|ping)(?:\s{1,16}[-/$]|\s{0,16}(?:$|[;|&`)]))",
+    # Template and expression injection
+    r"\{\{[^}]{0,256}\}\}|\$\{[^}]{0,256}\}|<%[^%]{0,256}%>",
+    # Null bytes
+    r"%00|\\x00|\\u0000|\x00",
+)
+
+
+class SignatureScreen:
+    """
+    Model-free verdicts for when the WAF has to shed load.
+
+    A payload matching any of `signatures` (case-insensitive regexes, tried
+    on the payload and on its percent-decoded form) is called an attack,
+    anything else benign. Much cruder than the models, and both more and
+    less strict than them, but one regex pass and no feature extraction.
+    Verdicts carry source 'screen'.
+    """
+
+    def __init__(self, signatures=DEFAULT_SCREEN_SIGNATURES):
+        self.signatures = tuple(signatures)
+        self.pattern = re.compile("|".join(f"(?:{s})" for s in self.signatures), re.IGNORECASE | re.DOTALL)
+
+        self.checked = 0
+        self.flagged = 0
+
+    def verdict(self, payload) -> dict:
+        self.checked += 1
+        payload = str(payload)
+        # Twice, for double encoding
+        decoded = unquote_plus(unquote_plus(payload)) if '%' in payload else payload
+        if self.pattern.search(payload) or (decoded is not payload and self.pattern.search(decoded)):
+            self.flagged += 1
+            return {'is_attack': True, 'confidence': 0.5, 'source': 'screen'}
+        return {'is_attack': False, 'confidence': 0.0, 'source': 'screen'}
+
+    def stats(self) -> dict:
+        return {'checked': self.checked, 'flagged': self.flagged}
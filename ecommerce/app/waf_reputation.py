@@ -0,0 +1,294 @@
+import contextlib
+import fcntl
+import hashlib
+import ipaddress
+import os
+import socket
+import tempfile
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+# How many consecutive slots a source may live in; a lookup never reads more than this
+PROBE_LENGTH = 8
+MAX_COUNT = np.iinfo(np.uint16).max
+MAX_REJECTED = np.iinfo(np.uint32).max
+LOW_BITS = (1 << 64) - 1
+
+
+def entry_dtype(buckets: int) -> np.dtype:
+    """One table slot: 56 bytes with the default 6 buckets. An empty slot has last_seen == 0."""
+    return np.dtype([
+        ('hi', '<u8'),            # source address (IPv4 mapped into IPv6), high and low 64 bits
+        ('lo', '<u8'),
+        ('last_seen', '<f8'),     # time.monotonic() of the last block or rejection
+        ('banned_until', '<f8'),
+        ('epoch', '<u8'),         # bucket index of the newest count
+        ('rejected', '<u4'),      # requests rejected since the source was banned
+        ('counts', '<u2', (buckets,)),
+    ])
+
+
+class _FileLock:
+    """flock on a file next to the segment, so unrelated worker processes serialise their writes."""
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ReputationTable:
+    """
+    Per-source block counts, so sources that keep sending attacks are
+    rejected before their requests are parsed or scored.
+
+    Sources are keyed by client address truncated to `ipv4_prefix` /
+    `ipv6_prefix` bits, as for honeypots. Each blocked request adds one to
+    the source's count in the current of `buckets` time buckets spanning
+    `window_seconds`; buckets older than the window are zeroed as time
+    moves on, so counts decay without a sweep. When a source's count over
+    the window reaches `threshold` it is banned: `check` rejects it until
+    it has sent nothing for `quiet_seconds` (every rejected request pushes
+    the release back).
+
+    Entries live in a fixed numpy structured array of `capacity` slots with
+    open addressing: a source hashes to a slot and occupies the first free
+    one among the next PROBE_LENGTH. Slots whose source is neither banned
+    nor seen within the window count as free. When all are taken, the
+    least recently seen unbanned source there is evicted (only banned
+    sources left: the least recently seen of them), so memory stays at
+    capacity x entry size however many addresses show up.
+
+    With `shared_name` the array lives in a shared memory segment of that
+    name, created by the first process and attached by the others, so all
+    workers of one host see the same counts and bans. Writes are serialised
+    with an flock on a lock file next to it; lookups of unbanned sources
+    take no lock. The segment outlives the workers (a restart keeps the
+    bans) until `unlink` is called. All processes must use the same
+    capacity and buckets.
+
+    Behind a reverse proxy every request comes from the proxy's address, so
+    the table must only be used with the real client address in the scope.
+    """
+
+    def __init__(self, threshold: int = 20, window_seconds: float = 60.0, buckets: int = 6,
+                 quiet_seconds: float = 300.0, capacity: int = 65536, ipv4_prefix: int = 32,
+                 ipv6_prefix: int = 64, shared_name: str = None, on_ban=None):
+        self.threshold = threshold
+        self.window = window_seconds
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        self.quiet = quiet_seconds
+        self.capacity = capacity
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+        self.shared_name = shared_name
+        self.on_ban = on_ban
+        self.dtype = entry_dtype(buckets)
+
+        self._shm = None
+        self._lock = None
+        if shared_name:
+            size = self.dtype.itemsize * capacity
+            try:
+                self._shm = shared_memory.SharedMemory(name=shared_name, create=True, size=size)
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=shared_name)
+                if self._shm.size < size:
+                    self._shm.close()
+                    raise ValueError(f"Shared reputation table {shared_name!r} is smaller than "
+                                     f"{capacity} slots of {buckets} buckets")
+            # The segment belongs to no single worker: keep the tracker from unlinking it at exit
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+            self.table = np.ndarray((capacity,), dtype=self.dtype, buffer=self._shm.buf)
+            self._lock = _FileLock(self._lock_path())
+        else:
+            self.table = np.zeros(capacity, dtype=self.dtype)
+
+        # Field views, so a probe reads PROBE_LENGTH values of one field at a time
+        self._hi = self.table['hi']
+        self._lo = self.table['lo']
+        self._last_seen = self.table['last_seen']
+        self._banned_until = self.table['banned_until']
+        self._rejected = self.table['rejected']
+        self._probe = np.arange(PROBE_LENGTH)
+        self._ipv4_mask = ((1 << ipv4_prefix) - 1) << (32 - ipv4_prefix)
+        self._ipv6_mask = ((1 << ipv6_prefix) - 1) << (128 - ipv6_prefix)
+
+        self.bans = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    def key(self, source_ip):
+        """(hi, lo) of the source's address block; sources that are not addresses are hashed."""
+        for family in (socket.AF_INET, socket.AF_INET6):
+            try:
+                value = int.from_bytes(socket.inet_pton(family, source_ip), 'big')
+            except (OSError, TypeError, ValueError):
+                continue
+            if family == socket.AF_INET or value >> 32 == 0xffff:
+                # IPv4, stored IPv4-mapped
+                value = (0xffff << 32) | (value & 0xffffffff & self._ipv4_mask)
+            else:
+                value &= self._ipv6_mask
+            return value >> 64, value & LOW_BITS
+        digest = hashlib.blake2b(str(source_ip).encode('utf-8', 'replace'), digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+
+    def _base(self, hi, lo) -> int:
+        digest = hashlib.blake2b(((hi << 64) | lo).to_bytes(16, 'big'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.capacity
+
+    def _find(self, base, hi, lo):
+        # Slots are never emptied once used, so an empty slot ends the probe
+        for step in range(PROBE_LENGTH):
+            slot = (base + step) % self.capacity
+            if self._last_seen[slot] == 0:
+                return None
+            if self._hi[slot] == hi and self._lo[slot] == lo:
+                return slot
+        return None
+
+    def check(self, source_ip) -> bool:
+        """True when the source is banned; the request should be rejected without inspection."""
+        hi, lo = self.key(source_ip)
+        slot = self._find(self._base(hi, lo), hi, lo)
+        now = time.monotonic()
+        if slot is None or self._banned_until[slot] <= now:
+            return False
+        with self._locked():
+            if self._hi[slot] != hi or self._lo[slot] != lo:
+                return False
+            self._last_seen[slot] = now
+            self._banned_until[slot] = now + self.quiet
+            if self._rejected[slot] < MAX_REJECTED:
+                self._rejected[slot] += 1
+        self.rejected += 1
+        return True
+
+    def record_block(self, source_ip) -> bool:
+        """Count a blocked request from the source; True when this block got it banned."""
+        hi, lo = self.key(source_ip)
+        base = self._base(hi, lo)
+        now = time.monotonic()
+        epoch = int(now / self.bucket_seconds)
+        with self._locked():
+            slot = self._find(base, hi, lo)
+            if slot is None:
+                slot = self._claim(base, now)
+                self.table[slot] = 0
+                entry = self.table[slot]
+                entry['hi'] = hi
+                entry['lo'] = lo
+                entry['epoch'] = epoch
+            else:
+                entry = self.table[slot]
+            self._advance(entry, epoch)
+            counts = entry['counts']
+            index = epoch % self.buckets
+            counts[index] = min(int(counts[index]) + 1, MAX_COUNT)
+            entry['last_seen'] = now
+            banned = entry['banned_until'] > now
+            if banned or int(counts.sum()) < self.threshold:
+                return False
+            entry['banned_until'] = now + self.quiet
+            entry['rejected'] = 0
+            total = int(counts.sum())
+        self.bans += 1
+        event = {'source': self._address(hi, lo), 'blocks': total, 'window_s': self.window,
+                 'quiet_s': self.quiet, 'at': time.time()}
+        print(f"[WAF] Banned {event['source']} after {total} blocked requests in {self.window:g}s", flush=True)
+        if self.on_ban is not None:
+            try:
+                self.on_ban(event)
+            except Exception as e:
+                print(f"[WAF] Reputation ban handler failed: {e}", flush=True)
+        return True
+
+    def _advance(self, entry, epoch):
+        # Zero the buckets the clock moved past since the entry's last count
+        gap = epoch - int(entry['epoch'])
+        counts = entry['counts']
+        if gap >= self.buckets:
+            counts[:] = 0
+        else:
+            for step in range(1, gap + 1):
+                counts[(int(entry['epoch']) + step) % self.buckets] = 0
+        entry['epoch'] = max(epoch, int(entry['epoch']))
+
+    def _claim(self, base, now):
+        slots = (base + self._probe) % self.capacity
+        last_seen = self._last_seen[slots]
+        banned = self._banned_until[slots] > now
+        free = ~banned & ((last_seen == 0) | (now - last_seen >= self.window))
+        if free.any():
+            return int(slots[np.argmax(free)])
+        self.evictions += 1
+        if not banned.all():
+            # Least recently seen unbanned source
+            return int(slots[np.argmin(np.where(banned, np.inf, last_seen))])
+        return int(slots[np.argmin(last_seen)])
+
+    def _lock_path(self) -> str:
+        return os.path.join(tempfile.gettempdir(), f"{self.shared_name}.lock")
+
+    def _locked(self):
+        return self._lock if self._lock is not None else contextlib.nullcontext()
+
+    def _address(self, hi, lo) -> str:
+        value = (hi << 64) | lo
+        if value >> 32 == 0xffff:
+            return f"{ipaddress.IPv4Address(value & 0xffffffff)}/{self.ipv4_prefix}"
+        return f"{ipaddress.IPv6Address(value)}/{self.ipv6_prefix}"
+
+    def stats(self, top: int = 10) -> dict:
+        now = time.monotonic()
+        used = self._last_seen > 0
+        banned = used & (self._banned_until > now)
+        live = banned | (used & (now - self._last_seen < self.window))
+        noisiest = np.flatnonzero(banned)
+        noisiest = noisiest[np.argsort(-self._rejected[noisiest], kind='stable')][:top]
+        return {
+            'shared': self.shared_name,
+            'capacity': self.capacity,
+            'entry_bytes': self.dtype.itemsize,
+            'tracked': int(live.sum()),
+            'banned': int(banned.sum()),
+            'bans': self.bans,
+            'rejected': self.rejected,
+            'evictions': self.evictions,
+            'top_banned': [
+                {'source': self._address(int(self._hi[i]), int(self._lo[i])),
+                 'rejected': int(self._rejected[i]),
+                 'released_in_s': round(float(self._banned_until[i]) - now, 1)}
+                for i in noisiest
+            ],
+        }
+
+    def close(self):
+        """Detach from the shared segment (it stays for other and later workers)."""
+        if self._shm is not None:
+            self._hi = self._lo = self._last_seen = self._banned_until = self._rejected = self.table = None
+            self._shm.close()
+            self._shm = None
+            self._lock.close()
+
+    def unlink(self):
+        """Remove the shared segment; attached workers keep their mapping until they close."""
+        if self.shared_name:
+            with contextlib.suppress(FileNotFoundError):
+                segment = shared_memory.SharedMemory(name=self.shared_name)
+                segment.close()
+                segment.unlink()
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._lock_path())
@@ -0,0 +1,173 @@
+"""
+Standalone WAF scoring service.
+
+Loads the detector once and scores payloads for any number of protected
+apps, so WAF capacity scales separately from app capacity and a node keeps
+one warm model instead of one per app worker. Apps talk to it with
+app.waf_client.WAFClient.
+
+HTTP (keep-alive, any HTTP/1.1 client):
+    POST /v1/analyze        {"payload": "..."}         -> verdict
+    POST /v1/analyze/batch  {"payloads": ["...", ...]}  -> {"verdicts": [...]}
+    GET  /v1/health, GET /v1/stats, GET /metrics, POST /v1/reload?version=
+
+Batches longer than WAF_BATCH_MAX_SIZE are refused (413 over HTTP). Reload
+takes `Authorization: Bearer $WAF_ADMIN_TOKEN`, or with no token set only
+loopback callers.
+
+Unix socket (WAF_SERVICE_SOCKET), newline-delimited JSON on persistent
+connections: each line {"id": n, "payloads": [...]} is answered by a line
+{"id": n, "verdicts": [...]}, or {"id": n, "error": "..."}; a line
+{"id": n, "payload": "..."} scores one payload. Requests on a connection
+may be pipelined and are answered as they finish, not in order.
+
+Single payloads from all callers are coalesced into batches (WAFBatcher),
+batched requests go straight to the executor. Model, executor, cache and
+reload settings are app.waf_config's, shared with app.main; only the
+execution mode defaults differently (a thread pool).
+
+Run (from the ecommerce directory):
+    python -m app.waf_service
+"""
+import asyncio
+import os
+import signal
+
+from fastapi import Body, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from app.model_registry import ModelWatcher
+from app.waf_config import (WAF_BATCH_MAX_SIZE, WAF_QUEUE_SIZE, WAF_RELOAD_INTERVAL_S, WAF_SERVICE_EXECUTION_MODE,
+                            WAF_TIMEOUT_MS, WAF_WORKERS, admin_allowed, build_batcher, build_cache, build_engine,
+                            reload_models)
+from app.waf_executor import WAFExecutor
+from app.waf_metrics import WAFMetrics
+from app.waf_socket import SocketServer
+
+# Configuration (the WAF's own settings are shared with app.main, see app.waf_config)
+# Where the service listens: HTTP host/port, and optionally a Unix socket
+WAF_SERVICE_HOST = os.getenv("WAF_SERVICE_HOST", "0.0.0.0")
+WAF_SERVICE_PORT = int(os.getenv("WAF_SERVICE_PORT", "8090"))
+WAF_SERVICE_SOCKET = os.getenv("WAF_SERVICE_SOCKET", "")
+# Per socket connection: requests in flight before reading pauses, and the longest request line
+WAF_SERVICE_MAX_PIPELINE = int(os.getenv("WAF_SERVICE_MAX_PIPELINE", "256"))
+WAF_SERVICE_MAX_LINE_BYTES = int(os.getenv("WAF_SERVICE_MAX_LINE_BYTES", str(16 * 1024 * 1024)))
+
+
+# Initialize WAF
+waf_metrics = WAFMetrics()
+waf_cache = build_cache()
+waf = build_engine(cache=waf_cache, stage_observer=waf_metrics.observe_stages)
+waf_metrics.set_model(waf.model_info())
+waf_executor = WAFExecutor(
+    waf,
+    mode=WAF_SERVICE_EXECUTION_MODE,
+    workers=WAF_WORKERS,
+    max_queue=WAF_QUEUE_SIZE,
+    timeout_ms=WAF_TIMEOUT_MS,
+)
+waf_batcher = build_batcher(waf_executor.analyze_many)
+
+async def score_one(payload):
+    if waf_batcher:
+        return await waf_batcher.analyze(payload)
+    return await waf_executor.analyze(payload)
+
+def reload_waf_models(version=None):
+    return reload_models(waf, waf_executor, waf_metrics, version)
+
+socket_server = None
+if WAF_SERVICE_SOCKET:
+    socket_server = SocketServer(
+        WAF_SERVICE_SOCKET,
+        score_one,
+        waf_executor.analyze_many,
+        max_pipeline=WAF_SERVICE_MAX_PIPELINE,
+        max_line_bytes=WAF_SERVICE_MAX_LINE_BYTES,
+        max_batch=WAF_BATCH_MAX_SIZE,
+    )
+
+waf_watcher = None
+if waf.registry and WAF_RELOAD_INTERVAL_S > 0:
+    waf_watcher = ModelWatcher(waf, interval_seconds=WAF_RELOAD_INTERVAL_S, reload=reload_waf_models)
+
+app = FastAPI(title="WAF Scoring Service")
+reload_tasks = set()
+
+@app.on_event("startup")
+async def start_service():
+    waf_executor.start()
+    if socket_server:
+        await socket_server.start()
+    if waf_watcher:
+        waf_watcher.start()
+
+    loop = asyncio.get_running_loop()
+    def on_sighup():
+        task = loop.create_task(asyncio.to_thread(reload_waf_models))
+        reload_tasks.add(task)
+        task.add_done_callback(reload_tasks.discard)
+    try:
+        loop.add_signal_handler(signal.SIGHUP, on_sighup)
+    except (NotImplementedError, AttributeError, RuntimeError):
+        pass
+
+@app.on_event("shutdown")
+async def stop_service():
+    if waf_watcher:
+        waf_watcher.stop()
+    if socket_server:
+        await socket_server.stop()
+    if waf_batcher:
+        await waf_batcher.drain()
+    waf_executor.shutdown()
+
+@app.post("/v1/analyze")
+async def analyze(payload: str = Body(..., embed=True)):
+    return await score_one(payload)
+
+@app.post("/v1/analyze/batch")
+async def analyze_batch(payloads: list = Body(..., embed=True)):
+    if len(payloads) > WAF_BATCH_MAX_SIZE:
+        return JSONResponse(status_code=413,
+                            content={"detail": f"Batch of {len(payloads)} exceeds {WAF_BATCH_MAX_SIZE} payloads"})
+    return {"verdicts": await waf_executor.analyze_many([str(p) for p in payloads])}
+
+@app.get("/v1/health")
+async def health():
+    ready = waf.detector is not None
+    return JSONResponse(status_code=200 if ready else 503,
+                        content={"status": "ok" if ready else "no model", "version": waf.version})
+
+@app.post("/v1/reload")
+async def reload(request: Request, version: str = None):
+    if not admin_allowed(request):
+        return JSONResponse(status_code=403, content={"detail": "Forbidden"})
+    report = await asyncio.to_thread(reload_waf_models, version)
+    return JSONResponse(status_code=200 if report["status"] in ("swapped", "unchanged") else 409, content=report)
+
+@app.get("/v1/stats")
+async def stats():
+    return {
+        "model": waf.model_info(),
+        "cache": waf_cache.stats() if waf_cache else None,
+        "prefilter": waf.prefilter.stats() if waf.prefilter else None,
+        "executor": waf_executor.stats(),
+        "batcher": waf_batcher.stats() if waf_batcher else None,
+        "socket": socket_server.stats() if socket_server else None,
+    }
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = waf_metrics.render()
+    return Response(content=body, headers={"Content-Type": content_type})
+
+
+def main():
+    import uvicorn
+
+    uvicorn.run(app, host=WAF_SERVICE_HOST, port=WAF_SERVICE_PORT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+
+
+class SocketServer:
+    """
+    Newline-delimited JSON scoring over a Unix domain socket.
+
+    Each connection is read line by line; every request line is scored in
+    its own task, so a client can pipeline requests and get the answers in
+    completion order, matched by the `id` it sent. At most `max_pipeline`
+    requests per connection are in flight; past that the connection is not
+    read until one finishes, which pushes back on the client.
+
+    `score_one` scores a single payload, `score_many` a list of them (both
+    coroutines returning verdict dicts). A list longer than `max_batch` is
+    answered with an error instead.
+    """
+
+    def __init__(self, path: str, score_one, score_many, max_pipeline: int = 256,
+                 max_line_bytes: int = 16 * 1024 * 1024, max_batch: int = 64):
+        self.path = path
+        self.score_one = score_one
+        self.score_many = score_many
+        self.max_batch = max_batch
+        self.max_pipeline = max_pipeline
+        self.max_line_bytes = max_line_bytes
+        self._server = None
+
+        self.connections = 0
+        self.open_connections = 0
+        self.requests = 0
+        self.bad_requests = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path, limit=self.max_line_bytes)
+        os.chmod(self.path, 0o660)
+        print(f"[WAF] Scoring service listening on unix:{self.path}", flush=True)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        self.open_connections += 1
+        slots = asyncio.Semaphore(self.max_pipeline)
+        tasks = set()
+        try:
+            while True:
+                await slots.acquire()
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    # Line longer than max_line_bytes: the stream cannot be resynchronised
+                    self.bad_requests += 1
+                    break
+                if not line:
+                    break
+                task = asyncio.get_running_loop().create_task(self._answer(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: slots.release())
+        except ConnectionError:
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+            self.open_connections -= 1
+
+    async def _answer(self, line, writer):
+        self.requests += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            if 'payloads' in request and len(request['payloads']) > self.max_batch:
+                self.bad_requests += 1
+                response = {'error': f"batch of {len(request['payloads'])} exceeds {self.max_batch} payloads"}
+            elif 'payloads' in request:
+                response = {'verdicts': await self.score_many([str(p) for p in request['payloads']])}
+            else:
+                response = {'verdicts': [await self.score_one(str(request['payload']))]}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.bad_requests += 1
+            response = {'error': f"bad request: {e}"}
+        response['id'] = request_id
+        if not writer.is_closing():
+            writer.write(json.dumps(response).encode() + b'\n')
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            'path': self.path,
+            'connections': self.connections,
+            'open_connections': self.open_connections,
+            'requests': self.requests,
+            'bad_requests': self.bad_requests,
+        }
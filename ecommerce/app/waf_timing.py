@@ -0,0 +1,26 @@
+import time
+
+
+class StageClock:
+    """
+    Accumulates wall time per WAF pipeline stage into a caller-supplied dict.
+
+    `lap(stage)` charges the time since the previous lap (or since the clock
+    was created) to `stage`, adding to whatever the dict already holds so a
+    stage that runs several times per call is summed. With `timings=None`
+    every call is a no-op, so detectors can take an optional dict without
+    paying for timing when nobody asked.
+    """
+
+    __slots__ = ('timings', 'last')
+
+    def __init__(self, timings=None):
+        self.timings = timings
+        self.last = time.perf_counter() if timings is not None else 0.0
+
+    def lap(self, stage: str):
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - self.last)
+        self.last = now
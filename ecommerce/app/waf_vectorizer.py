@@ -0,0 +1,247 @@
+import json
+import re
+from collections import Counter
+
+import numpy as np
+
+from app.keyword_matcher import KeywordMatcher
+
+
+ASCII_LETTERS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+ASCII_DIGITS = frozenset('0123456789')
+
+# Characters excluded by the extractor's `[^a-zA-Z0-9\\s]` class. The raw string
+# escapes the backslash, so the class is letters, digits, '\' and 's'.
+NON_SPECIAL_CHARS = ASCII_LETTERS | ASCII_DIGITS | frozenset('\\s')
+
+SPECIAL_CHARS = ['<', '>', '"', "'", ';', '/', '\\', '(', ')', '{', '}', '[', ']']
+
+# Written next to the models by tools/feature_plan.py
+FEATURE_PLAN_FILE = 'feature_plan.json'
+
+
+class FeaturePlan:
+    """
+    Which columns a model actually reads.
+
+    `active` columns are extracted as usual; every other column is never
+    computed and holds its `fill` value (the value the scaler maps to 0, so
+    it looks like an average row to anything that does read it). A plan is
+    only valid for the models it was derived from: `meta['model_fingerprint']`
+    holds their FlatDetector.fingerprint(), and WAFEngine ignores a plan
+    whose fingerprint is not the loaded models'.
+    """
+
+    def __init__(self, columns, active, fill=None, meta=None):
+        self.columns = list(columns)
+        self.active = [c for c in self.columns if c in set(active)]
+        self.fill = {c: float(v) for c, v in (fill or {}).items() if c not in set(self.active)}
+        self.meta = meta or {}
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'columns': self.columns, 'active': self.active, 'fill': self.fill, 'meta': self.meta},
+                      f, indent=2)
+
+    @classmethod
+    def load(cls, path) -> 'FeaturePlan':
+        with open(path, encoding='utf-8') as f:
+            plan = json.load(f)
+        return cls(plan['columns'], plan['active'], plan.get('fill'), plan.get('meta'))
+
+
+class WAFFeatureVectorizer:
+    """
+    Compiled feature extractor that writes straight into a float vector.
+
+    Produces exactly the values of `WAFBypassFeatureExtractor.extract_all_features`,
+    laid out in `columns` order, without building the intermediate dict or the
+    one-row DataFrame. All regexes are compiled once here, and the per-character
+    statistics (entropy, case counts, ratios, special-char counts) come from a
+    single Counter pass over the payload. Columns the models do not know about
+    are never computed; unknown columns stay 0 like the legacy reindex.
+
+    With a FeaturePlan, only the plan's active columns are computed (and only
+    the regexes and passes they need run); the others are set to their fill
+    value.
+    """
+
+    def __init__(self, extractor, columns, plan: FeaturePlan = None):
+        self.columns = list(columns)
+        self.n_features = len(self.columns)
+        self.plan = plan
+        computed = set(plan.active) if plan is not None else set(self.columns)
+        index = {name: i for i, name in enumerate(self.columns) if name in computed}
+        self.n_computed = len(index)
+
+        self._fill = None
+        if plan is not None and plan.fill:
+            self._fill = np.zeros(self.n_features, dtype=np.float64)
+            for i, name in enumerate(self.columns):
+                if name not in computed:
+                    self._fill[i] = plan.fill.get(name, 0.0)
+
+        # Encoding patterns: (regex, count column, present column)
+        self._encoding = []
+        for name, pattern in extractor.encoding_patterns.items():
+            self._encoding.append((
+                re.compile(pattern, re.IGNORECASE),
+                index.get(f'enc_{name}_count'),
+                index.get(f'enc_{name}_present'),
+            ))
+        self._enc_layers = index.get('enc_layers')
+        self._enc_multi_layer = index.get('enc_multi_layer')
+        if self._enc_layers is None and self._enc_multi_layer is None:
+            # The layer count needs every pattern; without it only the used ones run
+            self._encoding = [e for e in self._encoding if e[1] is not None or e[2] is not None]
+
+        self._obfuscation = [
+            (re.compile(pattern, re.IGNORECASE), index.get(f'obf_{name}_count'))
+            for name, pattern in extractor.obfuscation_patterns.items()
+        ]
+        self._obfuscation = [(rx, i) for rx, i in self._obfuscation if i is not None]
+
+        # Keywords: (keyword, plain column, obfuscated column), matched in one
+        # automaton scan for all obfuscated forms
+        self._keywords = []
+        for attack_type, keywords in extractor.attack_keywords.items():
+            for keyword in keywords:
+                self._keywords.append((
+                    keyword,
+                    index.get(f'kw_{attack_type}_{keyword}'),
+                    index.get(f'kw_obf_{attack_type}_{keyword}'),
+                ))
+        self._keywords = [kw for kw in self._keywords if kw[1] is not None or kw[2] is not None]
+        self._matcher = KeywordMatcher.for_keywords(tuple(kw[0] for kw in self._keywords))
+        self._match_obfuscated = any(kw[2] is not None for kw in self._keywords)
+
+        self._path_dotdot = re.compile(r'\\.\\./[\\/\\\\]')
+        self._path_encoded = re.compile(r'%2e%2e', re.IGNORECASE)
+        self._path_dotdot_idx = index.get('path_dotdot_present')
+        self._path_encoded_idx = index.get('path_encoded_present')
+
+        self._word = re.compile(r'\\w+')
+        self._length = index.get('length')
+        self._word_count = index.get('word_count')
+        self._special_char_ratio = index.get('special_char_ratio')
+        self._digit_ratio = index.get('digit_ratio')
+        self._alpha_ratio = index.get('alpha_ratio')
+        self._entropy = index.get('payload_entropy')
+        self._charset_mixed = index.get('charset_mixed')
+        self._case_variation = index.get('case_variation')
+        self._special_chars = [
+            (char, index[f'char_{ord(char)}'])
+            for char in SPECIAL_CHARS if f'char_{ord(char)}' in index
+        ]
+        self._char_stats = bool(self._special_chars) or any(i is not None for i in (
+            self._special_char_ratio, self._digit_ratio, self._alpha_ratio, self._entropy,
+            self._charset_mixed, self._case_variation))
+
+    @staticmethod
+    def _coerce(payload) -> str:
+        # Mirrors the extractor's `pd.isna` guard without importing pandas
+        if payload is None or (isinstance(payload, float) and payload != payload):
+            return ""
+        return str(payload)
+
+    def transform(self, payload) -> np.ndarray:
+        """Return the feature vector of one payload, shape (n_features,)."""
+        row = np.zeros(self.n_features, dtype=np.float64)
+        self.transform_into(payload, row)
+        return row
+
+    def transform_many(self, payloads) -> np.ndarray:
+        """Return the feature matrix of several payloads, shape (n, n_features)."""
+        X = np.zeros((len(payloads), self.n_features), dtype=np.float64)
+        for i, payload in enumerate(payloads):
+            self.transform_into(payload, X[i])
+        return X
+
+    def transform_into(self, payload, row: np.ndarray) -> None:
+        """Fill a preallocated, zeroed row with the features of `payload`."""
+        payload = self._coerce(payload)
+        if self._fill is not None:
+            row[:] = self._fill
+
+        # Encoding features
+        layers = 0
+        for rx, count_idx, present_idx in self._encoding:
+            count = len(rx.findall(payload))
+            if count:
+                layers += 1
+            if count_idx is not None:
+                row[count_idx] = count
+            if present_idx is not None:
+                row[present_idx] = int(count > 0)
+        if self._enc_layers is not None:
+            row[self._enc_layers] = layers
+        if self._enc_multi_layer is not None:
+            row[self._enc_multi_layer] = int(layers >= 2)
+
+        # Obfuscation features
+        for rx, idx in self._obfuscation:
+            row[idx] = len(rx.findall(payload))
+
+        # Attack keywords
+        payload_lower = payload.lower()
+        if self._match_obfuscated:
+            obfuscated = self._matcher.match_obfuscated(payload_lower)
+        for i, (keyword, plain_idx, obf_idx) in enumerate(self._keywords):
+            if plain_idx is not None:
+                row[plain_idx] = int(keyword in payload_lower)
+            if obf_idx is not None:
+                row[obf_idx] = obfuscated[i]
+        if self._path_dotdot_idx is not None:
+            row[self._path_dotdot_idx] = int(bool(self._path_dotdot.search(payload)))
+        if self._path_encoded_idx is not None:
+            row[self._path_encoded_idx] = int(bool(self._path_encoded.search(payload)))
+
+        # Structural features
+        total = len(payload)
+        if self._length is not None:
+            row[self._length] = total
+        if self._word_count is not None:
+            row[self._word_count] = len(self._word.findall(payload))
+
+        # Everything below is derived from one character-frequency pass
+        if not self._char_stats:
+            return
+        freq = Counter(payload)
+        upper = lower = digits = alphas = specials = 0
+        has_alpha = has_digit = has_special = False
+        for ch, count in freq.items():
+            if ch.isupper():
+                upper += count
+            elif ch.islower():
+                lower += count
+            if ch.isdigit():
+                digits += count
+            if ch.isalpha():
+                alphas += count
+            if not ch.isalnum():
+                specials += count
+            if ch in ASCII_LETTERS:
+                has_alpha = True
+            elif ch in ASCII_DIGITS:
+                has_digit = True
+            if ch not in NON_SPECIAL_CHARS:
+                has_special = True
+
+        if self._entropy is not None and total:
+            # Same per-symbol terms and summation order as the extractor
+            p = np.fromiter(freq.values(), dtype=np.float64, count=len(freq)) / total
+            row[self._entropy] = -sum(p * np.log2(p))
+        if self._charset_mixed is not None:
+            row[self._charset_mixed] = int(sum([has_alpha, has_digit, has_special]) >= 2)
+        if self._case_variation is not None and upper + lower > 0:
+            row[self._case_variation] = abs(upper - lower) / (upper + lower)
+
+        denominator = max(total, 1)
+        if self._special_char_ratio is not None:
+            row[self._special_char_ratio] = specials / denominator
+        if self._digit_ratio is not None:
+            row[self._digit_ratio] = digits / denominator
+        if self._alpha_ratio is not None:
+            row[self._alpha_ratio] = alphas / denominator
+        for char, idx in self._special_chars:
+            row[idx] = freq.get(char, 0)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from app.waf_detector import ModelBundle, WAFBypassFeatureExtractor, WAFEngine
+
+
+class StubDetector:
+    """Stands in for the pickled WAFBypassDetector: flags payloads containing '<'."""
+
+    def __init__(self, columns):
+        self.lt = columns.index('char_60')
+        self.length = columns.index('length')
+        self.calls = 0
+
+    def predict(self, X):
+        self.calls += 1
+        X = np.asarray(X, dtype=np.float64)
+        if (X[:, self.length] == 13).any():
+            raise ValueError("poisoned row")
+        pred = (X[:, self.lt] > 0).astype(int)
+        return pred, pred * 0.9
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # Empty model dir: loading fails, then the stub models are installed
+    waf = WAFEngine(model_dir=str(tmp_path))
+    columns = waf.X_train_columns
+    waf.install(ModelBundle(StubDetector(columns), WAFBypassFeatureExtractor(), columns))
+    return waf
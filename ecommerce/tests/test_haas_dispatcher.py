@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import httpx
+
+from app.haas_dispatcher import CircuitBreaker, HaaSDispatcher
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Backend:
+    """MockTransport handler recording requests; `fail` makes it answer 503."""
+
+    def __init__(self):
+        self.requests = []
+        self.fail = False
+
+    def __call__(self, request):
+        if self.fail:
+            return httpx.Response(503)
+        self.requests.append((request.url.path, json.loads(request.content)))
+        return httpx.Response(200, json={})
+
+
+def make_dispatcher(backend, **kwargs):
+    kwargs.setdefault('flush_interval_ms', 5)
+    kwargs.setdefault('backoff_ms', 1)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(backend))
+    return HaaSDispatcher("http://haas/api/v1", client=client, **kwargs)
+
+
+def test_alerts_in_one_flush_go_out_as_one_batch():
+    backend = Backend()
+
+    async def scenario():
+        dispatcher = make_dispatcher(backend)
+        dispatcher.start()
+        for i in range(5):
+            dispatcher.submit_alert({"source_ip": f"10.0.0.{i}"})
+        dispatcher.submit_honeypot({"name": "hp", "image": "img"})
+        await dispatcher.stop()
+        return dispatcher.stats()
+
+    stats = run(scenario())
+
+    assert [path for path, _ in backend.requests] == ["/api/v1/observability/alerts/batch", "/api/v1/honeypots/"]
+    assert len(backend.requests[0][1]) == 5
+    assert stats['delivered_alerts'] == 5 and stats['delivered_honeypots'] == 1
+    assert stats['queue_depth'] == 0
+
+
+def test_full_queue_drops_instead_of_blocking():
+    async def scenario():
+        dispatcher = make_dispatcher(Backend(), max_queue=2)
+        dispatcher.start()
+        accepted = [dispatcher.submit_alert({"n": i}) for i in range(4)]
+        await dispatcher.stop()
+        return accepted, dispatcher.stats()
+
+    accepted, stats = run(scenario())
+
+    assert accepted == [True, True, False, False]
+    assert stats['dropped'] == 2
+
+
+def test_open_breaker_spools_and_replays_when_backend_returns(tmp_path):
+    backend = Backend()
+    backend.fail = True
+    spool = tmp_path / "spool.jsonl"
+
+    async def scenario():
+        dispatcher = make_dispatcher(backend, max_retries=1, breaker_threshold=2, breaker_reset_s=0.05,
+                                     spool_path=str(spool))
+        dispatcher.start()
+        dispatcher.submit_alert({"n": 1})
+        dispatcher.submit_honeypot({"name": "hp"})
+        await dispatcher._queue.join()
+        down = dispatcher.stats()
+
+        backend.fail = False
+        await asyncio.sleep(0.06)
+        dispatcher.submit_alert({"n": 2})
+        await dispatcher.stop()
+        return down, dispatcher.stats()
+
+    down, up = run(scenario())
+
+    assert down['breaker'] == 'open' and down['spooled'] == 2 and down['retries'] == 1
+    assert (tmp_path / "spool.jsonl.honeypots").exists()
+    # The alert sent after recovery closes the breaker, then the spooled one follows
+    assert backend.requests == [
+        ("/api/v1/observability/alerts/batch", [{"n": 2}]),
+        ("/api/v1/observability/alerts/batch", [{"n": 1}]),
+    ]
+    assert up['breaker'] == 'closed' and up['replayed'] == 1
+    assert not spool.exists()
+
+
+def test_breaker_half_opens_after_reset():
+    breaker = CircuitBreaker(threshold=2, reset_seconds=0.0)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.trips == 1 and breaker.state == 'half_open'
+    breaker.record_success()
+    assert breaker.state == 'closed'
@@ -0,0 +1,54 @@
+import time
+
+from app.honeypot_coalescer import HoneypotCoalescer
+
+
+def test_repeat_triggers_attach_to_existing_honeypot():
+    coalescer = HoneypotCoalescer(cooldown_seconds=60)
+
+    first = coalescer.trigger("203.0.113.7")
+    repeats = [coalescer.trigger("203.0.113.7") for _ in range(4999)]
+
+    assert first['deploy'] is True
+    assert not any(r['deploy'] for r in repeats)
+    assert {r['name'] for r in repeats} == {first['name']}
+    assert repeats[-1]['suppressed'] == 4999
+    stats = coalescer.stats()
+    assert (stats['deployed'], stats['suppressed']) == (1, 4999)
+    assert stats['top_attackers'][0] == {
+        'key': '203.0.113.7/32', 'honeypot': first['name'], 'triggers': 5000, 'suppressed': 4999,
+    }
+
+
+def test_subnet_prefix_groups_neighbouring_addresses():
+    coalescer = HoneypotCoalescer(ipv4_prefix=24, ipv6_prefix=64)
+
+    assert coalescer.trigger("198.51.100.1")['deploy'] is True
+    assert coalescer.trigger("198.51.100.200")['deploy'] is False
+    assert coalescer.trigger("198.51.101.1")['deploy'] is True
+    assert coalescer.trigger("2001:db8::1")['key'] == coalescer.trigger("2001:db8::ffff")['key']
+
+
+def test_cooldown_expiry_allows_a_new_deployment():
+    coalescer = HoneypotCoalescer(cooldown_seconds=0.01)
+    first = coalescer.trigger("10.0.0.1")
+    time.sleep(0.02)
+    second = coalescer.trigger("10.0.0.1")
+    assert second['deploy'] is True and second['name'] != first['name']
+
+
+def test_global_cap_limits_live_honeypots():
+    coalescer = HoneypotCoalescer(max_active=3)
+
+    decisions = [coalescer.trigger(f"10.0.0.{i}") for i in range(10)]
+
+    assert sum(d['deploy'] for d in decisions) == 3
+    assert decisions[5] == {'key': '10.0.0.5/32', 'name': None, 'deploy': False, 'suppressed': 0}
+    assert coalescer.stats()['capped'] == 7
+
+
+def test_release_frees_the_slot():
+    coalescer = HoneypotCoalescer(max_active=1)
+    decision = coalescer.trigger("10.0.0.1")
+    coalescer.release(decision['key'])
+    assert coalescer.trigger("10.0.0.2")['deploy'] is True
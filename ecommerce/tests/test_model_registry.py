@@ -0,0 +1,155 @@
+import json
+import sys
+
+import numpy as np
+import pytest
+
+from app.model_registry import ModelRegistry, ModelWatcher
+from app.waf_cache import VerdictCache
+from app.waf_detector import WAFEngine, _pickled_main_aliases
+
+
+CANARY = [("q=shoes", 0), ("page=2", 0), ("<script>", 1), ("<img src=x>", 1)]
+
+
+@pytest.fixture
+def registry(tmp_path):
+    (tmp_path / "registry" / "versions").mkdir(parents=True)
+    return ModelRegistry(str(tmp_path / "registry"))
+
+
+def _write_source(directory, files):
+    directory.mkdir()
+    for name, content in files.items():
+        (directory / name).write_text(content)
+    return str(directory)
+
+
+def test_publish_writes_manifest_and_activates(tmp_path, registry):
+    registry.publish(_write_source(tmp_path / "a", {"model.bin": "one"}), "v1")
+    registry.publish(_write_source(tmp_path / "b", {"model.bin": "two"}), "v2", activate=False)
+
+    assert registry.versions() == ["v1", "v2"]
+    assert registry.current_version() == "v1"
+    assert set(registry.manifest("v2")["files"]) == {"model.bin"}
+    assert registry.verify("v2").endswith("v2")
+
+    registry.activate("v2")
+    assert registry.current_version() == "v2"
+
+
+def test_current_defaults_to_latest_version(tmp_path, registry):
+    registry.publish(_write_source(tmp_path / "a", {"m": "1"}), "2026-01-01", activate=False)
+    registry.publish(_write_source(tmp_path / "b", {"m": "2"}), "2026-02-01", activate=False)
+    assert registry.current_version() == "2026-02-01"
+
+
+def test_verify_detects_tampering(tmp_path, registry):
+    registry.publish(_write_source(tmp_path / "a", {"model.bin": "one"}), "v1")
+    (tmp_path / "registry" / "versions" / "v1" / "model.bin").write_text("evil")
+    with pytest.raises(ValueError, match="checksum"):
+        registry.verify("v1")
+
+
+@pytest.mark.parametrize("version", ["", "../v1", ".staging-v1", "a/b"])
+def test_rejects_unsafe_version_names(registry, version):
+    with pytest.raises(ValueError):
+        registry.path(version)
+
+
+def test_pickle_aliases_do_not_leak_into_main():
+    main = sys.modules['__main__']
+    with _pickled_main_aliases():
+        assert hasattr(main, 'WAFBypassDetector')
+    assert not hasattr(main, 'WAFBypassDetector')
+
+
+# -- engine reloads (need sklearn to build real models) ----------------------
+
+def _publish_models(tmp_path, registry, version, attack_char='<', canary=CANARY):
+    pytest.importorskip("sklearn")
+    from sklearn.ensemble import IsolationForest, RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    from app.flat_model import MAPPED_MODEL_DIR, export_detector
+    from app.waf_detector import TRAIN_COLUMNS, WAFBypassDetector, WAFBypassFeatureExtractor
+    from app.waf_vectorizer import WAFFeatureVectorizer
+
+    extractor = WAFBypassFeatureExtractor()
+    vectorizer = WAFFeatureVectorizer(extractor, TRAIN_COLUMNS)
+    payloads = [p for p, _ in CANARY] + ["q=hat", "size=10", "<b>", "x<y", "a;b"] * 5
+    X = vectorizer.transform_many(payloads)
+    y = np.array([int(attack_char in p) for p in payloads])
+
+    detector = WAFBypassDetector()
+    detector.scaler = StandardScaler().fit(X)
+    X_scaled = detector.scaler.transform(X)
+    # contamination small enough that the anomaly stage never overrides the forest here
+    detector.anomaly_detector = IsolationForest(n_estimators=5, contamination=0.001, random_state=0).fit(X_scaled)
+    detector.ensemble = RandomForestClassifier(n_estimators=5, random_state=0).fit(X_scaled, y)
+
+    source = tmp_path / f"build-{version}"
+    source.mkdir()
+    export_detector(detector, extractor, TRAIN_COLUMNS).save_mapped(str(source / MAPPED_MODEL_DIR))
+    canary_path = tmp_path / f"canary-{version}.jsonl"
+    canary_path.write_text("".join(json.dumps({"payload": p, "label": l}) + "\n" for p, l in canary))
+    registry.publish(str(source), version, canary=str(canary_path))
+
+
+def test_engine_serves_current_version_and_hot_swaps(tmp_path, registry):
+    _publish_models(tmp_path, registry, "v1")
+    waf = WAFEngine(model_dir=registry.root, cache=VerdictCache())
+    assert waf.version == "v1"
+    assert waf.analyze("<script>")['is_attack'] is True
+
+    serving = waf.bundle
+    _publish_models(tmp_path, registry, "v2")
+    report = waf.reload()
+
+    assert report['status'] == 'swapped'
+    assert (report['version'], report['previous_version']) == ("v2", "v1")
+    assert report['canary'] == {'payloads': 4, 'labeled': 4, 'accuracy': 1.0}
+    assert waf.version == "v2" and waf.bundle is not serving
+    # Requests still holding the old bundle keep a complete, untouched version
+    assert serving.version == "v1" and serving.vectorizer.columns == serving.columns
+    assert waf.cache.stats()['entries'] == 0
+
+    # The serving version again: no load, no canary, the cache survives
+    waf.analyze("<script>")
+    swapped = waf.bundle
+    assert waf.reload("v2")['status'] == 'unchanged'
+    assert waf.reload()['status'] == 'unchanged'
+    assert waf.bundle is swapped and waf.cache.stats()['entries'] == 1
+    assert waf.model_info()['reloads'] == 1
+
+
+def test_failed_canary_keeps_serving_version(tmp_path, registry):
+    _publish_models(tmp_path, registry, "v1")
+    waf = WAFEngine(model_dir=registry.root)
+
+    # Trained to flag ';' instead of '<': misses every canary attack
+    _publish_models(tmp_path, registry, "v2", attack_char=';')
+    report = waf.reload()
+
+    assert report['status'] == 'failed' and 'canary accuracy' in report['error']
+    assert waf.version == "v1"
+    assert waf.model_info()['failed_reloads'] == 1
+
+
+def test_watcher_follows_current_and_skips_rejected_versions(tmp_path, registry):
+    _publish_models(tmp_path, registry, "v1")
+    waf = WAFEngine(model_dir=registry.root)
+    calls = []
+    watcher = ModelWatcher(waf, reload=lambda version: calls.append(version) or waf.reload(version))
+
+    assert watcher.check() is None
+
+    _publish_models(tmp_path, registry, "v2")
+    assert watcher.check()['status'] == 'swapped'
+    assert waf.version == "v2"
+
+    (tmp_path / "registry" / "versions" / "v1" / "canary.jsonl").write_text("tampered\n")
+    registry.activate("v1")
+    assert watcher.check()['status'] == 'failed'
+    assert watcher.check() is None
+    assert calls == ["v2", "v1"]
@@ -0,0 +1,67 @@
+import asyncio
+
+from app.waf_batcher import WAFBatcher
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_requests_share_one_batch(engine):
+    async def score(payloads):
+        return engine.analyze_many(payloads)
+
+    async def scenario():
+        batcher = WAFBatcher(score, window_ms=5, max_batch=64)
+        payloads = ["q=%d" % i for i in range(10)] + ["<script>"]
+        results = await asyncio.gather(*(batcher.analyze(p) for p in payloads))
+        return batcher, results
+
+    batcher, results = run(scenario())
+
+    assert batcher.batches == 1
+    assert engine.detector.calls == 1
+    assert [r['is_attack'] for r in results] == [False] * 10 + [True]
+
+
+def test_full_batch_flushes_without_waiting_for_window():
+    sizes = []
+
+    async def score(payloads):
+        sizes.append(len(payloads))
+        return [{'is_attack': False, 'confidence': 0.0} for _ in payloads]
+
+    async def scenario():
+        batcher = WAFBatcher(score, window_ms=10_000, max_batch=4, max_wait_ms=1_000)
+        await asyncio.gather(*(batcher.analyze(str(i)) for i in range(8)))
+
+    run(scenario())
+    assert sizes == [4, 4]
+
+
+def test_max_wait_bounds_latency():
+    async def slow_score(payloads):
+        await asyncio.sleep(1)
+        return [{'is_attack': True, 'confidence': 1.0} for _ in payloads]
+
+    async def scenario():
+        batcher = WAFBatcher(slow_score, window_ms=1, max_wait_ms=20)
+        result = await batcher.analyze("x")
+        return batcher, result
+
+    batcher, result = run(scenario())
+    assert result['error'] == 'WAF verdict timed out' and result['unscored'] is True
+    assert batcher.timeouts == 1
+
+
+def test_scoring_failure_resolves_every_waiter():
+    async def broken(payloads):
+        raise RuntimeError("model crashed")
+
+    async def scenario():
+        batcher = WAFBatcher(broken, window_ms=1)
+        return await asyncio.gather(*(batcher.analyze(str(i)) for i in range(3)))
+
+    results = run(scenario())
+    assert [r['error'] for r in results] == ['model crashed'] * 3
+    assert all(r['unscored'] for r in results)
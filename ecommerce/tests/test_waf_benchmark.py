@@ -0,0 +1,28 @@
+from tools.waf_benchmark import compare, latency_summary, run_calls
+
+
+def test_single_rows_report_stage_latencies(engine):
+    report = run_calls(engine, [["<b>"], ["q=shoes"]], labels=[1, 0])
+
+    assert report['payloads'] == 2 and report['calls'] == 2 and report['errors'] == 0
+    assert report['accuracy'] == 1.0
+    # The stub detector has no STAGES, so its predict call is timed as one stage
+    assert set(report['stages_ms']) == {'extract', 'predict'}
+    assert report['latency_ms']['p50'] <= report['latency_ms']['max']
+
+
+def test_latency_summary_in_milliseconds():
+    summary = latency_summary([0.001] * 99 + [0.1])
+    assert summary['p50'] == 1.0 and summary['max'] == 100.0
+
+
+def test_compare_flags_throughput_drop_and_latency_growth():
+    baseline = {'modes': {'batch': {'payloads_per_sec': 1000.0, 'latency_ms': {'p95': 10.0, 'p99': 20.0},
+                                    'stages_ms': {'anomaly': {'p95': 4.0}}}}}
+    current = {'modes': {'batch': {'payloads_per_sec': 900.0, 'latency_ms': {'p95': 13.0, 'p99': 21.0},
+                                   'stages_ms': {'anomaly': {'p95': 8.0}}}}}
+
+    regressed = {metric for _, metric, _, _, _, bad in compare(baseline, current, tolerance=0.2) if bad}
+
+    # Stage latencies are reported but only whole-call numbers gate
+    assert regressed == {'latency_ms.p95'}
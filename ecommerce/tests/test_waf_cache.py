@@ -0,0 +1,51 @@
+import time
+
+from app.waf_cache import VerdictCache
+
+VERDICT = {'is_attack': True, 'confidence': 0.9, 'source': 'model'}
+
+
+def test_hit_returns_copy_without_source():
+    cache = VerdictCache()
+    cache.put("x", VERDICT)
+
+    hit = cache.get("x")
+    hit['is_attack'] = False
+
+    assert cache.get("x") == {'is_attack': True, 'confidence': 0.9}
+    assert cache.get("y") is None
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 1
+
+
+def test_errors_are_not_cached():
+    cache = VerdictCache()
+    cache.put("x", {'is_attack': False, 'confidence': 0.0, 'error': 'boom'})
+    assert cache.get("x") is None
+
+
+def test_lru_eviction_by_count():
+    cache = VerdictCache(max_entries=2)
+    cache.put("a", VERDICT)
+    cache.put("b", VERDICT)
+    cache.get("a")
+    cache.put("c", VERDICT)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_memory_ceiling():
+    cache = VerdictCache(max_entries=1000, max_bytes=3 * VerdictCache._entry_size(dict(VERDICT)))
+    for i in range(10):
+        cache.put(str(i), VERDICT)
+    stats = cache.stats()
+    assert stats['entries'] <= 3 and stats['bytes'] <= cache.max_bytes
+
+
+def test_ttl_expiry():
+    cache = VerdictCache(ttl_seconds=0.01)
+    cache.put("x", VERDICT)
+    time.sleep(0.02)
+    assert cache.get("x") is None
+    assert cache.stats()['expirations'] == 1
@@ -0,0 +1,20 @@
+from types import SimpleNamespace
+
+from app import waf_config
+
+
+def request(host, authorization=None):
+    return SimpleNamespace(client=SimpleNamespace(host=host),
+                           headers={"authorization": authorization} if authorization else {})
+
+
+def test_admin_guard_takes_the_token_or_else_loopback_callers(monkeypatch):
+    monkeypatch.setattr(waf_config, "WAF_ADMIN_TOKEN", "")
+    assert waf_config.admin_allowed(request("127.0.0.1"))
+    assert not waf_config.admin_allowed(request("10.0.0.7"))
+
+    monkeypatch.setattr(waf_config, "WAF_ADMIN_TOKEN", "s3cret")
+    assert waf_config.admin_allowed(request("10.0.0.7", "Bearer s3cret"))
+    # With a token set, being local is not enough
+    assert not waf_config.admin_allowed(request("127.0.0.1"))
+    assert not waf_config.admin_allowed(request("127.0.0.1", "Bearer wrong"))
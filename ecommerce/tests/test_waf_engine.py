@@ -0,0 +1,59 @@
+def test_analyze_many_matches_analyze_in_order(engine):
+    payloads = ["q=shoes", "<script>alert(1)</script>", "page=2", "<img src=x>"]
+
+    results = engine.analyze_many(payloads)
+
+    assert [r['is_attack'] for r in results] == [False, True, False, True]
+    assert results == [engine.analyze(p) for p in payloads]
+
+
+def test_analyze_many_uses_one_predict_call(engine):
+    engine.analyze_many(["a", "b", "<c>"] * 50)
+    assert engine.detector.calls == 1
+
+
+def test_analyze_many_isolates_bad_rows(engine):
+    class Unprintable:
+        def __str__(self):
+            raise RuntimeError("cannot render")
+
+    # 13 characters long: the stub detector rejects the row, failing the batch
+    payloads = ["<b>", Unprintable(), "thirteen char", "ok"]
+
+    results = engine.analyze_many(payloads)
+
+    assert results[0]['is_attack'] is True
+    assert 'cannot render' in results[1]['error']
+    assert 'poisoned row' in results[2]['error']
+    assert results[3] == {'is_attack': False, 'confidence': 0.0, 'source': 'model'}
+
+
+def test_analyze_many_without_models(tmp_path):
+    from app.waf_detector import WAFEngine
+
+    results = WAFEngine(model_dir=str(tmp_path)).analyze_many(["a", "b"])
+    assert [r['error'] for r in results] == ['Models not loaded'] * 2
+
+
+def test_cache_answers_repeats_without_the_model(engine):
+    from app.waf_cache import VerdictCache
+
+    engine.cache = VerdictCache(max_entries=10)
+    first = engine.analyze("<script>")
+    second = engine.analyze("<script>")
+    batch = engine.analyze_many(["<script>", "q=new"])
+
+    assert first['source'] == 'model' and second['source'] == 'cache'
+    assert second['is_attack'] == first['is_attack']
+    assert [r['source'] for r in batch] == ['cache', 'model']
+    assert engine.detector.calls == 2
+    assert engine.cache.stats()['hits'] == 2
+
+
+def test_reloading_models_invalidates_cache(engine):
+    from app.waf_cache import VerdictCache
+
+    engine.cache = VerdictCache()
+    engine.analyze("<b>")
+    engine.load_models()
+    assert engine.cache.stats()['entries'] == 0
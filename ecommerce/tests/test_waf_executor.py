@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.waf_cache import VerdictCache
+from app.waf_detector import ModelBundle
+from app.waf_executor import WAFExecutor
+
+
+def test_unknown_mode_is_rejected(engine):
+    with pytest.raises(ValueError):
+        WAFExecutor(engine, mode='gpu')
+
+
+@pytest.mark.parametrize("mode", ["inline", "thread"])
+def test_modes_return_engine_verdicts(engine, mode):
+    executor = WAFExecutor(engine, mode=mode, workers=2)
+    executor.start()
+    try:
+        results = asyncio.run(executor.analyze_many(["q=1", "<svg onload=x>"]))
+    finally:
+        executor.shutdown()
+    assert [r['is_attack'] for r in results] == [False, True]
+
+
+def test_thread_mode_keeps_event_loop_free(engine):
+    release = threading.Event()
+    original = engine.analyze_many
+
+    def blocking(payloads):
+        release.wait(5)
+        return original(payloads)
+
+    engine.analyze_many = blocking
+    executor = WAFExecutor(engine, mode='thread', workers=1)
+    executor.start()
+
+    async def scenario():
+        task = asyncio.create_task(executor.analyze("<x>"))
+        # The loop still runs other work while the worker thread is blocked
+        await asyncio.sleep(0.01)
+        assert not task.done()
+        release.set()
+        return await task
+
+    try:
+        assert asyncio.run(scenario())['is_attack'] is True
+    finally:
+        executor.shutdown()
+
+
+def test_full_queue_times_out(engine):
+    original = engine.analyze_many
+
+    def slow(payloads):
+        time.sleep(0.2)
+        return original(payloads)
+
+    engine.analyze_many = slow
+    executor = WAFExecutor(engine, mode='thread', workers=1, max_queue=1, timeout_ms=50)
+    executor.start()
+
+    async def scenario():
+        return await asyncio.gather(executor.analyze("a"), executor.analyze("b"))
+
+    try:
+        first, second = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert first['error'] == 'WAF verdict timed out'
+    assert second['error'] == 'WAF queue full'
+    assert first['unscored'] is True and second['unscored'] is True
+    assert executor.stats()['rejected'] == 1
+
+
+def test_process_verdicts_from_replaced_models_are_not_cached(engine):
+    engine.cache = VerdictCache()
+    executor = WAFExecutor(engine, mode='process')
+    # A started pool, minus the processes: _submit is replaced below
+    executor._pool, executor._pool_bundle = object(), engine.bundle
+    reload_midway = []
+
+    async def submit(payloads):
+        if reload_midway:
+            old = engine.bundle
+            engine.install(ModelBundle(old.detector, old.feature_extractor, old.columns, version="v2"))
+        return [{'is_attack': '<' in p, 'confidence': 0.9} for p in payloads]
+
+    executor._submit = submit
+    asyncio.run(executor.analyze_many(["<a>"]))
+    assert engine.cache.stats()['entries'] == 1
+
+    # Reload installed new models while the old pool was still scoring
+    reload_midway.append(True)
+    asyncio.run(executor.analyze_many(["<b>"]))
+    assert engine.cache.stats()['entries'] == 0
+
+    async def failing(payloads):
+        return [{'is_attack': False, 'confidence': 0.0, 'error': 'WAF verdict timed out'} for _ in payloads]
+
+    executor._submit, executor._pool_bundle = failing, engine.bundle
+    asyncio.run(executor.analyze_many(["<c>"]))
+    assert engine.cache.stats()['entries'] == 0
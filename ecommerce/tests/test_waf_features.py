@@ -0,0 +1,101 @@
+import random
+import re
+import time
+
+import numpy as np
+import pytest
+
+from app.keyword_matcher import KeywordMatcher
+from app.waf_detector import WAFBypassFeatureExtractor, WAFEngine
+from app.waf_vectorizer import WAFFeatureVectorizer
+
+PAYLOADS = [
+    "",
+    "q=shoes",
+    "page=2&sort=price",
+    "Hello World",
+    "SELECT * FROM users",
+    "<script>alert(1)</script>",
+    "admin' OR '1'='1",
+    "/etc/passwd",
+    "..//..\\\\etc/passwd %2e%2e%2f",
+    "%253Cscript%253E \\u003c \\x3c 0x41 \\101 &#60; &lt;",
+    "un/**/ion se\nlect -- # ||+ concat",
+    "ſelect ıframe KAT",
+    "Ünïcödé ½ ² \t\t\t  \r\n",
+    "{'username': 'admin', 'password': \"x\"}; DROP TABLE users;--",
+]
+
+
+def random_payloads(n, seed=0):
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 %&#;<>'\"/\\()[]{}=+-*|\n\tx.ſıİ"
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 300))) for _ in range(n)]
+
+
+@pytest.fixture(scope="module")
+def columns(tmp_path_factory):
+    # No models in the directory; only the column layout is needed
+    return WAFEngine(model_dir=str(tmp_path_factory.mktemp("models"))).X_train_columns
+
+
+def legacy_row(extractor, columns, payload):
+    features = extractor.extract_all_features(payload)
+    return np.array([features.get(col, 0) for col in columns], dtype=np.float64)
+
+
+@pytest.mark.parametrize("payload", PAYLOADS + random_payloads(200))
+def test_vectorizer_matches_extractor(columns, payload):
+    extractor = WAFBypassFeatureExtractor()
+    vectorizer = WAFFeatureVectorizer(extractor, columns)
+
+    expected = legacy_row(extractor, columns, payload)
+    actual = vectorizer.transform(payload)
+
+    mismatched = [columns[i] for i in np.flatnonzero(expected != actual)]
+    assert not mismatched, f"{mismatched} differ for {payload!r}"
+
+
+def test_transform_many_stacks_rows(columns):
+    vectorizer = WAFFeatureVectorizer(WAFBypassFeatureExtractor(), columns)
+    X = vectorizer.transform_many(PAYLOADS)
+
+    assert X.shape == (len(PAYLOADS), len(columns))
+    for i, payload in enumerate(PAYLOADS):
+        assert np.array_equal(X[i], vectorizer.transform(payload))
+
+
+def test_unknown_columns_stay_zero():
+    vectorizer = WAFFeatureVectorizer(WAFBypassFeatureExtractor(), ['length', 'not_a_feature'])
+    assert vectorizer.transform("abc").tolist() == [3.0, 0.0]
+
+
+def legacy_obfuscated(keyword, payload_lower):
+    escaped_keyword = ''.join(['\\' + c if not c.isalnum() else c for c in keyword])
+    return int(bool(re.search('.*'.join(list(escaped_keyword)), payload_lower, re.IGNORECASE)))
+
+
+@pytest.mark.parametrize("payload", PAYLOADS + random_payloads(300, seed=1) + [
+    "s\nelect", "sel\nect select", "passwd pasw\nd paswd", "ſelect", "ıframe", "İframe",
+    "e.t.c./.p.a.s.s.w.d", "w\ni\nn.ini", "wwwwwiiiinnnn....iiiinnnniiii", "winxini", "win\nini",
+    "etc//passwd", "etcpasswd", "wiiinini", "w\x00i\x00n\x00\x00i\x00n\x00i",
+])
+def test_keyword_matcher_matches_legacy_regex(payload):
+    keywords = [kw for kws in WAFBypassFeatureExtractor().attack_keywords.values() for kw in kws]
+    payload_lower = payload.lower()
+
+    plain, obfuscated = KeywordMatcher.for_keywords(tuple(keywords)).match(payload_lower)
+
+    assert plain == [int(kw in payload_lower) for kw in keywords]
+    assert obfuscated == [legacy_obfuscated(kw, payload_lower) for kw in keywords]
+
+
+def test_keyword_matcher_is_linear_on_adversarial_payload():
+    keywords = [kw for kws in WAFBypassFeatureExtractor().attack_keywords.values() for kw in kws]
+    matcher = KeywordMatcher.for_keywords(tuple(keywords))
+    payload = "selec" * (64 * 1024 // 5)
+
+    start = time.perf_counter()
+    plain, obfuscated = matcher.match(payload)
+    assert time.perf_counter() - start < 1.0
+    assert obfuscated[keywords.index('select')] == 0
@@ -0,0 +1,72 @@
+import logging
+
+from app.waf_logging import PayloadLog
+from app.waf_metrics import WAFMetrics
+
+
+def sample(metrics, name, labels=None):
+    return metrics.registry.get_sample_value(name, labels or {})
+
+
+def test_engine_stage_timings_reach_the_histograms(engine):
+    metrics = WAFMetrics()
+    engine.stage_observer = metrics.observe_stages
+
+    engine.analyze_many(["q=1", "<b>", "x"])
+
+    # The stub detector has no STAGES: extraction plus one 'predict' stage
+    assert sample(metrics, 'waf_stage_duration_seconds_count', {'stage': 'extract'}) == 1
+    assert sample(metrics, 'waf_stage_duration_seconds_count', {'stage': 'predict'}) == 1
+    assert sample(metrics, 'waf_batch_rows_sum') == 3
+
+
+def test_request_outcomes_by_verdict_source():
+    metrics = WAFMetrics()
+    passed = {'is_attack': False, 'confidence': 0.1, 'source': 'cache'}
+    blocked = {'is_attack': True, 'confidence': 0.9, 'source': 'model'}
+    errored = {'is_attack': False, 'confidence': 0.0, 'error': 'WAF verdict timed out'}
+
+    metrics.observe_request(["a", "<b>"], [passed, blocked], 0.002)
+    metrics.observe_request(["c"], [errored], 0.1)
+    metrics.observe_request(["d" * 100], [passed], 0.001)
+
+    assert sample(metrics, 'waf_requests_total', {'outcome': 'blocked'}) == 1
+    assert sample(metrics, 'waf_requests_total', {'outcome': 'errored'}) == 1
+    assert sample(metrics, 'waf_requests_total', {'outcome': 'passed'}) == 1
+    assert sample(metrics, 'waf_verdicts_total', {'outcome': 'passed', 'source': 'cache'}) == 2
+    assert sample(metrics, 'waf_verdicts_total', {'outcome': 'errored', 'source': 'none'}) == 1
+    assert sample(metrics, 'waf_payload_bytes_sum') == 1 + 3 + 1 + 100
+
+
+def test_model_info_follows_reloads():
+    metrics = WAFMetrics()
+    metrics.set_model({'version': 'v1', 'format': 'mapped', 'detector': 'FlatDetector'})
+    metrics.set_model({'version': 'v2', 'format': 'mapped', 'detector': 'FlatDetector'})
+
+    body, content_type = metrics.render()
+
+    assert content_type.startswith('text/plain')
+    assert b'version="v2"' in body and b'version="v1"' not in body
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_payload_log_samples_passed_and_keeps_blocked():
+    handler = ListHandler()
+    log = PayloadLog(sample_rate=0.0, max_chars=8, logger_name='test.waf.payloads')
+    log.start(handlers=[handler])
+    log.log_request("10.0.0.1", "/search", ["fine", "<script>alert(1)</script>\n"],
+                    [{'is_attack': False, 'source': 'model'}, {'is_attack': True, 'confidence': 0.9, 'source': 'model'}])
+    log.stop()
+
+    assert len(handler.messages) == 1
+    assert "blocked 10.0.0.1 /search" in handler.messages[0]
+    assert "payload='<script>...'" in handler.messages[0]
+    assert log.stats()['logged'] == 1
@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+from app.waf_middleware import WAFMiddleware, body_fields
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Recorder:
+    """Downstream ASGI app that echoes how much body it received."""
+
+    def __init__(self):
+        self.bodies = []
+
+    async def __call__(self, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        self.bodies.append(body)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+def make_middleware(**kwargs):
+    inspected = []
+    blocked = []
+
+    async def analyze(payload):
+        inspected.append(payload)
+        return {"is_attack": "<script>" in payload, "confidence": 0.9}
+
+    async def on_block(scope, payload, verdict):
+        blocked.append(payload)
+
+    app = Recorder()
+    return WAFMiddleware(app, analyze, on_block=on_block, **kwargs), app, inspected, blocked
+
+
+def request(middleware, method="GET", query=b"", body_chunks=(), content_type=None):
+    headers = [(b"content-type", content_type)] if content_type else []
+    scope = {"type": "http", "method": method, "path": "/search", "query_string": query,
+             "headers": headers, "client": ("10.0.0.1", 1234)}
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(body_chunks) - 1}
+                for i, chunk in enumerate(body_chunks)] or [{"type": "http.request", "body": b""}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    run(middleware(scope, receive, send))
+    return sent[0]["status"]
+
+
+def test_query_fields_are_inspected_separately():
+    middleware, app, inspected, blocked = make_middleware()
+
+    assert request(middleware, query=b"q=shoes&page=2") == 200
+    assert inspected == ["q", "shoes", "page", "2"]
+
+    assert request(middleware, query=b"q=%3Cscript%3Ealert(1)") == 403
+    assert blocked == ["<script>alert(1)"]
+    assert len(app.bodies) == 1
+
+
+def test_form_body_is_inspected_and_replayed():
+    middleware, app, inspected, _ = make_middleware()
+    body = b"username=alice&comment=nice+shoes"
+
+    status = request(middleware, "POST", body_chunks=[body[:10], body[10:]],
+                     content_type=b"application/x-www-form-urlencoded")
+
+    assert status == 200
+    assert inspected == ["username", "alice", "comment", "nice shoes"]
+    assert app.bodies == [body]
+
+
+def test_json_leaves_are_fields():
+    middleware, _, inspected, blocked = make_middleware()
+    body = json.dumps({"items": [{"qty": 2, "note": "<script>x</script>"}], "gift": False}).encode()
+
+    assert request(middleware, "POST", body_chunks=[body], content_type=b"application/json") == 403
+    assert inspected == ["2", "<script>x</script>"]
+    assert blocked == ["<script>x</script>"]
+
+
+def test_multipart_fields_and_filenames_but_not_file_contents():
+    middleware, app, inspected, _ = make_middleware()
+    body = (b"--xyz\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nsummer sale\r\n"
+            b"--xyz\r\nContent-Disposition: form-data; name=\"photo\"; filename=\"a.png\"\r\n"
+            b"Content-Type: image/png\r\n\r\n<script>binary</script>\r\n--xyz--\r\n")
+
+    status = request(middleware, "POST", body_chunks=[body[:40], body[40:]],
+                     content_type=b"multipart/form-data; boundary=xyz")
+
+    assert status == 200
+    assert inspected == ["summer sale", "a.png"]
+    assert app.bodies == [body]
+
+
+def test_body_past_the_cap_streams_through_uninspected():
+    middleware, app, inspected, _ = make_middleware(max_body_bytes=8)
+    chunks = [b"abcdef", b"ghijkl", b"<script>", b"tail"]
+
+    status = request(middleware, "POST", body_chunks=chunks, content_type=b"text/plain")
+
+    assert status == 200
+    assert inspected == ["abcdefgh"]
+    assert app.bodies == [b"".join(chunks)]
+
+
+def test_field_fan_out_is_bounded():
+    middleware, _, inspected, _ = make_middleware(max_fields=3)
+    request(middleware, query=b"&".join(b"k%d=v" % i for i in range(10)))
+    assert len(inspected) == 3
+
+
+def test_truncated_json_is_inspected_as_text():
+    assert body_fields(b"application/json", [b'{"a": "<scr'], complete=False) == ['{"a": "<scr']
+    assert body_fields(b"application/octet-stream", [b"\x00\x01"], complete=True) == []
+
+
+def test_unparseable_bodies_are_inspected_as_text():
+    middleware, app, inspected, _ = make_middleware()
+
+    deep = b"[" * 5000
+    assert request(middleware, "POST", body_chunks=[deep], content_type=b"application/json") == 200
+    assert request(middleware, "POST", body_chunks=[b"junk"], content_type=b"multipart/form-data; boundary=xyz") == 200
+    assert inspected == [deep.decode(), "junk"]
+    assert app.bodies == [deep, b"junk"]
+
+
+def test_on_inspect_sees_every_field_and_verdict():
+    seen = []
+    middleware, _, _, _ = make_middleware()
+    middleware.on_inspect = lambda scope, fields, verdicts, seconds: seen.append((fields, verdicts, seconds))
+
+    request(middleware, query=b"q=shoes")
+
+    [(fields, verdicts, seconds)] = seen
+    assert fields == ["q", "shoes"] and [v["is_attack"] for v in verdicts] == [False, False]
+    assert seconds >= 0
@@ -0,0 +1,155 @@
+import time
+
+import pytest
+
+from app.waf_overload import OverloadController, RoutePolicy, parse_route_policy
+from app.waf_prefilter import SignatureScreen
+from tests.test_waf_middleware import make_middleware, request
+
+
+def controller(**kwargs):
+    kwargs.setdefault('latency_budget_ms', 10)
+    kwargs.setdefault('queue_budget_ms', 10)
+    kwargs.setdefault('alpha', 1.0)
+    kwargs.setdefault('probe_rate', 0)
+    return OverloadController(step_down_s=60, recover_s=60, **kwargs)
+
+
+def later(overload, seconds, queue=False):
+    # Pretend the last level change was long ago, then report one sample
+    overload.changed_at -= 61
+    (overload.observe_queue if queue else overload.observe)(seconds)
+
+
+def test_steps_down_one_level_per_breach_and_emits_events():
+    events = []
+    overload = controller(route_policy={'/login': 'closed'}, on_change=events.append)
+    assert overload.admit('/search') == 'full'
+
+    later(overload, 0.05)
+    assert overload.admit('/search') == 'screen'
+    later(overload, 0.05, queue=True)
+    assert overload.level_name == 'shed'
+    assert overload.admit('/search') == 'open'
+    assert overload.admit('/login/submit') == 'closed'
+
+    assert [(e['from'], e['to']) for e in events] == [('full', 'screen'), ('screen', 'shed')]
+    assert events[0]['latency_ms'] == 50.0
+
+
+def test_recovers_one_level_at_a_time_once_under_budget():
+    overload = controller()
+    later(overload, 0.05)
+    later(overload, 0.05)
+    assert overload.level_name == 'shed'
+
+    # Under budget, but not for long enough yet
+    overload.observe(0.001)
+    assert overload.level_name == 'shed'
+    later(overload, 0.001)
+    assert overload.level_name == 'screen'
+    later(overload, 0.001)
+    assert overload.level_name == 'full'
+
+
+def test_step_down_is_rate_limited():
+    overload = controller()
+    later(overload, 0.05)
+    overload.observe(0.05)
+    assert overload.level_name == 'screen'
+
+
+def test_probes_take_the_full_path_while_degraded():
+    overload = controller(probe_rate=1.0)
+    later(overload, 0.05)
+    assert overload.admit('/search') == 'full'
+    assert overload.stats()['admitted']['probe'] == 1
+
+
+def test_route_policy_parsing():
+    assert parse_route_policy(" /login=closed, /checkout = CLOSED ,") == {'/login': 'closed', '/checkout': 'closed'}
+    with pytest.raises(ValueError):
+        parse_route_policy("/login=maybe")
+
+
+def test_signature_screen():
+    screen = SignatureScreen()
+    assert screen.verdict("summer shoes")['is_attack'] is False
+    assert screen.verdict("1%27 OR 1=1")['is_attack'] is True
+    assert screen.verdict("x")['source'] == 'screen'
+
+
+@pytest.mark.parametrize("text", [
+    "O'Brien", "men's shoes", 'He said "great fit"; would buy again', "12 Main St. Apt 4; Springfield",
+    "Tom & Jerry | DVD box set", "size > 10 < 20", "rock 'n' roll", "Can't wait -- arrives tomorrow!",
+    '5\' 11" tall', '"yes" or "no"', "Select the size from the list", "It's 50% off!",
+])
+def test_signature_screen_passes_everyday_punctuation(text):
+    assert SignatureScreen().verdict(text)['is_attack'] is False
+
+
+@pytest.mark.parametrize("text", [
+    "' OR '1'='1", "admin'--", "1 UNION SELECT password FROM users", "x'; drop table users--",
+    "<script>alert(1)</script>", "%3Cscript%3Ealert(1)%3C/script%3E", "<img src=x onerror=alert(1)>",
+    "../../etc/passwd", "; cat /etc/passwd", "| whoami", "{{7*7}}",
+])
+def test_signature_screen_flags_attack_patterns(text):
+    assert SignatureScreen().verdict(text)['is_attack'] is True
+
+
+@pytest.mark.parametrize("unit", ["{{", "${", "<%", "union /*", " ", "' ", "or 1", "%25", "< "])
+def test_signature_screen_is_linear_on_adversarial_payload(unit):
+    # Openers that never close, repeated over a 64 KB field
+    payload = unit * (64 * 1024 // len(unit))
+
+    start = time.perf_counter()
+    SignatureScreen().verdict(payload)
+    assert time.perf_counter() - start < 1.0
+
+
+def test_middleware_follows_the_admission_decision():
+    overload = controller(route_policy={'/search': 'closed'})
+    screened = []
+
+    async def screen(payload):
+        screened.append(payload)
+        return {'is_attack': False, 'confidence': 0.0, 'source': 'screen'}
+
+    middleware, app, inspected, _ = make_middleware(overload=overload, screen=screen)
+
+    assert request(middleware, query=b"q=shoes") == 200
+    assert inspected == ["q", "shoes"]
+
+    later(overload, 0.05)
+    assert request(middleware, query=b"q=boots") == 200
+    assert screened == ["q", "boots"] and len(inspected) == 2
+
+    later(overload, 0.05)
+    assert request(middleware, query=b"q=sandals") == 503
+    # Requests with nothing to inspect are never shed
+    assert request(middleware) == 200
+    assert len(app.bodies) == 3
+
+
+def test_unscored_verdicts_follow_the_route_policy():
+    async def overloaded(payload):
+        if payload == "slow":
+            return {'is_attack': False, 'confidence': 0.0, 'error': 'WAF queue full', 'unscored': True}
+        return {'is_attack': "<script>" in payload, 'confidence': 0.9}
+
+    closed, app, _, _ = make_middleware(shed_policy=RoutePolicy({'/search': 'closed'}))
+    closed.analyze = overloaded
+    assert request(closed, query=b"q=slow") == 503
+    # A verdict that was reached still decides
+    assert request(closed, query=b"q=<script>&p=slow") == 403
+    assert request(closed, query=b"q=shoes") == 200
+
+    opened, app, _, _ = make_middleware(shed_policy=RoutePolicy({'/login': 'closed'}))
+    opened.analyze = overloaded
+    assert request(opened, query=b"q=slow") == 200
+    assert len(app.bodies) == 1
+
+    # Without a policy of its own the middleware takes the overload controller's
+    middleware, _, _, _ = make_middleware(overload=controller(route_policy={'/search': 'closed'}))
+    middleware.analyze = overloaded
+    assert request(middleware, query=b"q=slow") == 503
@@ -0,0 +1,38 @@
+import pytest
+
+from app.waf_detector import ModelBundle, WAFBypassFeatureExtractor
+from app.waf_prefilter import BenignPrefilter
+
+
+@pytest.fixture
+def prefilter():
+    return BenignPrefilter.for_extractor(WAFBypassFeatureExtractor())
+
+
+@pytest.mark.parametrize("payload", ["q=shoes", "page=2", "page=2&size=10", "q=red hat"])
+def test_plain_query_strings_pass(prefilter, payload):
+    assert prefilter.is_benign(payload)
+
+
+@pytest.mark.parametrize("payload", [
+    "q=<b>",                # special character
+    "q=%27",                # url encoding
+    "q=a--b",               # SQL comment
+    "q=0x41",               # hex literal
+    "q=union",              # keyword
+    "q=s e l e c t",        # scattered keyword
+    "q=" + "a" * 100,       # too long
+])
+def test_suspicious_payloads_go_to_the_model(prefilter, payload):
+    assert not prefilter.is_benign(payload)
+
+
+def test_engine_skips_model_for_benign_payloads(engine):
+    engine.install(ModelBundle(engine.detector, engine.feature_extractor, engine.X_train_columns,
+                               prefilter=BenignPrefilter.for_extractor(engine.feature_extractor)))
+
+    results = engine.analyze_many(["page=2", "<img>"])
+
+    assert [r['source'] for r in results] == ['prefilter', 'model']
+    assert engine.analyze("page=3")['source'] == 'prefilter'
+    assert engine.prefilter.stats()['passed'] == 2
@@ -0,0 +1,125 @@
+import os
+import time
+
+from app.waf_reputation import PROBE_LENGTH, ReputationTable
+from tests.test_waf_middleware import make_middleware, request
+
+
+def test_source_is_banned_at_the_threshold_and_rejected():
+    bans = []
+    table = ReputationTable(threshold=3, on_ban=bans.append)
+
+    assert [table.record_block("203.0.113.7") for _ in range(3)] == [False, False, True]
+    assert table.check("203.0.113.7") is True
+    assert table.check("203.0.113.8") is False
+    assert [(e['source'], e['blocks']) for e in bans] == [("203.0.113.7/32", 3)]
+    # IPv4-mapped IPv6 is the same source
+    assert table.check("::ffff:203.0.113.7") is True
+
+    stats = table.stats()
+    assert (stats['banned'], stats['bans'], stats['rejected']) == (1, 1, 2)
+    assert stats['top_banned'][0]['source'] == "203.0.113.7/32"
+    assert stats['top_banned'][0]['rejected'] == 2
+
+
+def test_ipv6_sources_are_grouped_by_prefix():
+    table = ReputationTable(threshold=2, ipv6_prefix=64)
+    table.record_block("2001:db8::1")
+    assert table.record_block("2001:db8::ffff") is True
+    assert table.check("2001:db8::abcd") is True
+    assert table.check("2001:db8:0:1::1") is False
+
+
+def test_blocks_outside_the_window_decay():
+    table = ReputationTable(threshold=3, window_seconds=0.05, buckets=5)
+    table.record_block("10.0.0.1")
+    table.record_block("10.0.0.1")
+    time.sleep(0.06)
+    assert table.record_block("10.0.0.1") is False
+    assert table.check("10.0.0.1") is False
+
+
+def test_ban_is_released_after_a_quiet_period():
+    table = ReputationTable(threshold=1, quiet_seconds=0.05)
+    table.record_block("10.0.0.1")
+    time.sleep(0.03)
+    # Still sending: the release moves back
+    assert table.check("10.0.0.1") is True
+    time.sleep(0.03)
+    assert table.check("10.0.0.1") is True
+    time.sleep(0.06)
+    assert table.check("10.0.0.1") is False
+
+
+def test_table_size_is_capped_and_bans_survive_churn():
+    table = ReputationTable(threshold=2, capacity=32)
+    table.record_block("192.0.2.1")
+    table.record_block("192.0.2.1")
+
+    for i in range(2000):
+        table.record_block(f"10.{i // 65536}.{i // 256 % 256}.{i % 256}")
+
+    stats = table.stats()
+    assert stats['tracked'] <= 32
+    assert stats['evictions'] > 0
+    assert table.table.nbytes == 32 * stats['entry_bytes']
+    assert table.check("192.0.2.1") is True
+
+
+def test_full_probe_window_evicts_least_recently_seen():
+    table = ReputationTable(threshold=100, capacity=PROBE_LENGTH)
+    sources = [f"10.0.0.{i}" for i in range(PROBE_LENGTH)]
+    for source in sources:
+        table.record_block(source)
+    table.record_block(sources[0])
+
+    table.record_block("10.0.1.1")
+
+    assert table.evictions == 1
+    assert table._find(table._base(*table.key(sources[1])), *table.key(sources[1])) is None
+    assert table._find(table._base(*table.key(sources[0])), *table.key(sources[0])) is not None
+
+
+def test_shared_table_is_seen_by_every_attached_worker():
+    name = f"waf-reputation-test-{os.getpid()}"
+    first = ReputationTable(threshold=2, capacity=1024, shared_name=name)
+    second = ReputationTable(threshold=2, capacity=1024, shared_name=name)
+    try:
+        first.record_block("198.51.100.9")
+        assert second.record_block("198.51.100.9") is True
+        assert first.check("198.51.100.9") is True
+        assert second.stats()['top_banned'][0]['rejected'] == 1
+    finally:
+        first.close()
+        second.unlink()
+        second.close()
+
+
+def test_banned_source_is_rejected_without_inspection():
+    rejected = []
+    table = ReputationTable(threshold=2)
+    middleware, app, inspected, blocked = make_middleware(reputation=table, on_reject=rejected.append)
+
+    assert request(middleware, query=b"q=<script>") == 403
+    assert request(middleware, query=b"q=<script>") == 403
+    assert len(inspected) == 4 and len(blocked) == 2
+
+    assert request(middleware, query=b"q=shoes") == 403
+    assert len(inspected) == 4 and len(rejected) == 1
+    assert app.bodies == []
+
+
+def test_signature_screen_blocks_do_not_count_toward_a_ban():
+    class Shedding:
+        def admit(self, path):
+            return 'screen'
+
+    async def screen(payload):
+        return {'is_attack': "'" in payload, 'confidence': 1.0, 'source': 'screen'}
+
+    table = ReputationTable(threshold=1)
+    middleware, _, _, blocked = make_middleware(reputation=table, overload=Shedding(), screen=screen)
+
+    assert request(middleware, query=b"q=men's+shoes") == 403
+    assert len(blocked) == 1
+    assert table.check("10.0.0.1") is False and table.stats()['bans'] == 0
@@ -0,0 +1,165 @@
+import asyncio
+import json
+
+import httpx
+
+from app.waf_client import WAFClient
+from app.waf_socket import SocketServer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def verdict(payload):
+    return {'is_attack': '<' in payload, 'confidence': 0.9 if '<' in payload else 0.1, 'source': 'model'}
+
+
+async def score_many(payloads):
+    # Later payloads finish first, so pipelined answers come back out of order
+    await asyncio.sleep(0.02 if payloads[0] == 'slow' else 0)
+    return [verdict(p) for p in payloads]
+
+
+async def score_one(payload):
+    return verdict(payload)
+
+
+def test_socket_client_pipelines_requests_over_one_connection(tmp_path):
+    path = str(tmp_path / "waf.sock")
+
+    async def scenario():
+        server = SocketServer(path, score_one, score_many)
+        await server.start()
+        client = WAFClient(f"unix://{path}", connections=1)
+        await client.start()
+        try:
+            results = await asyncio.gather(
+                client.analyze_many(["slow", "<b>"]),
+                client.analyze("q=1"),
+                client.analyze("<script>"),
+            )
+        finally:
+            await client.close()
+            await server.stop()
+        return results, server.stats()
+
+    results, stats = run(scenario())
+
+    assert [v['is_attack'] for v in results[0]] == [False, True]
+    assert results[1]['is_attack'] is False and results[2]['is_attack'] is True
+    assert stats['connections'] == 1 and stats['requests'] == 3
+
+
+def test_raw_socket_protocol_answers_bad_lines_with_errors(tmp_path):
+    path = str(tmp_path / "waf.sock")
+
+    async def scenario():
+        server = SocketServer(path, score_one, score_many)
+        await server.start()
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(b'{"id": 7, "payload": "<x>"}\nnot json\n')
+        await writer.drain()
+        lines = [json.loads(await reader.readline()) for _ in range(2)]
+        writer.close()
+        await server.stop()
+        return sorted(lines, key=lambda line: str(line['id']))
+
+    first, second = run(scenario())
+
+    assert first['id'] == 7 and first['verdicts'][0]['is_attack'] is True
+    assert second['id'] is None and second['error'].startswith('bad request')
+
+
+def test_unreachable_service_gives_error_verdicts(tmp_path):
+    async def scenario():
+        client = WAFClient(f"unix://{tmp_path / 'missing.sock'}")
+        await client.start()
+        results = await client.analyze_many(["a", "b"])
+        await client.close()
+        return results, client.stats()
+
+    results, stats = run(scenario())
+
+    assert all(r['error'].startswith('WAF service unavailable') and r['is_attack'] is False for r in results)
+    assert all(r['unscored'] for r in results)
+    assert stats['errors'] == 1
+
+
+def test_http_client_posts_batches():
+    seen = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        seen.append((request.url.path, body))
+        return httpx.Response(200, json={'verdicts': [verdict(p) for p in body['payloads']]})
+
+    async def scenario():
+        client = WAFClient("http://waf:8090", client=httpx.AsyncClient(
+            base_url="http://waf:8090", transport=httpx.MockTransport(handler)))
+        await client.start()
+        results = await client.analyze_many(["a", "<b>"])
+        await client.close()
+        return results
+
+    results = run(scenario())
+
+    assert [r['is_attack'] for r in results] == [False, True]
+    assert seen == [("/v1/analyze/batch", {'payloads': ["a", "<b>"]})]
+
+
+def test_http_client_sends_single_payloads_alone_and_splits_long_lists():
+    seen = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        seen.append((request.url.path, body))
+        if 'payload' in body:
+            return httpx.Response(200, json=verdict(body['payload']))
+        return httpx.Response(200, json={'verdicts': [verdict(p) for p in body['payloads']]})
+
+    async def scenario():
+        client = WAFClient("http://waf:8090", max_batch=2, client=httpx.AsyncClient(
+            base_url="http://waf:8090", transport=httpx.MockTransport(handler)))
+        await client.start()
+        single = await client.analyze("<a>")
+        many = await client.analyze_many(["a", "<b>", "c", "<d>", "e"])
+        await client.close()
+        return single, many
+
+    single, many = run(scenario())
+
+    assert single['is_attack'] is True
+    assert [r['is_attack'] for r in many] == [False, True, False, True, False]
+    # The single payload goes where the service coalesces it with other callers'
+    assert seen[0] == ("/v1/analyze", {'payload': "<a>"})
+    assert sorted(len(body.get('payloads', [body.get('payload')])) for _, body in seen[1:]) == [1, 2, 2]
+
+
+def test_socket_server_refuses_oversized_batches(tmp_path):
+    path = str(tmp_path / "waf.sock")
+    scored = []
+
+    async def counting(payload):
+        scored.append(payload)
+        return verdict(payload)
+
+    async def scenario():
+        server = SocketServer(path, counting, score_many, max_batch=2)
+        await server.start()
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(b'{"id": 1, "payloads": ["a", "b", "c"]}\n')
+        await writer.drain()
+        oversized = json.loads(await reader.readline())
+        writer.close()
+        client = WAFClient(f"unix://{path}", connections=1)
+        await client.start()
+        single = await client.analyze("<x>")
+        await client.close()
+        await server.stop()
+        return oversized, single
+
+    oversized, single = run(scenario())
+
+    assert oversized['id'] == 1 and 'exceeds 2' in oversized['error']
+    assert single['is_attack'] is True and scored == ["<x>"]
@@ -0,0 +1,95 @@
+"""
+Worst-case benchmark for the obfuscated-keyword matcher.
+
+Runs adversarial payload families (near-miss keyword prefixes, repeated first
+letters, newline floods, random keyword letters) through KeywordMatcher at
+64 KB and through the legacy `k.*e.*y` regexes at much smaller sizes: their
+nested backtracking is polynomial in the keyword length (a 128 byte near-miss
+of "select" already costs hundreds of milliseconds), so 64 KB never finishes.
+
+Usage (from the ecommerce directory):
+    python -m tools.bench_keywords [--size 65536] [--legacy-sizes 32 64 128]
+"""
+import argparse
+import random
+import re
+import time
+
+from app.keyword_matcher import KeywordMatcher
+from app.waf_detector import WAFBypassFeatureExtractor
+
+
+def keywords():
+    extractor = WAFBypassFeatureExtractor()
+    return tuple(kw for kws in extractor.attack_keywords.values() for kw in kws)
+
+
+def legacy_match(keywords, payload_lower):
+    flags = []
+    for keyword in keywords:
+        escaped_keyword = ''.join(['\\' + c if not c.isalnum() else c for c in keyword])
+        flags.append(int(bool(re.search('.*'.join(list(escaped_keyword)), payload_lower, re.IGNORECASE))))
+    return flags
+
+
+def adversarial_payloads(size):
+    rng = random.Random(0)
+    letters = sorted(set(''.join(keywords())))
+
+    def fill(unit):
+        return (unit * (size // len(unit) + 1))[:size]
+
+    return {
+        'repeated_first_letter': fill('s'),
+        'near_miss_prefixes': fill(''.join(kw[:-1] for kw in keywords())),
+        'near_miss_select': fill('selec'),
+        'newline_flood': fill('s\n'),
+        'random_keyword_letters': ''.join(rng.choice(letters) for _ in range(size)),
+        'random_printable': ''.join(chr(rng.randint(32, 126)) for _ in range(size)),
+    }
+
+
+def timed(fn, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=64 * 1024, help='payload size for the matcher')
+    parser.add_argument('--legacy-sizes', type=int, nargs='*', default=[32, 64, 128],
+                        help='payload sizes for the legacy regexes (0 disables them)')
+    args = parser.parse_args()
+
+    kws = keywords()
+    matcher = KeywordMatcher.for_keywords(kws)
+
+    print(f"KeywordMatcher, {len(kws)} keywords, {args.size} byte payloads")
+    print(f"{'family':<26} | {'ms':>10}")
+    print("-" * 40)
+    for name, payload in adversarial_payloads(args.size).items():
+        elapsed = timed(matcher.match, payload.lower())
+        print(f"{name:<26} | {elapsed * 1000:>10.2f}")
+
+    legacy_sizes = [s for s in args.legacy_sizes if s > 0]
+    if not legacy_sizes:
+        return
+
+    print(f"\nLegacy regexes vs KeywordMatcher (ms), sizes {legacy_sizes}")
+    print(f"{'family':<26} | {'size':>6} | {'legacy':>10} | {'matcher':>10} | {'agree':>5}")
+    print("-" * 70)
+    for size in legacy_sizes:
+        for name, payload in adversarial_payloads(size).items():
+            payload_lower = payload.lower()
+            legacy = timed(legacy_match, kws, payload_lower, repeat=1)
+            current = timed(matcher.match, payload_lower)
+            agree = legacy_match(kws, payload_lower) == matcher.match_obfuscated(payload_lower)
+            print(f"{name:<26} | {size:>6} | {legacy * 1000:>10.2f} | {current * 1000:>10.2f} | {str(agree):>5}")
+
+
+if __name__ == '__main__':
+    main()
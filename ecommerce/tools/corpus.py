@@ -0,0 +1,29 @@
+"""
+Corpus loading shared by the offline WAF tools and the model registry's
+canary check (app.model_registry).
+
+Two formats are accepted:
+- JSON Lines (.jsonl): one object per line with a "payload" string and an
+  optional "label" (1/true = attack, 0/false = benign)
+- anything else: one payload per line, unlabeled
+"""
+import json
+
+
+def load_corpus(path):
+    """Return a list of (payload, label) pairs; label is None when unknown."""
+    corpus = []
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                label = record.get('label')
+                corpus.append((record['payload'], None if label is None else int(bool(label))))
+        else:
+            for line in f:
+                line = line.rstrip('\n')
+                if line:
+                    corpus.append((line, None))
+    return corpus
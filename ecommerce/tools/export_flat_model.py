@@ -0,0 +1,125 @@
+"""
+Export the pickled WAF models to the flat NumPy format and verify the export.
+
+Converts the fitted scaler, IsolationForest and tree ensemble inside
+waf_bypass_detector_complete.pkl (plus the feature extractor's configuration)
+into MODEL_DIR/waf_model_flat.npz, which WAFEngine serves without sklearn,
+pandas or joblib. With --mapped the same arrays are also written as one .npy
+file each under MODEL_DIR/waf_model_mapped/, which every worker process
+memory-maps read-only instead of holding its own copy. Each export is then
+checked against the original WAFBypassDetector.predict on a corpus:
+predictions and probabilities must be bit-for-bit identical. Exports are
+written next to their destination and only moved into place once that holds
+for all of them; otherwise they are deleted, the previous exports are left
+alone and the tool exits non-zero.
+
+Needs the training dependencies (sklearn, joblib); serving does not.
+
+Usage (from the ecommerce directory):
+    python -m tools.export_flat_model --model-dir models --corpus traffic.jsonl [--out models/waf_model_flat.npz] [--mapped]
+"""
+import argparse
+import os
+import shutil
+import time
+
+import numpy as np
+
+from app.flat_model import FLAT_MODEL_FILE, MAPPED_MODEL_DIR, FlatDetector, export_detector
+from app.waf_detector import WAFEngine
+from tools.corpus import load_corpus
+
+
+def compare(reference, candidate, X):
+    """Return the row indices where candidate.predict differs from reference.predict."""
+    ref_pred, ref_proba = reference.predict(X)
+    cand_pred, cand_proba = candidate.predict(X)
+    ref_pred = np.asarray(ref_pred)
+    ref_proba = np.asarray(ref_proba, dtype=np.float64)
+    same = (ref_pred == cand_pred) & (ref_proba.view(np.uint64) == cand_proba.view(np.uint64))
+    return np.flatnonzero(~same)
+
+
+def replace_dir(staged, target):
+    """Rename directory `staged` to `target`, deleting the one it replaces."""
+    retired = None
+    if os.path.exists(target):
+        # Workers that mapped the old arrays keep them until they reload; unlinking does not unmap
+        retired = f'{target}.{os.getpid()}.old'
+        os.rename(target, retired)
+    os.rename(staged, target)
+    if retired:
+        shutil.rmtree(retired)
+
+
+def verify(reference, exports, payloads, X, show) -> bool:
+    """Time and compare each export against the reference; True when all are bit-identical."""
+    start = time.perf_counter()
+    reference.predict(X)
+    pickle_seconds = time.perf_counter() - start
+    print(f"Payloads:     {len(payloads)}")
+    print(f"sklearn:      {pickle_seconds:.3f}s")
+
+    identical = True
+    for path, flat in exports.items():
+        start = time.perf_counter()
+        flat.predict(X)
+        flat_seconds = time.perf_counter() - start
+        mismatches = compare(reference, flat, X)
+
+        print(f"{path}:")
+        print(f"  predict:    {flat_seconds:.3f}s")
+        print(f"  mismatches: {len(mismatches)}")
+        for i in mismatches[:show]:
+            print(f"  MISMATCH  {payloads[i]!r}")
+        identical = identical and len(mismatches) == 0
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--corpus', required=True, help='.jsonl with payload/label, or one payload per line')
+    parser.add_argument('--out', help=f'defaults to MODEL_DIR/{FLAT_MODEL_FILE}')
+    parser.add_argument('--mapped', action='store_true', help=f'also write MODEL_DIR/{MAPPED_MODEL_DIR}/')
+    parser.add_argument('--show', type=int, default=20, help='mismatches to print')
+    args = parser.parse_args()
+
+    waf = WAFEngine(model_dir=args.model_dir, model_format='pickle')
+    if not waf.detector:
+        raise SystemExit("Models could not be loaded")
+
+    payloads = [payload for payload, _ in load_corpus(args.corpus)]
+    X = waf.vectorizer.transform_many(payloads)
+
+    flat = export_detector(waf.detector, waf.feature_extractor, waf.X_train_columns)
+    out = args.out or os.path.join(args.model_dir, FLAT_MODEL_FILE)
+    # Written beside the destination and verified before it replaces what a running WAFEngine
+    # may load; ends in .npz so np.savez keeps the name
+    staged = f'{out}.{os.getpid()}.tmp.npz'
+    mapped_dir = os.path.join(args.model_dir, MAPPED_MODEL_DIR)
+    staged_dir = f'{mapped_dir}.{os.getpid()}.tmp'
+    identical = False
+    try:
+        flat.save(staged)
+        exports = {out: FlatDetector.load(staged)}
+        if args.mapped:
+            flat.save_mapped(staged_dir)
+            exports[mapped_dir] = FlatDetector.load_mapped(staged_dir)
+
+        identical = verify(waf.detector, exports, payloads, X, args.show)
+        if identical:
+            os.replace(staged, out)
+            if args.mapped:
+                replace_dir(staged_dir, mapped_dir)
+    finally:
+        if os.path.exists(staged):
+            os.remove(staged)
+        if os.path.exists(staged_dir):
+            shutil.rmtree(staged_dir)
+    if not identical:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
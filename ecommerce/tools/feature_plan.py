@@ -0,0 +1,140 @@
+"""
+Derive a pruned feature-extraction plan from the loaded WAF models.
+
+Counts, per feature column, the split nodes that test it in the
+IsolationForest and in the ensemble trees (and lists the ensemble's
+feature_importances_ when the pickled model has them). Columns no tree
+ever splits on cannot change a prediction, so the plan stops computing
+them and fills them with the value the scaler maps to 0.
+
+The plan is then checked on a corpus: predictions and probabilities from
+pruned extraction must be bit-for-bit identical to full extraction,
+otherwise nothing is written and the tool exits non-zero. Extraction and
+end-to-end timings of both are reported. The plan is written to
+MODEL_DIR/feature_plan.json, where WAFEngine picks it up on the next load
+(set WAF_FEATURE_PLAN=0 to ignore it). The plan records the models'
+fingerprint, and the engine ignores it for any other models: rerun the
+tool after retraining or re-exporting. For a model registry, point
+--model-dir at the version directory before publishing it.
+
+Needs sklearn for pickled models (they are read through the flat export).
+
+Usage (from the ecommerce directory):
+    python -m tools.feature_plan --model-dir models --corpus traffic.jsonl [--out PATH] [--show 25]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app.flat_model import FlatDetector, export_detector
+from app.waf_detector import WAFEngine
+from app.waf_vectorizer import FEATURE_PLAN_FILE, FeaturePlan, WAFFeatureVectorizer
+from tools.corpus import load_corpus
+
+
+def ensemble_importances(detector):
+    """feature_importances_ of the pickled ensemble (averaged over voting members), or None."""
+    ensemble = getattr(detector, 'ensemble', None)
+    if ensemble is None:
+        return None
+    if hasattr(ensemble, 'feature_importances_'):
+        return np.asarray(ensemble.feature_importances_, dtype=np.float64)
+    members = [m for m in getattr(ensemble, 'estimators_', []) if hasattr(m, 'feature_importances_')]
+    if not members:
+        return None
+    return np.mean([m.feature_importances_ for m in members], axis=0)
+
+
+def build_plan(flat: FlatDetector, columns, meta=None) -> FeaturePlan:
+    usage = flat.feature_usage()
+    used = (usage['anomaly'] + usage['ensemble']) > 0
+    center = flat.scaler_center()
+    active = [c for c, u in zip(columns, used) if u]
+    fill = {c: float(v) for c, u, v in zip(columns, used, center) if not u}
+    return FeaturePlan(columns, active, fill, dict(meta or {}, model_fingerprint=flat.fingerprint()))
+
+
+def mismatches(detector, X_full, X_pruned):
+    """Row indices where predictions or probabilities differ between the two matrices."""
+    full_pred, full_proba = detector.predict(X_full)
+    pruned_pred, pruned_proba = detector.predict(X_pruned)
+    full_proba = np.asarray(full_proba, dtype=np.float64)
+    pruned_proba = np.asarray(pruned_proba, dtype=np.float64)
+    same = (np.asarray(full_pred) == np.asarray(pruned_pred)) & \
+           (full_proba.view(np.uint64) == pruned_proba.view(np.uint64))
+    return np.flatnonzero(~same)
+
+
+def best_of(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--model-format', default='auto', choices=WAFEngine.MODEL_FORMATS)
+    parser.add_argument('--corpus', required=True, help='.jsonl with payload/label, or one payload per line')
+    parser.add_argument('--out', help=f'defaults to MODEL_DIR/{FEATURE_PLAN_FILE}')
+    parser.add_argument('--show', type=int, default=25, help='columns to list, most used first')
+    args = parser.parse_args()
+
+    waf = WAFEngine(model_dir=args.model_dir, model_format=args.model_format, use_feature_plan=False)
+    if not waf.detector:
+        raise SystemExit("Models could not be loaded")
+    detector = waf.detector
+    columns = waf.X_train_columns
+    flat = detector if isinstance(detector, FlatDetector) else export_detector(
+        detector, waf.feature_extractor, columns)
+
+    plan = build_plan(flat, columns, meta={'model_version': waf.version, 'created_at': time.time()})
+    usage = flat.feature_usage()
+    importances = ensemble_importances(detector)
+
+    print(f"{len(plan.active)} of {len(columns)} features are used by the models")
+    order = np.argsort(-(usage['anomaly'] + usage['ensemble']), kind='stable')
+    print(f"{'column':<36} | {'anomaly':>8} | {'ensemble':>8} | {'importance':>10}")
+    print("-" * 72)
+    for i in order[:args.show]:
+        importance = '-' if importances is None else f"{importances[i]:.4f}"
+        print(f"{columns[i]:<36} | {usage['anomaly'][i]:>8} | {usage['ensemble'][i]:>8} | {importance:>10}")
+    unused = [c for c in columns if c not in set(plan.active)]
+    if unused:
+        print(f"\nNot computed: {', '.join(unused)}")
+
+    payloads = [payload for payload, _ in load_corpus(args.corpus)]
+    full = WAFFeatureVectorizer(waf.feature_extractor, columns)
+    pruned = WAFFeatureVectorizer(waf.feature_extractor, columns, plan=plan)
+    X_full = full.transform_many(payloads)
+    X_pruned = pruned.transform_many(payloads)
+
+    bad = mismatches(detector, X_full, X_pruned)
+    print(f"\nVerified on {len(payloads)} payloads: {len(payloads) - len(bad)} identical, {len(bad)} differ")
+    if len(bad):
+        for i in bad[:10]:
+            print(f"  differs: {payloads[i][:80]!r}")
+        raise SystemExit("Pruned extraction changes predictions; plan not written")
+
+    full_extract = best_of(lambda: full.transform_many(payloads))
+    pruned_extract = best_of(lambda: pruned.transform_many(payloads))
+    full_total = best_of(lambda: detector.predict(full.transform_many(payloads)))
+    pruned_total = best_of(lambda: detector.predict(pruned.transform_many(payloads)))
+    print(f"Extraction: {full_extract * 1000:.1f} ms -> {pruned_extract * 1000:.1f} ms "
+          f"({full_extract / pruned_extract:.2f}x)")
+    print(f"Extraction + models: {full_total * 1000:.1f} ms -> {pruned_total * 1000:.1f} ms "
+          f"({full_total / pruned_total:.2f}x)")
+
+    out = args.out or os.path.join(args.model_dir, FEATURE_PLAN_FILE)
+    plan.meta.update(verified_payloads=len(payloads), extract_speedup=round(full_extract / pruned_extract, 3))
+    plan.save(out)
+    print(f"\nPlan written to {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Offline report for the benign prefilter.
+
+Scores every payload of a corpus with the full model and checks it against
+BenignPrefilter: how many payloads the prefilter would skip, and how many of
+those the model (or the corpus label, when present) considers an attack.
+
+Usage (from the ecommerce directory):
+    python -m tools.prefilter_report --corpus traffic.jsonl [--model-dir models] [--max-length 64]
+"""
+import argparse
+import json
+import time
+
+from app.waf_detector import WAFEngine
+from app.waf_prefilter import BenignPrefilter
+from tools.corpus import load_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', required=True, help='.jsonl with payload/label, or one payload per line')
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--max-length', type=int, default=64)
+    parser.add_argument('--no-obfuscated-check', action='store_true',
+                        help='only reject plain keyword substrings, not scattered ones')
+    parser.add_argument('--show', type=int, default=20, help='disagreements to print')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    waf = WAFEngine(model_dir=args.model_dir)
+    if not waf.detector:
+        raise SystemExit("Models could not be loaded")
+    prefilter = BenignPrefilter.for_extractor(
+        waf.feature_extractor,
+        max_length=args.max_length,
+        check_obfuscated=not args.no_obfuscated_check,
+    )
+
+    corpus = load_corpus(args.corpus)
+    payloads = [payload for payload, _ in corpus]
+
+    start = time.perf_counter()
+    verdicts = waf.analyze_many(payloads)
+    model_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    skipped = [prefilter.is_benign(payload) for payload in payloads]
+    prefilter_seconds = time.perf_counter() - start
+
+    model_disagreements = []
+    label_disagreements = []
+    for (payload, label), skip, verdict in zip(corpus, skipped, verdicts):
+        if not skip:
+            continue
+        if verdict.get('is_attack'):
+            model_disagreements.append((payload, verdict.get('confidence')))
+        if label == 1:
+            label_disagreements.append(payload)
+
+    n_skipped = sum(skipped)
+    remaining = [p for p, skip in zip(payloads, skipped) if not skip]
+    start = time.perf_counter()
+    waf.analyze_many(remaining)
+    remaining_seconds = time.perf_counter() - start
+
+    report = {
+        'corpus': args.corpus,
+        'payloads': len(payloads),
+        'skipped': n_skipped,
+        'skip_rate': n_skipped / len(payloads) if payloads else 0.0,
+        'model_disagreements': len(model_disagreements),
+        'label_disagreements': len(label_disagreements) if any(l is not None for _, l in corpus) else None,
+        'model_seconds': model_seconds,
+        'prefilter_plus_model_seconds': prefilter_seconds + remaining_seconds,
+    }
+
+    print(f"Payloads:              {report['payloads']}")
+    print(f"Skipped by prefilter:  {n_skipped} ({report['skip_rate']:.1%})")
+    print(f"Model says attack:     {len(model_disagreements)} of the skipped")
+    if report['label_disagreements'] is not None:
+        print(f"Labeled attack:        {len(label_disagreements)} of the skipped")
+    print(f"Full model time:       {model_seconds:.3f}s")
+    print(f"Prefilter + model:     {report['prefilter_plus_model_seconds']:.3f}s")
+    for payload, confidence in model_disagreements[:args.show]:
+        print(f"  DISAGREE {confidence:.4f}  {payload!r}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Publish WAF model artifacts as a new version of a model registry, or roll
+the registry to an already published version.
+
+Publishing copies SOURCE (pickles and/or the exports written by
+tools/export_flat_model.py) into REGISTRY/versions/VERSION/ with a manifest
+of sha256 checksums, then points REGISTRY/CURRENT at it. Serving engines
+pick the change up within WAF_RELOAD_INTERVAL_S, or at once on
+POST /waf/reload or SIGHUP, and only swap after the version passes its
+canary corpus.
+
+Usage (from the ecommerce directory):
+    python -m tools.publish_model --registry models --version 2026-10-19 --source build/ [--canary canary.jsonl] [--no-activate]
+    python -m tools.publish_model --registry models --version 2026-10-12      # roll back
+"""
+import argparse
+import os
+
+from app.model_registry import VERSIONS_DIR, ModelRegistry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registry', required=True)
+    parser.add_argument('--version', required=True)
+    parser.add_argument('--source', help='directory with the model files to publish')
+    parser.add_argument('--canary', help='.jsonl canary corpus stored with the version')
+    parser.add_argument('--no-activate', action='store_true', help='publish without making it CURRENT')
+    args = parser.parse_args()
+
+    os.makedirs(os.path.join(args.registry, VERSIONS_DIR), exist_ok=True)
+    registry = ModelRegistry(args.registry)
+
+    if args.source:
+        manifest = registry.publish(args.source, args.version, canary=args.canary, activate=not args.no_activate)
+        print(f"Published {args.version}: {len(manifest['files'])} files")
+    elif not args.no_activate:
+        registry.verify(args.version)
+        registry.activate(args.version)
+    print(f"CURRENT: {registry.current_version()}")
+    print(f"Versions: {', '.join(registry.versions())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+Throughput and latency benchmark for WAFEngine.
+
+Scores a labeled corpus through the loaded models in four modes:
+- single: one payload per call, as the middleware used to do
+- batch: `analyze_many` over chunks of --batch-size payloads
+- concurrent: --clients coroutines sending payloads one at a time through
+  WAFBatcher and WAFExecutor, as the app does under load
+- pathological: long adversarial payloads (see tools.bench_keywords), one
+  per call
+
+and reports payloads/sec, p50/p95/p99/max latency of each call and of each
+stage inside it (extract, scale, anomaly, ensemble), accuracy against the
+corpus labels and the peak RSS of the process. Cache and prefilter are off,
+so every payload reaches the models. Without --corpus the six payloads of
+verify_waf.py are used.
+
+--json writes the results; --compare checks them against an earlier run
+and exits with status 1 when throughput dropped or a p95/p99 latency grew
+by more than --tolerance (a fraction, 0.2 = 20%).
+
+Usage (from the ecommerce directory):
+    python -m tools.waf_benchmark --corpus traffic.jsonl [--model-dir models] [--json run.json]
+    python -m tools.waf_benchmark --corpus traffic.jsonl --compare baseline.json [--tolerance 0.2]
+"""
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+from app.waf_batcher import WAFBatcher
+from app.waf_detector import WAFEngine
+from app.waf_executor import WAFExecutor
+from tools.bench_keywords import adversarial_payloads
+from tools.corpus import load_corpus
+
+
+# The hand-labeled payloads of verify_waf.py
+SAMPLE_CORPUS = [
+    ("Hello World", 0),
+    ("SELECT * FROM users", 1),
+    ("<script>alert(1)</script>", 1),
+    ("admin' OR '1'='1", 1),
+    ("/etc/passwd", 1),
+    ("Just a normal search query", 0),
+]
+
+PERCENTILES = (50, 95, 99)
+# Metrics checked by compare(): (path, higher_is_better)
+COMPARED_METRICS = (
+    (('payloads_per_sec',), True),
+    (('latency_ms', 'p95'), False),
+    (('latency_ms', 'p99'), False),
+)
+
+
+def latency_summary(seconds) -> dict:
+    """p50/p95/p99/max/mean of a list of durations, in milliseconds."""
+    if not len(seconds):
+        return {}
+    ms = np.asarray(seconds, dtype=np.float64) * 1000.0
+    summary = {f'p{p}': round(float(np.percentile(ms, p)), 4) for p in PERCENTILES}
+    summary['max'] = round(float(ms.max()), 4)
+    summary['mean'] = round(float(ms.mean()), 4)
+    return summary
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Recorder:
+    """Collects per-call and per-stage durations and the verdicts of one mode."""
+
+    def __init__(self):
+        self.calls = []
+        self.stages = {}
+        self.verdicts = []
+        self.payloads = 0
+        self.errors = 0
+
+    def record(self, seconds, results, timings=None):
+        self.calls.append(seconds)
+        self.payloads += len(results)
+        self.errors += sum('error' in result for result in results)
+        self.verdicts.extend(results)
+        for stage, elapsed in (timings or {}).items():
+            self.stages.setdefault(stage, []).append(elapsed)
+
+    def report(self, wall_seconds, labels=None) -> dict:
+        report = {
+            'payloads': self.payloads,
+            'calls': len(self.calls),
+            'errors': self.errors,
+            'wall_seconds': round(wall_seconds, 4),
+            'payloads_per_sec': round(self.payloads / wall_seconds, 1) if wall_seconds > 0 else None,
+            'latency_ms': latency_summary(self.calls),
+            'stages_ms': {stage: latency_summary(seconds) for stage, seconds in self.stages.items()},
+            'peak_rss_mib': peak_rss_mib(),
+        }
+        if labels is not None:
+            labeled = [(v['is_attack'], label) for v, label in zip(self.verdicts, labels) if label is not None]
+            if labeled:
+                report['accuracy'] = round(sum(int(a) == label for a, label in labeled) / len(labeled), 4)
+        return report
+
+
+def run_calls(engine, batches, labels=None) -> dict:
+    """Time `analyze_many` on each batch in turn (single, batch and pathological modes)."""
+    recorder = Recorder()
+    wall = time.perf_counter()
+    for batch in batches:
+        timings = {}
+        start = time.perf_counter()
+        results = engine.analyze_many(batch, timings=timings)
+        recorder.record(time.perf_counter() - start, results, timings)
+    return recorder.report(time.perf_counter() - wall, labels)
+
+
+async def run_concurrent(engine, payloads, clients, executor_mode, workers, window_ms, max_batch,
+                         labels=None) -> dict:
+    """`clients` coroutines each sending their share of `payloads` one request at a time."""
+    executor = WAFExecutor(engine, mode=executor_mode, workers=workers, timeout_ms=60000.0)
+    executor.start()
+    batcher = WAFBatcher(executor.analyze_many, window_ms=window_ms, max_batch=max_batch,
+                         max_wait_ms=60000.0)
+    recorder = Recorder()
+    verdicts = [None] * len(payloads)
+
+    async def client(offset):
+        for i in range(offset, len(payloads), clients):
+            start = time.perf_counter()
+            verdicts[i] = await batcher.analyze(payloads[i])
+            recorder.record(time.perf_counter() - start, [])
+
+    try:
+        wall = time.perf_counter()
+        await asyncio.gather(*(client(c) for c in range(clients)))
+        wall = time.perf_counter() - wall
+    finally:
+        await batcher.drain()
+        executor.shutdown()
+
+    recorder.payloads = len(payloads)
+    recorder.errors = sum('error' in verdict for verdict in verdicts)
+    recorder.verdicts = verdicts
+    report = recorder.report(wall, labels)
+    report.update(clients=clients, executor=executor_mode, batches=batcher.batches,
+                  mean_batch=round(batcher.payloads / batcher.batches, 2) if batcher.batches else 0.0)
+    return report
+
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.2) -> list:
+    """
+    Per mode and metric, how the current run differs from the baseline.
+
+    Returns (mode, metric, baseline, current, change, regressed) tuples;
+    `change` is relative to the baseline, and `regressed` is True when the
+    metric moved the wrong way by more than `tolerance`. Stage latencies are
+    listed too but never count as a regression on their own, since stages
+    shift when the model format changes.
+    """
+    rows = []
+    for mode, base in baseline.get('modes', {}).items():
+        cur = current.get('modes', {}).get(mode)
+        if cur is None:
+            continue
+        metrics = [(path, higher_is_better, True) for path, higher_is_better in COMPARED_METRICS]
+        metrics += [(('stages_ms', stage, 'p95'), False, False) for stage in base.get('stages_ms', {})]
+        for path, higher_is_better, gating in metrics:
+            before, after = base, cur
+            for key in path:
+                before = before.get(key) if isinstance(before, dict) else None
+                after = after.get(key) if isinstance(after, dict) else None
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            rows.append((mode, '.'.join(path), before, after, change, gating and worse > tolerance))
+    return rows
+
+
+def print_report(results):
+    print(f"{'mode':<18} | {'payloads/s':>10} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | "
+          f"{'max ms':>8} | {'rss MiB':>7} | {'accuracy':>8}")
+    print("-" * 100)
+    for mode, report in results['modes'].items():
+        latency = report['latency_ms']
+        accuracy = report.get('accuracy')
+        print(f"{mode:<18} | {report['payloads_per_sec'] or 0:>10.1f} | {latency.get('p50', 0):>8.3f} | "
+              f"{latency.get('p95', 0):>8.3f} | {latency.get('p99', 0):>8.3f} | {latency.get('max', 0):>8.3f} | "
+              f"{report['peak_rss_mib']:>7.1f} | {'-' if accuracy is None else f'{accuracy:.4f}':>8}")
+        for stage, summary in report['stages_ms'].items():
+            print(f"  {stage:<16} | {'':>10} | {summary['p50']:>8.3f} | {summary['p95']:>8.3f} | "
+                  f"{summary['p99']:>8.3f} | {summary['max']:>8.3f} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='.jsonl with payload/label, or one payload per line')
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--model-format', default='auto', choices=WAFEngine.MODEL_FORMATS)
+    parser.add_argument('--repeat', type=int, default=1, help='score the corpus this many times per mode')
+    parser.add_argument('--modes', nargs='*', default=['single', 'batch', 'concurrent', 'pathological'])
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--clients', type=int, default=32, help='concurrent mode: simultaneous requests')
+    parser.add_argument('--executor', default='thread', choices=WAFExecutor.MODES)
+    parser.add_argument('--workers', type=int, default=None, help='concurrent mode: executor workers')
+    parser.add_argument('--window-ms', type=float, default=2.0)
+    parser.add_argument('--pathological-sizes', type=int, nargs='*', default=[4096, 65536])
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    waf = WAFEngine(model_dir=args.model_dir, model_format=args.model_format)
+    if not waf.detector:
+        raise SystemExit("Models could not be loaded")
+
+    corpus = load_corpus(args.corpus) if args.corpus else SAMPLE_CORPUS
+    corpus = corpus * args.repeat
+    payloads = [payload for payload, _ in corpus]
+    labels = [label for _, label in corpus]
+
+    # Warm up lazy imports and first-call allocations outside the timed runs
+    waf.analyze_many(payloads[:args.batch_size])
+
+    results = {
+        'corpus': args.corpus or 'verify_waf samples',
+        'payloads': len(payloads),
+        'model': waf.model_info(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'modes': {},
+    }
+    modes = results['modes']
+    if 'single' in args.modes:
+        modes['single'] = run_calls(waf, ([payload] for payload in payloads), labels)
+    if 'batch' in args.modes:
+        modes['batch'] = run_calls(
+            waf, (payloads[i:i + args.batch_size] for i in range(0, len(payloads), args.batch_size)), labels)
+        modes['batch']['batch_size'] = args.batch_size
+    if 'concurrent' in args.modes:
+        modes['concurrent'] = asyncio.run(run_concurrent(
+            waf, payloads, args.clients, args.executor, args.workers, args.window_ms, args.batch_size, labels))
+    if 'pathological' in args.modes:
+        for size in args.pathological_sizes:
+            long_payloads = list(adversarial_payloads(size).values()) * args.repeat
+            modes[f'pathological_{size}'] = run_calls(waf, ([payload] for payload in long_payloads))
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(baseline, results, args.tolerance)
+        print(f"\nAgainst {args.compare} (tolerance {args.tolerance:.0%})")
+        print(f"{'mode':<20} | {'metric':<22} | {'baseline':>10} | {'current':>10} | {'change':>8}")
+        print("-" * 84)
+        for mode, metric, before, after, change, regressed in rows:
+            flag = '  REGRESSION' if regressed else ''
+            print(f"{mode:<20} | {metric:<22} | {before:>10.3f} | {after:>10.3f} | {change:>+8.1%}{flag}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Measure per-worker memory for each WAF model storage format.
+
+Starts N worker processes per format (like N uvicorn/gunicorn workers on one
+host), has each load a WAFEngine and score a few payloads, and once all of
+them are up reads /proc/self/smaps_rollup in every worker:
+
+  rss      resident pages, shared ones counted in full by every worker
+  pss      proportional set size: shared pages split between their users,
+           so the sum over workers is what the node actually pays
+  private  pages only this worker has (unpickled trees, heap)
+
+"before" is the same reading taken after imports but before loading models.
+Compare 'pickle' against 'mapped' (written by tools/export_flat_model.py
+--mapped); only the mapped arrays are shared between workers. Linux only.
+
+Usage (from the ecommerce directory):
+    python -m tools.worker_memory --model-dir models [--workers 8] [--formats pickle,flat,mapped] [--json out.json]
+"""
+import argparse
+import json
+import multiprocessing
+import time
+
+PAYLOADS = ["q=shoes", "<script>alert(1)</script>", "1' OR '1'='1' -- ", "../../etc/passwd"]
+
+
+def read_memory() -> dict:
+    """RSS, PSS and private memory of the calling process in KiB."""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def _worker(model_dir, model_format, barrier, results):
+    from app.waf_detector import WAFEngine
+
+    before = read_memory()
+    start = time.perf_counter()
+    waf = WAFEngine(model_dir=model_dir, model_format=model_format)
+    load_seconds = time.perf_counter() - start
+    waf.analyze_many(PAYLOADS)
+
+    # Measure only once every worker has loaded, so shared pages are split
+    barrier.wait()
+    after = read_memory()
+    results.put({
+        'loaded': waf.detector is not None,
+        'load_seconds': load_seconds,
+        'before': before,
+        'after': after,
+    })
+    barrier.wait()
+
+
+def measure(model_dir, model_format, workers):
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(model_dir, model_format, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return samples
+
+
+def summarize(samples) -> dict:
+    n = len(samples)
+
+    def mean(stage, key):
+        return sum(s[stage][key] for s in samples) / n
+
+    return {
+        'workers': n,
+        'loaded': all(s['loaded'] for s in samples),
+        'load_seconds': sum(s['load_seconds'] for s in samples) / n,
+        'rss_before_kib': mean('before', 'rss'),
+        'rss_after_kib': mean('after', 'rss'),
+        'pss_before_kib': mean('before', 'pss'),
+        'pss_after_kib': mean('after', 'pss'),
+        'private_after_kib': mean('after', 'private'),
+        'total_pss_mib': sum(s['after']['pss'] for s in samples) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--formats', default='pickle,mapped')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    report = {}
+    for model_format in args.formats.split(','):
+        report[model_format] = summary = summarize(measure(args.model_dir, model_format, args.workers))
+        print(f"{model_format} ({summary['workers']} workers{'' if summary['loaded'] else ', MODELS NOT LOADED'}):")
+        print(f"  load time:        {summary['load_seconds'] * 1000:.1f} ms")
+        print(f"  RSS before/after: {summary['rss_before_kib'] / 1024:.1f} / {summary['rss_after_kib'] / 1024:.1f} MiB")
+        print(f"  PSS before/after: {summary['pss_before_kib'] / 1024:.1f} / {summary['pss_after_kib'] / 1024:.1f} MiB")
+        print(f"  private after:    {summary['private_after_kib'] / 1024:.1f} MiB")
+        print(f"  total PSS:        {summary['total_pss_mib']:.1f} MiB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,17 @@
-import React, { createContext, useContext, useEffect, useRef, useState } from 'react';
+import React, { createContext, useCallback, useContext, useEffect, useRef, useState } from 'react';
+
+// Events arriving within this window are delivered (and rendered) together
+const BATCH_INTERVAL_MS = 100;
 
 interface WebSocketContextType {
     isConnected: boolean;
     lastMessage: any;
+    // Every event of the last frame, oldest first (a batch holds several)
+    lastMessages: any[];
+    // Receive only these event types while mounted; returns the unsubscribe
+    subscribe: (types: string[]) => () => void;
+    // Bumped when events were missed beyond what the backend could replay: reload over REST
+    resyncs: number;
 }
 
 const WebSocketContext = createContext<WebSocketContextType | null>(null);
@@ -10,16 +19,59 @@ const WebSocketContext = createContext<WebSocketContextType | null>(null);
 export const WebSocketProvider: React.FC<{ children: React.ReactNode }> = ({ children }) => {
     const [isConnected, setIsConnected] = useState(false);
     const [lastMessage, setLastMessage] = useState<any>(null);
+    const [lastMessages, setLastMessages] = useState<any[]>([]);
+    const [resyncs, setResyncs] = useState(0);
     const ws = useRef<WebSocket | null>(null);
+    // Event type -> number of mounted components that want it
+    const subscriptions = useRef<Map<string, number>>(new Map());
+    // Where to resume from after a reconnect: the backend's event stream and the last event seen
+    const stream = useRef('');
+    const lastSeq = useRef(0);
+
+    const send = (message: object) => {
+        if (ws.current?.readyState === WebSocket.OPEN) {
+            ws.current.send(JSON.stringify(message));
+        }
+    };
+
+    const subscribe = useCallback((types: string[]) => {
+        const added = types.filter(type => {
+            const count = subscriptions.current.get(type) || 0;
+            subscriptions.current.set(type, count + 1);
+            return count === 0;
+        });
+        if (added.length) send({ action: 'subscribe', types: added });
+
+        return () => {
+            const removed = types.filter(type => {
+                const count = (subscriptions.current.get(type) || 1) - 1;
+                if (count === 0) subscriptions.current.delete(type);
+                else subscriptions.current.set(type, count);
+                return count === 0;
+            });
+            if (removed.length) send({ action: 'unsubscribe', types: removed });
+        };
+    }, []);
 
     useEffect(() => {
         const connect = () => {
-            const wsUrl = import.meta.env.VITE_WS_URL || 'ws://localhost:8000/api/v1/ws/events';
-            ws.current = new WebSocket(wsUrl);
+            const wsUrl = new URL(import.meta.env.VITE_WS_URL || 'ws://localhost:8000/api/v1/ws/events');
+            wsUrl.searchParams.set('stream', stream.current);
+            wsUrl.searchParams.set('last_seq', String(lastSeq.current));
+            // Subscribed before the replay, so it only holds events some component wants
+            if (subscriptions.current.size) {
+                wsUrl.searchParams.set('types', Array.from(subscriptions.current.keys()).join(','));
+            }
+            ws.current = new WebSocket(wsUrl.toString());
 
             ws.current.onopen = () => {
                 console.log('WebSocket Connected');
                 setIsConnected(true);
+                send({ action: 'batch', interval_ms: BATCH_INTERVAL_MS });
+                // The server starts every connection on all events
+                if (subscriptions.current.size) {
+                    send({ action: 'subscribe', types: Array.from(subscriptions.current.keys()) });
+                }
             };
 
             ws.current.onclose = () => {
@@ -32,7 +84,24 @@ export const WebSocketProvider: React.FC<{ children: React.ReactNode }> = ({ chi
             ws.current.onmessage = (event) => {
                 try {
                     const data = JSON.parse(event.data);
-                    setLastMessage(data);
+                    if (data.type === 'heartbeat') {
+                        // The backend closes connections that stay silent
+                        ws.current?.send(JSON.stringify({ type: 'pong' }));
+                        return;
+                    }
+                    if (data.type === 'stream' || data.type === 'resync_required') {
+                        stream.current = data.stream;
+                        // Replayed events follow and move lastSeq themselves
+                        if (data.type === 'resync_required' || !data.replayed) lastSeq.current = data.latest_seq;
+                        if (data.type === 'resync_required') setResyncs(n => n + 1);
+                        return;
+                    }
+                    const events = data.type === 'batch' ? data.events : [data];
+                    for (const e of events) {
+                        if (e.seq > lastSeq.current) lastSeq.current = e.seq;
+                    }
+                    setLastMessages(events);
+                    setLastMessage(events[events.length - 1]);
                 } catch (e) {
                     console.error('Failed to parse WS message', e);
                 }
@@ -47,7 +116,7 @@ export const WebSocketProvider: React.FC<{ children: React.ReactNode }> = ({ chi
     }, []);
 
     return (
-        <WebSocketContext.Provider value={{ isConnected, lastMessage }}>
+        <WebSocketContext.Provider value={{ isConnected, lastMessage, lastMessages, subscribe, resyncs }}>
             {children}
         </WebSocketContext.Provider>
     );
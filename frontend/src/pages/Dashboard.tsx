@@ -7,7 +7,7 @@ import api from '../services/api';
 import AttackMap from '../components/AttackMap';
 
 const Dashboard = () => {
-    const { lastMessage } = useWebSocket();
+    const { lastMessages, subscribe, resyncs } = useWebSocket();
     const [stats, setStats] = useState({
         activeHoneypots: 0,
         totalAttacks: 0,
@@ -32,7 +32,9 @@ const Dashboard = () => {
             }
         };
         fetchStats();
+    }, [resyncs]);
 
+    useEffect(() => {
         // Generate mock chart data
         const data = Array.from({ length: 20 }, (_, i) => ({
             time: `${i}:00`,
@@ -41,14 +43,15 @@ const Dashboard = () => {
         setChartData(data);
     }, []);
 
+    useEffect(() => subscribe(['waf_bypass']), [subscribe]);
+
     useEffect(() => {
-        if (lastMessage) {
-            if (lastMessage.type === 'waf_bypass') {
-                setAlerts(prev => [lastMessage.payload, ...prev].slice(0, 50));
-                setStats(prev => ({ ...prev, totalAttacks: prev.totalAttacks + 1 }));
-            }
+        const alerts = lastMessages.filter(message => message.type === 'waf_bypass').map(message => message.payload);
+        if (alerts.length) {
+            setAlerts(prev => [...alerts.reverse(), ...prev].slice(0, 50));
+            setStats(prev => ({ ...prev, totalAttacks: prev.totalAttacks + alerts.length }));
         }
-    }, [lastMessage]);
+    }, [lastMessages]);
 
     return (
         <div className="space-y-6">
@@ -9,7 +9,7 @@ const Observability = () => {
     const [sessions, setSessions] = useState<any[]>([]);
     const [liveSessions, setLiveSessions] = useState<any[]>([]);
     const [activeTab, setActiveTab] = useState<'logs' | 'sessions' | 'live'>('logs');
-    const { lastMessage, isConnected } = useWebSocket();
+    const { lastMessages, isConnected, subscribe, resyncs } = useWebSocket();
 
     useEffect(() => {
         const fetchData = async () => {
@@ -24,40 +24,42 @@ const Observability = () => {
             }
         };
         fetchData();
-    }, []);
+    }, [resyncs]);
+
+    useEffect(() => subscribe(['system_log', 'session_start', 'session_update', 'session_end']), [subscribe]);
 
     useEffect(() => {
-        if (lastMessage) {
-            if (lastMessage.type === 'system_log') {
-                setLogs(prev => [lastMessage.payload, ...prev].slice(0, 500));
-            } else if (lastMessage.type === 'session_start') {
-                setLiveSessions(prev => [...prev, { ...lastMessage.payload, commands: [] }]);
-            } else if (lastMessage.type === 'session_update') {
+        for (const message of lastMessages) {
+            if (message.type === 'system_log') {
+                setLogs(prev => [message.payload, ...prev].slice(0, 500));
+            } else if (message.type === 'session_start') {
+                setLiveSessions(prev => [...prev, { ...message.payload, commands: [] }]);
+            } else if (message.type === 'session_update') {
                 setLiveSessions(prev => {
-                    const exists = prev.find(s => s.session_id === lastMessage.payload.session_id);
+                    const exists = prev.find(s => s.session_id === message.payload.session_id);
                     if (exists) {
                         return prev.map(s =>
-                            s.session_id === lastMessage.payload.session_id
-                                ? { ...s, commands: [...(s.commands || []), lastMessage.payload.command] }
+                            s.session_id === message.payload.session_id
+                                ? { ...s, commands: [...(s.commands || []), message.payload.command] }
                                 : s
                         );
                     } else {
                         // Create new session entry if it doesn't exist (e.g. dashboard opened mid-session)
                         return [...prev, {
-                            session_id: lastMessage.payload.session_id,
-                            attacker_ip: lastMessage.payload.attacker_ip || 'Unknown',
+                            session_id: message.payload.session_id,
+                            attacker_ip: message.payload.attacker_ip || 'Unknown',
                             start_time: new Date().toISOString(), // Approximate start time
-                            commands: [lastMessage.payload.command]
+                            commands: [message.payload.command]
                         }];
                     }
                 });
-            } else if (lastMessage.type === 'session_end') {
-                setLiveSessions(prev => prev.filter(s => s.session_id !== lastMessage.payload.session_id));
+            } else if (message.type === 'session_end') {
+                setLiveSessions(prev => prev.filter(s => s.session_id !== message.payload.session_id));
                 // Refresh sessions list to show the completed one
                 api.get('/observability/sessions').then(res => setSessions(res.data));
             }
         }
-    }, [lastMessage]);
+    }, [lastMessages]);
 
     return (
         <div className="space-y-6">